@@ -0,0 +1,239 @@
+"""
+AI service configuration settings
+"""
+import os
+from typing import Dict, Any, List
+
+# Hub names of the models the API loads; the classifier tries them in order
+FOOD_MODEL_NAMES: List[str] = [
+    "Kaludi/food-category-classification-v2.0",  # Specialized food classifier
+    "nateraw/food",  # Another food classifier
+    "microsoft/resnet-50",  # General vision model as fallback
+]
+CHAT_MODEL_NAME = "microsoft/DialoGPT-small"  # Lighter, faster model
+
+# Process pool of classifier replicas (one inference per replica at a time)
+_replica_threads = max(1, int(os.getenv("AI_REPLICA_THREADS", "2")))
+REPLICA_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("AI_REPLICAS_ENABLED", "false").lower() == "true",
+    "threads_per_replica": _replica_threads,  # torch intra-op threads in each replica
+    # 0 = one replica per threads_per_replica cores
+    "replicas": int(os.getenv("AI_REPLICAS", "0")) or max(1, (os.cpu_count() or 1) // _replica_threads),
+    "startup_timeout": float(os.getenv("AI_REPLICA_STARTUP_TIMEOUT", "180")),
+    # Dynamic INT8 weights cannot be put in shared memory, so with the quantized
+    # backend every replica holds a private copy; cap how many copies are made
+    "max_quantized_replicas": max(1, int(os.getenv("AI_MAX_QUANTIZED_REPLICAS", "2")))
+}
+
+# Food classification inference executor
+INFERENCE_CONFIG: Dict[str, Any] = {
+    # With replicas, each worker thread drives one replica
+    "max_workers": int(os.getenv("AI_INFERENCE_WORKERS", str(REPLICA_CONFIG["replicas"]) if REPLICA_CONFIG["enabled"] else "2")),
+    "max_queue_size": int(os.getenv("AI_INFERENCE_QUEUE_SIZE", "32")),
+    "timeout": float(os.getenv("AI_INFERENCE_TIMEOUT", "30"))
+}
+
+# Chat (DialoGPT) generation executor, separate from classification
+CHAT_INFERENCE_CONFIG: Dict[str, Any] = {
+    "max_workers": int(os.getenv("AI_CHAT_WORKERS", "1")),
+    "max_queue_size": int(os.getenv("AI_CHAT_QUEUE_SIZE", "8")),
+    # Past this the user gets the smart fallback answer instead
+    "timeout": float(os.getenv("AI_CHAT_TIMEOUT", "15"))
+}
+
+# DialoGPT sampling settings, shared by both generation paths
+CHAT_GENERATION_CONFIG: Dict[str, Any] = {
+    "max_new_tokens": int(os.getenv("AI_CHAT_MAX_NEW_TOKENS", "50")),  # Shorter responses for better quality
+    "do_sample": os.getenv("AI_CHAT_DO_SAMPLE", "true").lower() == "true",  # false = greedy, reproducible replies
+    "temperature": 0.8,
+    "top_p": 0.9,
+    "repetition_penalty": 1.1,
+    "no_repeat_ngram_size": 3
+}
+
+# Continuous batching: concurrent chats share decode steps
+CHAT_BATCHING_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("AI_CHAT_CONTINUOUS_BATCHING", "true").lower() == "true",
+    "max_batch_size": int(os.getenv("AI_CHAT_MAX_BATCH_SIZE", "8"))
+}
+
+# Per-conversation reuse of the chat model's past key/values between turns
+CHAT_KV_CACHE_CONFIG: Dict[str, Any] = {
+    # Needs continuous batching; each turn then only encodes the new message
+    "enabled": os.getenv("AI_CHAT_KV_CACHE", "true").lower() == "true",
+    "max_mb": float(os.getenv("AI_CHAT_KV_CACHE_MB", "256")),
+    "max_conversations": int(os.getenv("AI_CHAT_KV_CACHE_CONVERSATIONS", "256")),
+    # Longer histories are rebuilt from the last few messages instead
+    "max_context_tokens": int(os.getenv("AI_CHAT_MAX_CONTEXT_TOKENS", "512"))
+}
+
+# In-memory chat conversations (/ai/chat)
+CONVERSATION_CONFIG: Dict[str, Any] = {
+    "max_messages": int(os.getenv("AI_CONVERSATION_MAX_MESSAGES", "50")),  # Oldest messages dropped first
+    "ttl": float(os.getenv("AI_CONVERSATION_TTL", "3600")),  # Seconds since the last message
+    "max_conversations": int(os.getenv("AI_CONVERSATION_MAX", "10000")),  # Least recently active evicted
+    # Durable copy in the chat_messages table, shared by every API worker
+    "persist": os.getenv("AI_CONVERSATION_PERSIST", "true").lower() == "true",
+    "flush_interval": float(os.getenv("AI_CONVERSATION_FLUSH_INTERVAL", "0.5")),  # Write-behind delay
+    "max_pending": int(os.getenv("AI_CONVERSATION_MAX_PENDING", "5000")),  # Unflushed messages kept if the database is down
+    "retention": float(os.getenv("AI_CONVERSATION_RETENTION", str(30 * 86400))),
+    "cleanup_interval": float(os.getenv("AI_CONVERSATION_CLEANUP_INTERVAL", "3600"))
+}
+
+# Micro-batching of concurrent classification requests
+BATCHING_CONFIG: Dict[str, Any] = {
+    "max_batch_size": int(os.getenv("AI_BATCH_MAX_SIZE", "8")),
+    "max_wait_ms": float(os.getenv("AI_BATCH_MAX_WAIT_MS", "10")),
+    # Limits for /ai/classify-food/batch uploads
+    "max_files_per_request": int(os.getenv("AI_BATCH_MAX_FILES", "50")),
+    "max_archive_bytes": int(os.getenv("AI_BATCH_MAX_ARCHIVE_BYTES", str(200 * 1024 * 1024)))
+}
+
+# Content-addressed cache of classification results
+CACHE_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("AI_CACHE_ENABLED", "true").lower() == "true",
+    "max_bytes": int(os.getenv("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    "ttl": float(os.getenv("AI_CACHE_TTL", "86400")),
+    "disk_dir": os.getenv("AI_CACHE_DIR") or None
+}
+
+# Model warm-up
+MODEL_LOADING_CONFIG: Dict[str, Any] = {
+    "preload_classifier": os.getenv("AI_PRELOAD_CLASSIFIER", "true").lower() == "true",
+    "retry_after": int(os.getenv("AI_LOADING_RETRY_AFTER", "5"))
+}
+
+# Image decoding before inference
+DECODE_CONFIG: Dict[str, Any] = {
+    "fast_decode": os.getenv("AI_FAST_DECODE", "true").lower() == "true",
+    # Fallback when the loaded model does not advertise its input size
+    "target_size": int(os.getenv("AI_MODEL_INPUT_SIZE", "224")),
+    # saved_ms estimate: full-decode cost until a format has been calibrated
+    "full_decode_ms_per_mp": float(os.getenv("AI_DECODE_FULL_MS_PER_MP", "10")),
+    # Every Nth fast decode is also timed at full resolution by a background thread (0 = never)
+    "calibrate_every": int(os.getenv("AI_DECODE_CALIBRATE_EVERY", "200"))
+}
+
+# Inference backend for the food classifier: pipeline | quantized | onnx
+BACKEND_CONFIG: Dict[str, Any] = {
+    "backend": os.getenv("AI_INFERENCE_BACKEND", "pipeline").lower(),
+    "num_threads": int(os.getenv("AI_TORCH_THREADS", "0")),  # 0 = library default
+    "onnx_dir": os.getenv("AI_ONNX_DIR", "model_cache/onnx"),
+    "parity_sample_dir": os.getenv("AI_PARITY_SAMPLE_DIR") or None,
+    "parity_max_samples": int(os.getenv("AI_PARITY_MAX_SAMPLES", "16")),
+    "parity_min_agreement": float(os.getenv("AI_PARITY_MIN_AGREEMENT", "0.9"))
+}
+
+# Upload ingestion limits for classification endpoints
+UPLOAD_CONFIG: Dict[str, Any] = {
+    "max_bytes": int(os.getenv("AI_UPLOAD_MAX_BYTES", str(15 * 1024 * 1024))),
+    "max_pixels": int(os.getenv("AI_UPLOAD_MAX_PIXELS", str(50_000_000))),
+    "max_side": int(os.getenv("AI_UPLOAD_MAX_SIDE", "12000")),
+    "chunk_size": int(os.getenv("AI_UPLOAD_CHUNK_SIZE", str(64 * 1024))),
+    # Give up on sniffing the header if it is not readable within this many bytes
+    "max_header_bytes": int(os.getenv("AI_UPLOAD_MAX_HEADER_BYTES", str(512 * 1024))),
+    # Allowance for multipart boundaries, part headers and form fields on top of the file bytes
+    "multipart_overhead_bytes": int(os.getenv("AI_UPLOAD_MULTIPART_OVERHEAD_BYTES", str(1024 * 1024)))
+}
+
+# Two-stage classification: a fast model answers unless its top confidence is below min_confidence_level
+CASCADE_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("AI_CASCADE_ENABLED", "false").lower() == "true",
+    # Must be a food-trained checkpoint; the cascade stays off until one is set
+    "fast_model": os.getenv("AI_CASCADE_FAST_MODEL") or None,
+    # A confidence level name (sangat_yakin | yakin | cukup_yakin | kurang_yakin) or is_food
+    "min_confidence_level": os.getenv("AI_CASCADE_MIN_LEVEL", "yakin")
+}
+
+# Asynchronous classification jobs (/ai/classify-food/jobs)
+JOB_QUEUE_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("AI_JOBS_ENABLED", "true").lower() == "true",
+    "workers": int(os.getenv("AI_JOB_WORKERS", "2")),  # concurrent jobs per API process
+    "poll_interval": float(os.getenv("AI_JOB_POLL_INTERVAL", "0.5")),
+    "max_wait": float(os.getenv("AI_JOB_MAX_WAIT", "30")),  # longest allowed long-poll
+    "retention": float(os.getenv("AI_JOB_RETENTION", "86400")),
+    "stale_after": float(os.getenv("AI_JOB_STALE_AFTER", "300")),
+    "max_attempts": int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3")),
+    "cleanup_interval": float(os.getenv("AI_JOB_CLEANUP_INTERVAL", "600"))
+}
+
+# Nutrition facts store
+NUTRITION_CONFIG: Dict[str, Any] = {
+    "dataset_path": os.getenv(
+        "AI_NUTRITION_DATASET",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "nutrition.json")
+    ),
+    "fuzzy_cutoff": float(os.getenv("AI_NUTRITION_FUZZY_CUTOFF", "0.8")),
+    # Most names a fuzzy lookup compares against, so a miss costs the same on any table size
+    "fuzzy_max_candidates": int(os.getenv("AI_NUTRITION_FUZZY_MAX_CANDIDATES", "2000")),
+    "max_batch_size": int(os.getenv("AI_NUTRITION_MAX_BATCH", "100"))
+}
+
+# Local model registry (python -m models.model_registry pull)
+REGISTRY_CONFIG: Dict[str, Any] = {
+    "root": os.getenv("AI_MODEL_REGISTRY_DIR", "model_registry"),
+    # Loaders read only from the registry; set to false to allow hub downloads (development)
+    "required": os.getenv("AI_MODEL_REGISTRY_REQUIRED", "true").lower() == "true",
+    # Full sha256 check of every file at load; sizes are always checked
+    "verify_on_load": os.getenv("AI_MODEL_REGISTRY_VERIFY", "false").lower() == "true"
+}
+
+# Zero-downtime model swaps (POST /ai/admin/model-swap)
+HOT_SWAP_CONFIG: Dict[str, Any] = {
+    # Admin endpoints are disabled unless a token is set; send it as X-Admin-Token
+    "admin_token": os.getenv("AI_ADMIN_TOKEN") or None,
+    "warmup_rounds": int(os.getenv("AI_SWAP_WARMUP_ROUNDS", "3")),
+    "drain_timeout": float(os.getenv("AI_SWAP_DRAIN_TIMEOUT", "120"))
+}
+
+# Idle eviction of loaded models; evicted models reload on their next request
+RESIDENCY_CONFIG: Dict[str, Any] = {
+    "enabled": os.getenv("AI_MODEL_EVICTION_ENABLED", "false").lower() == "true",
+    # Seconds without requests before a model's weights are freed (0 = never)
+    "classifier_idle_timeout": float(os.getenv("AI_CLASSIFIER_IDLE_TIMEOUT", "1800")),
+    "chat_idle_timeout": float(os.getenv("AI_CHAT_IDLE_TIMEOUT", "600")),
+    # Idle models are evicted least recently used first while over budget (0 = no budget)
+    "memory_budget_mb": float(os.getenv("AI_MODEL_MEMORY_BUDGET_MB", "0")),
+    "check_interval": float(os.getenv("AI_MODEL_EVICTION_INTERVAL", "30"))
+}
+
+# Multi-item mode (POST /ai/classify-food/multi): overlapping tiles in one batch
+MULTI_ITEM_CONFIG: Dict[str, Any] = {
+    # grid x grid tiles; the forward pass grows with grid squared, so it is capped
+    "grid": int(os.getenv("AI_MULTI_ITEM_GRID", "3")),
+    "max_grid": int(os.getenv("AI_MULTI_ITEM_MAX_GRID", "4")),
+    "overlap": float(os.getenv("AI_MULTI_ITEM_OVERLAP", "0.25")),
+    # Also classify the whole image, which catches items larger than a tile
+    "include_full_image": os.getenv("AI_MULTI_ITEM_FULL_IMAGE", "true").lower() == "true",
+    "labels_per_tile": int(os.getenv("AI_MULTI_ITEM_LABELS_PER_TILE", "3")),
+    "min_confidence": float(os.getenv("AI_MULTI_ITEM_MIN_CONFIDENCE", "0.2")),
+    "max_items": int(os.getenv("AI_MULTI_ITEM_MAX_ITEMS", "10"))
+}
+
+# Scan-to-inventory (POST /ai/classify-food/inventory): classifier category -> product type and shelf life
+INVENTORY_SCAN_CONFIG: Dict[str, Any] = {
+    # Same product types the frontend offers
+    "type_by_category": {
+        "buah": "Fruits",
+        "sayuran": "Vegetables",
+        "protein": "Meat",
+        "karbohidrat": "Grains",
+        "dairy": "Dairy",
+        "makanan_siap": "Snacks",
+        "minuman": "Beverages"
+    },
+    "default_type": "Other",
+    # Days from today until the default expiry date, per product type
+    "expiry_days_by_type": {
+        "Fruits": 7,
+        "Vegetables": 5,
+        "Meat": 2,
+        "Grains": 30,
+        "Dairy": 7,
+        "Snacks": 3,
+        "Beverages": 30,
+        "Other": 7
+    },
+    # Images whose best guess is below this confidence are not added
+    "min_confidence": float(os.getenv("AI_INVENTORY_MIN_CONFIDENCE", "0.2"))
+}
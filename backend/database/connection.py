@@ -194,6 +194,67 @@ class DatabaseManager:
                     )
                 ''')
                 
+                # Create classification_jobs table (async /ai/classify-food/jobs queue)
+                await connection.execute('''
+                    CREATE TABLE IF NOT EXISTS classification_jobs (
+                        job_id UUID PRIMARY KEY,
+                        status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'processing', 'done', 'failed')),
+                        image BYTEA,
+                        file_name VARCHAR(255),
+                        result JSONB,
+                        error TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        started_at TIMESTAMP,
+                        finished_at TIMESTAMP
+                    )
+                ''')
+                
+                await connection.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_classification_jobs_pending
+                    ON classification_jobs (created_at) WHERE status IN ('queued', 'processing')
+                ''')
+                
+                await connection.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_classification_jobs_finished
+                    ON classification_jobs (finished_at) WHERE finished_at IS NOT NULL
+                ''')
+                
+                # Create nutrition_facts table (seeded from data/nutrition.json)
+                await connection.execute('''
+                    CREATE TABLE IF NOT EXISTS nutrition_facts (
+                        name VARCHAR(100) PRIMARY KEY,
+                        aliases TEXT[] NOT NULL DEFAULT '{}',
+                        kalori REAL NOT NULL,
+                        karbohidrat REAL NOT NULL,
+                        protein REAL NOT NULL,
+                        lemak REAL NOT NULL,
+                        per_serving VARCHAR(20) NOT NULL DEFAULT '100g',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Create chat_messages table (durable /ai/chat conversations, shared by all workers)
+                await connection.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_messages (
+                        message_id BIGSERIAL PRIMARY KEY,
+                        conversation_id TEXT NOT NULL,
+                        role VARCHAR(10) NOT NULL CHECK (role IN ('user', 'assistant')),
+                        content TEXT NOT NULL,
+                        created_at TIMESTAMPTZ NOT NULL
+                    )
+                ''')
+                
+                await connection.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation
+                    ON chat_messages (conversation_id, created_at)
+                ''')
+                
+                await connection.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_messages_created
+                    ON chat_messages (created_at)
+                ''')
+                
                 print("✅ Initial tables created successfully!")
         except Exception as e:
             print(f"❌ Failed to create initial tables: {e}")
@@ -4,8 +4,18 @@ load_dotenv()
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from database.connection import db_manager
+from models.inference_executor import inference_executor, chat_executor
+from models.food_classifier import food_classifier
+from models.micro_batcher import food_batcher
+from models.classification_jobs import classification_job_queue
+from models.nutrition_store import nutrition_store
+from models.model_residency import model_residency
+from models.chat_engine import chat_engine
+from models.conversation_store import conversation_store
+from models.image_ingest import UploadSizeLimitMiddleware
 from routers import user, account, product, delivery, google_oauth, donation, notification, reward, recipe, food_ai
 from config.database import DATABASE_CONFIG
+from config.ai import MODEL_LOADING_CONFIG
 
 app = FastAPI(
     title="Monggu API", 
@@ -13,6 +23,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Cap upload bodies before Starlette spools them (added first so CORS still wraps its 413s)
+app.add_middleware(UploadSizeLimitMiddleware, limits=food_ai.upload_body_limits("/ai"))
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +51,13 @@ app.include_router(food_ai.router, prefix="/ai", tags=["food-ai"])
 async def startup_event():
     print("🚀 Starting Monggu API...")
     
+    # Warm up the food classifier in the background; non-AI routes serve immediately
+    if MODEL_LOADING_CONFIG["preload_classifier"]:
+        food_classifier.start_background_load()
+    
+    # Frees idle models' weights (AI_MODEL_EVICTION_ENABLED)
+    model_residency.start()
+    
     db_created = await db_manager.create_database_if_not_exists()
     if not db_created:
         print("❌ Could not ensure database exists, continuing anyway...")
@@ -49,12 +69,29 @@ async def startup_event():
     
     await db_manager.create_initial_tables()
     
+    # Seed and index nutrition facts (the bundled dataset is served until this finishes)
+    await nutrition_store.sync_with_database()
+    
+    # Workers for /ai/classify-food/jobs need the tables above
+    classification_job_queue.start(food_ai.process_classification_job, food_ai.classifier_accepts_jobs)
+    
+    # Write-behind persistence of /ai/chat conversations
+    await conversation_store.start()
+    
     print("✅ Monggu API started successfully!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("🛑 Shutting down Monggu API...")
+    await classification_job_queue.stop()
+    await food_batcher.close()  # Answers batches already running before the executor goes away
+    await conversation_store.stop()  # Flushes buffered messages while the pool is open
+    model_residency.stop()
     await db_manager.close_connection_pool()
+    inference_executor.shutdown()
+    chat_executor.shutdown()
+    chat_engine.shutdown()
+    food_classifier.shutdown()
     print("✅ Monggu API shutdown complete!")
 
 @app.get("/")
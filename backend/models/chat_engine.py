@@ -0,0 +1,528 @@
+"""
+Continuous batching of chat generation requests
+"""
+import asyncio
+import contextlib
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from config.ai import CHAT_BATCHING_CONFIG, CHAT_GENERATION_CONFIG, CHAT_INFERENCE_CONFIG, CHAT_KV_CACHE_CONFIG
+from models.inference_executor import InferenceQueueFullError, InferenceTimeoutError
+from models.model_residency import model_residency
+
+class _KVEntry:
+    def __init__(self, model, token_ids: List[int], past, pending_ids: List[int], nbytes: int):
+        self.model_ref = weakref.ref(model)
+        self.token_ids = token_ids  # Tokens whose keys/values are in past
+        self.past = past  # Per-layer (key, value) for one sequence, no padding
+        self.pending_ids = pending_ids  # Decided but not yet fed (the reply's last token, EOS)
+        self.nbytes = nbytes
+
+class ConversationKVCache:
+    """
+    Past key/values of each conversation's last turn, so the next turn only
+    runs the new tokens through the model. Bounded by entry count and total
+    bytes, evicting least recently used conversations first. Entries are
+    taken out while a turn runs and put back with the longer history when it
+    finishes.
+    """
+
+    def __init__(self, max_mb: float, max_conversations: int, max_context_tokens: int):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_conversations = max(1, max_conversations)
+        self.max_context_tokens = max_context_tokens
+        self._entries: "OrderedDict[str, _KVEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def take(self, key: str, model) -> Optional[_KVEntry]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+            # Cached for a model that has since been unloaded or swapped
+            if entry is None or entry.model_ref() is not model:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return entry
+
+    def put(self, key: str, entry: _KVEntry):
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_conversations:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def discard(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": CHAT_KV_CACHE_CONFIG["enabled"],
+                "conversations": len(self._entries),
+                "size_mb": round(self._bytes / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / max(1, lookups), 4),
+                "evictions": self._evictions
+            }
+
+class GenerationRequest:
+    """One chat prompt waiting for, or taking part in, the running batch"""
+
+    def __init__(self, model, tokenizer, prompt_text: str, max_new_tokens: int,
+                 deadline: float, on_token: Optional[Callable[[int], None]],
+                 cache_key: Optional[str] = None, turn_text: Optional[str] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prompt_text = prompt_text
+        # With a cached conversation, only turn_text goes through the model
+        self.cache_key = cache_key
+        self.turn_text = turn_text
+        self.max_new_tokens = max_new_tokens
+        self.deadline = deadline
+        self.on_token = on_token
+        self.prompt_ids: List[int] = []
+        self.generated: List[int] = []
+        self.next_token: Optional[int] = None  # Sampled but not yet fed through the model
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+        self.future: Future = Future()
+
+class ContinuousBatchingEngine:
+    """
+    Runs chat generation for all concurrent requests in one decode loop on a
+    dedicated thread. The running batch keeps its past key/values and
+    attention mask (left padded) between steps; between any two decode steps
+    newly arrived prompts are prefilled together and merged into the batch,
+    and sequences that produced EOS, reached their token limit or were
+    abandoned by their caller are retired. Each request gets its own text
+    back, and an optional on_token callback sees tokens as they are sampled.
+
+    Sampling matches the model.generate settings the chat used before:
+    repetition penalty, no-repeat n-grams, temperature and top-p.
+
+    With a kv_cache, a request carrying a cache_key continues from that
+    conversation's stored past key/values, and its own are stored when it
+    finishes. With a residency_key, every decode step marks that
+    model_residency entry in use, so the model is not evicted mid-batch.
+    """
+
+    def __init__(self, max_batch_size: int, max_queue_size: int, timeout: float,
+                 kv_cache: Optional[ConversationKVCache] = None, residency_key: Optional[str] = None):
+        self.kv_cache = kv_cache
+        self.residency_key = residency_key
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_queue_size = max(0, max_queue_size)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._waiting: Deque[GenerationRequest] = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._processors: Dict[bool, Any] = {}  # Per sampling mode
+
+        # Running batch, only touched by the engine thread
+        self._rows: List[GenerationRequest] = []
+        self._past: Optional[Tuple[Tuple[Any, Any], ...]] = None
+        self._mask = None
+        self._model = None
+
+        self._steps = 0
+        self._step_rows = 0
+        self._largest_batch = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    async def generate(self, model, tokenizer, prompt_text: str,
+                       on_token: Optional[Callable[[int], None]] = None,
+                       cache_key: Optional[str] = None, turn_text: Optional[str] = None) -> Tuple[str, int]:
+        """
+        Generate a reply for prompt_text (EOS is appended here). Returns the
+        decoded new text and the total token count, like a model.generate
+        call. on_token runs on the engine thread for every sampled token.
+        When cache_key has cached past key/values, turn_text (the tail of
+        prompt_text that is new since the last turn) is encoded instead.
+        """
+        request = GenerationRequest(
+            model, tokenizer, prompt_text, CHAT_GENERATION_CONFIG["max_new_tokens"],
+            time.perf_counter() + self.timeout, on_token, cache_key, turn_text
+        )
+        with self._cond:
+            if len(self._waiting) >= self.max_queue_size + self.max_batch_size:
+                self._rejected += 1
+                raise InferenceQueueFullError(f"Chat engine is full ({len(self._waiting)} prompts waiting)")
+            self._ensure_thread()
+            self._waiting.append(request)
+            self._cond.notify()
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(request.future)), self.timeout)
+        except asyncio.TimeoutError:
+            # Retired from the batch before the next decode step
+            request.cancelled = True
+            with self._cond:
+                self._timed_out += 1
+            raise InferenceTimeoutError(f"Chat generation did not finish within {self.timeout}s")
+        except asyncio.CancelledError:
+            request.cancelled = True
+            raise
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="chat-engine", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._waiting and not self._rows:
+                    self._cond.wait()
+                if self._stopped:
+                    pending = list(self._waiting) + self._rows
+                    self._waiting.clear()
+                    break
+                admitted = self._admit()
+
+            try:
+                with self._in_use():
+                    self._retire_abandoned()
+                    if admitted:
+                        self._prefill(admitted)
+                    if self._rows:
+                        self._step()
+            except Exception as e:
+                print(f"❌ Chat engine error: {e}")
+                for request in admitted + self._rows:
+                    self._finish(request, error=e)
+                self._reset()
+
+        for request in pending:
+            self._finish(request, error=RuntimeError("Chat engine stopped"))
+        self._reset()
+
+    def _in_use(self):
+        if self.residency_key is None:
+            return contextlib.nullcontext()
+        return model_residency.in_use(self.residency_key)
+
+    def _admit(self) -> List[GenerationRequest]:
+        """Waiting prompts that fit into the batch; only one model runs at a time"""
+        admitted = []
+        while self._waiting and len(self._rows) + len(admitted) < self.max_batch_size:
+            request = self._waiting[0]
+            if request.cancelled:
+                self._waiting.popleft()
+                continue
+            # A model reloaded after eviction starts once the old batch drains
+            current = self._model or (admitted[0].model if admitted else None)
+            if current is not None and request.model is not current:
+                break
+            admitted.append(self._waiting.popleft())
+        return admitted
+
+    def _prefill(self, requests: List[GenerationRequest]):
+        """Encode new prompts in one left-padded forward pass and merge them into the batch"""
+        import torch
+
+        model = requests[0].model
+        tokenizer = requests[0].tokenizer
+        fresh = []
+        for request in requests:
+            entry = None
+            if self.kv_cache is not None and request.cache_key and request.turn_text is not None:
+                entry = self.kv_cache.take(request.cache_key, model)
+            if entry is not None:
+                new_ids = entry.pending_ids + tokenizer.encode(request.turn_text + tokenizer.eos_token)
+                if len(entry.token_ids) + len(new_ids) <= self.kv_cache.max_context_tokens:
+                    self._prefill_cached(request, entry, new_ids)
+                    continue
+            request.prompt_ids = tokenizer.encode(request.prompt_text + tokenizer.eos_token)
+            fresh.append(request)
+        if not fresh:
+            return
+        requests = fresh
+
+        longest = max(len(request.prompt_ids) for request in requests)
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        input_ids = torch.tensor(
+            [[pad_id] * (longest - len(r.prompt_ids)) + r.prompt_ids for r in requests], device=model.device
+        )
+        mask = torch.tensor(
+            [[0] * (longest - len(r.prompt_ids)) + [1] * len(r.prompt_ids) for r in requests], device=model.device
+        )
+        position_ids = (mask.cumsum(-1) - 1).clamp(min=0)
+
+        with torch.no_grad():
+            output = model(input_ids=input_ids, attention_mask=mask, position_ids=position_ids, use_cache=True)
+        past = self._legacy_past(output.past_key_values)
+        logits = output.logits[:, -1, :]
+
+        keep = [
+            i for i, request in enumerate(requests)
+            if self._accept(request, self._sample(logits[i], request), (past, mask, i))
+        ]
+        if not keep:
+            return
+        index = torch.tensor(keep, device=model.device)
+        past = tuple((key.index_select(0, index), value.index_select(0, index)) for key, value in past)
+        self._merge(model, past, mask.index_select(0, index), [requests[i] for i in keep])
+
+    def _prefill_cached(self, request: GenerationRequest, entry: _KVEntry, new_ids: List[int]):
+        """Run only a conversation's new tokens, on top of its cached past key/values"""
+        import torch
+
+        model = request.model
+        request.prompt_ids = entry.token_ids + new_ids
+        past_length = len(entry.token_ids)
+        input_ids = torch.tensor([new_ids], device=model.device)
+        mask = torch.ones((1, past_length + len(new_ids)), dtype=torch.long, device=model.device)
+        position_ids = torch.arange(past_length, past_length + len(new_ids), device=model.device).unsqueeze(0)
+
+        with torch.no_grad():
+            output = model(
+                input_ids=input_ids, past_key_values=entry.past, attention_mask=mask,
+                position_ids=position_ids, use_cache=True
+            )
+        past = self._legacy_past(output.past_key_values)
+        if self._accept(request, self._sample(output.logits[0, -1, :], request), (past, mask, 0)):
+            self._merge(model, past, mask, [request])
+
+    def _store_kv(self, request: GenerationRequest, batch_past, batch_mask, row: int):
+        """Keep a finished sequence's past key/values for its conversation's next turn"""
+        length = int(batch_mask[row].sum())
+        # Copies, so the cache does not pin the whole batch's tensors
+        past = tuple(
+            (key[row:row + 1, :, -length:].clone(), value[row:row + 1, :, -length:].clone())
+            for key, value in batch_past
+        )
+        nbytes = sum(
+            key.numel() * key.element_size() + value.numel() * value.element_size() for key, value in past
+        )
+        last = request.generated[-1]
+        eos = request.tokenizer.eos_token_id
+        self.kv_cache.put(request.cache_key, _KVEntry(
+            request.model,
+            request.prompt_ids + request.generated[:-1],
+            past,
+            [last] if last == eos else [last, eos],
+            nbytes
+        ))
+
+    def _merge(self, model, past, mask, rows: List[GenerationRequest]):
+        """Add prefilled rows to the running batch, left padding the shorter side"""
+        import torch
+        import torch.nn.functional as F
+
+        if not self._rows:
+            self._model, self._past, self._mask, self._rows = model, past, mask, rows
+            return
+
+        length = max(self._mask.shape[1], mask.shape[1])
+
+        def pad_left(tensor, seq_dim_from_end: int):
+            missing = length - tensor.shape[-seq_dim_from_end]
+            if missing == 0:
+                return tensor
+            # F.pad lists (left, right) pairs starting from the last dimension
+            return F.pad(tensor, (0, 0) * (seq_dim_from_end - 1) + (missing, 0))
+
+        self._past = tuple(
+            (torch.cat([pad_left(old_key, 2), pad_left(new_key, 2)]),
+             torch.cat([pad_left(old_value, 2), pad_left(new_value, 2)]))
+            for (old_key, old_value), (new_key, new_value) in zip(self._past, past)
+        )
+        self._mask = torch.cat([pad_left(self._mask, 1), pad_left(mask, 1)])
+        self._rows = self._rows + rows
+
+    def _step(self):
+        """One decode step for every running sequence"""
+        import torch
+
+        rows = self._rows
+        model = self._model
+        input_ids = torch.tensor([[row.next_token] for row in rows], device=model.device)
+        # Position of the new token = number of real tokens before it
+        position_ids = self._mask.sum(-1, keepdim=True)
+        mask = torch.cat([self._mask, self._mask.new_ones((len(rows), 1))], dim=-1)
+
+        with torch.no_grad():
+            output = model(
+                input_ids=input_ids, past_key_values=self._past, attention_mask=mask,
+                position_ids=position_ids, use_cache=True
+            )
+        self._past = self._legacy_past(output.past_key_values)
+        self._mask = mask
+        logits = output.logits[:, -1, :]
+
+        self._steps += 1
+        self._step_rows += len(rows)
+        self._largest_batch = max(self._largest_batch, len(rows))
+
+        keep = [
+            i for i, row in enumerate(rows)
+            if self._accept(row, self._sample(logits[i], row), (self._past, self._mask, i))
+        ]
+        self._retain(keep)
+
+    def _sample(self, logits, request: GenerationRequest) -> int:
+        import torch
+
+        do_sample = CHAT_GENERATION_CONFIG["do_sample"]
+        processors = self._processors.get(do_sample)
+        if processors is None:
+            from transformers import (
+                LogitsProcessorList, NoRepeatNGramLogitsProcessor, RepetitionPenaltyLogitsProcessor,
+                TemperatureLogitsWarper, TopPLogitsWarper
+            )
+            processors = LogitsProcessorList([
+                RepetitionPenaltyLogitsProcessor(CHAT_GENERATION_CONFIG["repetition_penalty"]),
+                NoRepeatNGramLogitsProcessor(CHAT_GENERATION_CONFIG["no_repeat_ngram_size"])
+            ])
+            if do_sample:
+                processors.append(TemperatureLogitsWarper(CHAT_GENERATION_CONFIG["temperature"]))
+                processors.append(TopPLogitsWarper(CHAT_GENERATION_CONFIG["top_p"]))
+            self._processors[do_sample] = processors
+
+        # Each row only sees its own tokens, never another row's padding
+        token_ids = torch.tensor([request.prompt_ids + request.generated], device=logits.device)
+        scores = processors(token_ids, logits.unsqueeze(0).float())
+        if not do_sample:
+            return int(scores[0].argmax())
+        return int(torch.multinomial(torch.softmax(scores, dim=-1), 1)[0, 0])
+
+    def _accept(self, request: GenerationRequest, token: int, batch: Tuple[Any, Any, int]) -> bool:
+        """
+        Record a sampled token; False once the request is finished. batch is
+        the (past, mask, row) the token was sampled from, whose past
+        key/values are cached for the conversation when the request finishes.
+        """
+        request.generated.append(token)
+        eos = token == request.tokenizer.eos_token_id
+        if request.on_token is not None and not eos:
+            try:
+                request.on_token(token)
+            except Exception as e:
+                print(f"⚠️ Chat token callback failed: {e}")
+        if eos or len(request.generated) >= request.max_new_tokens:
+            if request.cache_key and self.kv_cache is not None:
+                try:
+                    self._store_kv(request, *batch)
+                except Exception as e:
+                    print(f"⚠️ Could not cache conversation state: {e}")
+            self._finish(request)
+            return False
+        request.next_token = token
+        return True
+
+    def _retire_abandoned(self):
+        """Drop sequences whose caller timed out or went away"""
+        now = time.perf_counter()
+        keep = []
+        for i, row in enumerate(self._rows):
+            if row.cancelled or now > row.deadline:
+                self._finish(row, error=InferenceTimeoutError("Chat generation abandoned"))
+            else:
+                keep.append(i)
+        self._retain(keep)
+
+    def _retain(self, keep: List[int]):
+        import torch
+
+        if len(keep) == len(self._rows):
+            return
+        if not keep:
+            self._reset()
+            return
+        index = torch.tensor(keep, device=self._mask.device)
+        mask = self._mask.index_select(0, index)
+        # Columns that are padding for every remaining row can go
+        first = int((mask.sum(0) > 0).nonzero()[0])
+        self._mask = mask[:, first:]
+        self._past = tuple(
+            (key.index_select(0, index)[:, :, first:], value.index_select(0, index)[:, :, first:])
+            for key, value in self._past
+        )
+        self._rows = [self._rows[i] for i in keep]
+
+    def _reset(self):
+        self._rows, self._past, self._mask, self._model = [], None, None, None
+
+    def _finish(self, request: GenerationRequest, error: Optional[Exception] = None):
+        if request.future.done():
+            return
+        if error is not None:
+            self._failed += 1
+            request.future.set_exception(error)
+            return
+        self._completed += 1
+        text = request.tokenizer.decode(request.generated, skip_special_tokens=True).strip()
+        request.future.set_result((text, len(request.prompt_ids) + len(request.generated)))
+
+    @staticmethod
+    def _legacy_past(past):
+        """Per-layer (key, value) tuples, whatever cache object the model returned"""
+        return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "enabled": CHAT_BATCHING_CONFIG["enabled"],
+                "max_batch_size": self.max_batch_size,
+                "running": len(self._rows),
+                "waiting": len(self._waiting),
+                "steps": self._steps,
+                "avg_batch_size": round(self._step_rows / max(1, self._steps), 2),
+                "largest_batch": self._largest_batch,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out
+            }
+
+# Global per-conversation past key/values
+chat_kv_cache = ConversationKVCache(
+    max_mb=CHAT_KV_CACHE_CONFIG["max_mb"],
+    max_conversations=CHAT_KV_CACHE_CONFIG["max_conversations"],
+    max_context_tokens=CHAT_KV_CACHE_CONFIG["max_context_tokens"]
+)
+
+# Global engine for /ai/chat generation
+chat_engine = ContinuousBatchingEngine(
+    max_batch_size=CHAT_BATCHING_CONFIG["max_batch_size"],
+    max_queue_size=CHAT_INFERENCE_CONFIG["max_queue_size"],
+    timeout=CHAT_INFERENCE_CONFIG["timeout"],
+    kv_cache=chat_kv_cache if CHAT_KV_CACHE_CONFIG["enabled"] else None
+)
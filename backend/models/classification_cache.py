@@ -0,0 +1,155 @@
+"""
+Content-addressed cache for food classification results
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from config.ai import CACHE_CONFIG
+
+class ClassificationCache:
+    """
+    Caches full analysis dicts keyed by a hash of the raw image bytes plus the
+    model name and version, so retries and re-scans of the same photo skip
+    inference entirely.
+
+    Entries are kept as serialized JSON: the memory budget is measured in
+    those bytes and every hit hands back a fresh copy. An optional disk tier
+    under disk_dir keeps results across restarts; both tiers honour the TTL.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_name: str, model_version: str) -> str:
+        digest = hashlib.sha256(image_bytes)
+        digest.update(f"|{model_name}|{model_version}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return json.loads(payload)
+                self._remove(key)
+                self._expired += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._store(key, *entry)
+        return json.loads(entry[1])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        stored_at = time.time()
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            self._store(key, stored_at, payload)
+        self._write_disk(key, stored_at, payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key: str, stored_at: float, payload: str):
+        if len(payload) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (stored_at, payload)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key: str):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stored_at = float(f.readline())
+                payload = f.read()
+        except (OSError, ValueError):
+            return None
+        if now - stored_at > self.ttl:
+            with self._lock:
+                self._expired += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return stored_at, payload
+
+    def _write_disk(self, key: str, stored_at: float, payload: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(f"{stored_at}\n")
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Failed to write classification cache entry: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "disk_tier": self.disk_dir is not None,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._hits + self._disk_hits) / max(1, lookups), 4),
+                "evictions": self._evictions,
+                "expired": self._expired
+            }
+
+# Global classification result cache
+classification_cache = ClassificationCache(
+    max_bytes=CACHE_CONFIG["max_bytes"],
+    ttl=CACHE_CONFIG["ttl"],
+    disk_dir=CACHE_CONFIG["disk_dir"]
+)
@@ -0,0 +1,227 @@
+"""
+Durable Postgres-backed queue for asynchronous food classification jobs
+"""
+import asyncio
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from database.connection import db_manager
+from config.ai import JOB_QUEUE_CONFIG
+
+JobHandler = Callable[[bytes, Optional[str]], Awaitable[Dict[str, Any]]]
+
+class ClassificationJobQueue:
+    """
+    Jobs live in the classification_jobs table, so they survive restarts and
+    any API worker can pick them up. Workers claim one job at a time with
+    FOR UPDATE SKIP LOCKED, which lets several processes poll the same table
+    without handing out a job twice. A job stuck in 'processing' longer than
+    stale_after (its worker died) is claimed again, up to max_attempts.
+
+    Finished jobs keep their result for retention seconds, then a periodic
+    cleanup deletes them. The uploaded image is dropped as soon as the job
+    finishes.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self._handler: Optional[JobHandler] = None
+        self._ready_fn: Callable[[], bool] = lambda: True
+        self._tasks: List[asyncio.Task] = []
+        # Long-poll waiters in this process, woken as soon as a local worker finishes
+        self._waiters: Dict[str, List[asyncio.Event]] = {}
+        self._processed = 0
+        self._failed = 0
+        self._retried = 0
+
+    def start(self, handler: JobHandler, ready_fn: Callable[[], bool] = lambda: True):
+        """Start the job workers and the retention cleanup on the running event loop"""
+        if not self.config["enabled"] or self._tasks:
+            return
+        self._handler = handler
+        self._ready_fn = ready_fn
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.config["workers"])]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+        print(f"📬 Classification job queue started with {self.config['workers']} worker(s)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, image_bytes: bytes, file_name: Optional[str]) -> str:
+        pool = db_manager.get_pool()
+        if not pool:
+            raise RuntimeError("Database connection not available")
+        job_id = str(uuid.uuid4())
+        async with pool.acquire() as connection:
+            await connection.execute('''
+                INSERT INTO classification_jobs (job_id, image, file_name)
+                VALUES ($1, $2, $3)
+            ''', job_id, image_bytes, file_name)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        pool = db_manager.get_pool()
+        if not pool:
+            raise RuntimeError("Database connection not available")
+        async with pool.acquire() as connection:
+            row = await connection.fetchrow('''
+                SELECT job_id, status, file_name, result, error, attempts,
+                       created_at, started_at, finished_at
+                FROM classification_jobs
+                WHERE job_id = $1
+            ''', job_id)
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["job_id"] = str(job["job_id"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        for field in ("created_at", "started_at", "finished_at"):
+            job[field] = job[field].isoformat() if job[field] else None
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Long-poll: return the job once it is done or failed, or as it stands
+        when timeout runs out. Waits on a local wake-up and re-reads the row
+        every poll_interval, so jobs finished by other workers are seen too.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(max(0.0, timeout), self.config["max_wait"])
+        event = asyncio.Event()
+        self._waiters.setdefault(job_id, []).append(event)
+        try:
+            while True:
+                job = await self.get(job_id)
+                remaining = deadline - loop.time()
+                if job is None or job["status"] in ("done", "failed") or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, self.config["poll_interval"]))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if event in waiters:
+                waiters.remove(event)
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    async def _work(self, worker_id: int):
+        while True:
+            try:
+                job = await self._claim() if self._ready_fn() else None
+                if job is None:
+                    await asyncio.sleep(self.config["poll_interval"])
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Classification job worker {worker_id} error: {e}")
+                await asyncio.sleep(self.config["poll_interval"])
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        pool = db_manager.get_pool()
+        if not pool:
+            return None
+        async with pool.acquire() as connection:
+            row = await connection.fetchrow('''
+                UPDATE classification_jobs
+                SET status = 'processing', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                WHERE job_id = (
+                    SELECT job_id FROM classification_jobs
+                    WHERE status = 'queued'
+                       OR (status = 'processing' AND attempts < $2
+                           AND started_at < CURRENT_TIMESTAMP - make_interval(secs => $1))
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING job_id, image, file_name, attempts
+            ''', float(self.config["stale_after"]), self.config["max_attempts"])
+        return dict(row) if row else None
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        try:
+            result = await self._handler(job["image"], job["file_name"])
+        except Exception as e:
+            await self._record_failure(job, e)
+        else:
+            await self._finish(job_id, "done", result=json.dumps(result))
+            self._processed += 1
+        self._wake(str(job_id))
+
+    async def _record_failure(self, job: Dict[str, Any], error: Exception):
+        if job["attempts"] < self.config["max_attempts"]:
+            # Back in the queue for another worker to try
+            pool = db_manager.get_pool()
+            async with pool.acquire() as connection:
+                await connection.execute('''
+                    UPDATE classification_jobs
+                    SET status = 'queued', started_at = NULL, error = $2
+                    WHERE job_id = $1
+                ''', job["job_id"], str(error))
+            self._retried += 1
+            return
+        print(f"❌ Classification job {job['job_id']} failed: {error}")
+        await self._finish(job["job_id"], "failed", error=str(error))
+        self._failed += 1
+
+    async def _finish(self, job_id, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        pool = db_manager.get_pool()
+        async with pool.acquire() as connection:
+            await connection.execute('''
+                UPDATE classification_jobs
+                SET status = $2, result = $3::jsonb, error = $4, image = NULL,
+                    finished_at = CURRENT_TIMESTAMP
+                WHERE job_id = $1
+            ''', job_id, status, result, error)
+
+    def _wake(self, job_id: str):
+        for event in self._waiters.get(job_id, []):
+            event.set()
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.config["cleanup_interval"])
+            try:
+                pool = db_manager.get_pool()
+                if not pool:
+                    continue
+                async with pool.acquire() as connection:
+                    # Jobs whose worker died on every attempt will not be claimed again
+                    await connection.execute('''
+                        UPDATE classification_jobs
+                        SET status = 'failed', error = 'Worker stopped while processing', image = NULL,
+                            finished_at = CURRENT_TIMESTAMP
+                        WHERE status = 'processing' AND attempts >= $2
+                          AND started_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                    ''', float(self.config["stale_after"]), self.config["max_attempts"])
+                    deleted = await connection.execute('''
+                        DELETE FROM classification_jobs
+                        WHERE finished_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                    ''', float(self.config["retention"]))
+                print(f"🧹 Classification job cleanup: {deleted}")
+            except Exception as e:
+                print(f"❌ Classification job cleanup error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.config["enabled"],
+            "workers": self.config["workers"],
+            "running": bool(self._tasks),
+            "processed": self._processed,
+            "failed": self._failed,
+            "retried": self._retried,
+            "long_polls": sum(len(waiters) for waiters in self._waiters.values()),
+            "retention": self.config["retention"]
+        }
+
+# Global classification job queue
+classification_job_queue = ClassificationJobQueue(JOB_QUEUE_CONFIG)
@@ -0,0 +1,406 @@
+"""
+Chat conversations: a bounded in-memory cache in front of the chat_messages table
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import asyncpg
+from database.connection import db_manager
+from config.database import DATABASE_CONFIG
+from config.ai import CONVERSATION_CONFIG
+
+ROLES = ("user", "assistant")
+NOTIFY_CHANNEL = "chat_conversations"
+MAX_NOTIFY_BYTES = 7000  # Postgres caps a NOTIFY payload at 8000 bytes
+
+class _Conversation:
+    __slots__ = ("messages", "last_active")
+
+    def __init__(self, max_messages: int):
+        # (role index, content, unix time): no per-message dict or timestamp string
+        self.messages: Deque[Tuple[int, str, float]] = deque(maxlen=max_messages)
+        self.last_active = 0.0
+
+class ConversationStore:
+    """
+    Chat conversations keyed by conversation_id. Each keeps at most
+    max_messages (oldest dropped first); conversations idle for longer than
+    ttl are dropped, and beyond max_conversations the least recently active
+    go first. Counters are maintained on every change, so stats cost nothing.
+    on_evict is called with the id of every conversation that is dropped.
+
+    With persist, memory is a read-through cache of the chat_messages table:
+    load() fetches a conversation this worker does not hold, and appended
+    messages are buffered and written in batches every flush_interval by a
+    background task, never on the request path. After each flush the
+    worker NOTIFYs the others, which drop their copy of those conversations
+    and reload it on the next message; delete() removes a conversation from
+    the table and from every worker's memory the same way.
+    """
+
+    def __init__(self, max_messages: int, ttl: float, max_conversations: int, persist: bool = False,
+                 flush_interval: float = 0.5, max_pending: int = 5000, retention: float = 0,
+                 cleanup_interval: float = 3600):
+        self.max_messages = max(1, max_messages)
+        self.ttl = ttl
+        self.max_conversations = max(1, max_conversations)
+        self.persist = persist
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self.retention = retention
+        self.cleanup_interval = cleanup_interval
+        self.on_evict: Optional[Callable[[str], None]] = None
+        # Ordered by last activity, oldest first
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._messages = 0
+        self._expired = 0
+        self._evicted = 0
+
+        # Write-behind state
+        self._worker_id = uuid.uuid4().hex  # Tells this worker's notifications from the others'
+        self._pending: Deque[Tuple[str, int, str, float]] = deque()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+        self._listener = None
+        self._flushed = 0
+        self._flushes = 0
+        self._flush_failures = 0
+        self._dropped_writes = 0
+        self._loads = 0
+        self._invalidations = 0
+
+    async def start(self):
+        """Start the flusher and cleanup tasks and listen for other workers' changes"""
+        pool = db_manager.get_pool()
+        if not self.persist or not pool or self._tasks:
+            return
+        self._flush_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._flush_loop())]
+        if self.retention > 0:
+            self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+        try:
+            # Its own connection outside the pool, held for as long as the listener lives
+            self._listener = await asyncpg.connect(
+                host=DATABASE_CONFIG["host"],
+                port=DATABASE_CONFIG["port"],
+                database=DATABASE_CONFIG["database"],
+                user=DATABASE_CONFIG["user"],
+                password=DATABASE_CONFIG["password"]
+            )
+            await self._listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        except Exception as e:
+            print(f"⚠️ Conversation change notifications unavailable: {e}")
+            await self._release_listener()
+        print("💬 Conversation store persisting to chat_messages")
+
+    async def stop(self):
+        """Stop the background tasks and write out whatever is still buffered"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._release_listener()
+        if self._flush_lock is not None:
+            await self.flush()
+
+    async def _release_listener(self):
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        try:
+            await listener.remove_listener(NOTIFY_CHANNEL, self._on_notify)
+            await listener.close()
+        except Exception:
+            listener.terminate()
+
+    def _persisting(self) -> bool:
+        return self._flush_lock is not None and db_manager.get_pool() is not None
+
+    async def load(self, conversation_id: str):
+        """Make sure memory holds the conversation, reading it from the table if it does not"""
+        with self._lock:
+            cached = conversation_id in self._conversations
+        if cached or not self._persisting():
+            return
+
+        # This worker's own unflushed messages must be in the table before it is read
+        if any(pending[0] == conversation_id for pending in self._pending):
+            await self.flush()
+        async with db_manager.get_pool().acquire() as connection:
+            rows = await connection.fetch('''
+                SELECT role, content, created_at FROM (
+                    SELECT message_id, role, content, created_at
+                    FROM chat_messages
+                    WHERE conversation_id = $1
+                    ORDER BY created_at DESC, message_id DESC
+                    LIMIT $2
+                ) recent
+                ORDER BY created_at, message_id
+            ''', conversation_id, self.max_messages)
+        self._loads += 1
+        if not rows:
+            return
+
+        with self._lock:
+            # Another request may have started the conversation meanwhile
+            if conversation_id in self._conversations:
+                return
+            conversation = _Conversation(self.max_messages)
+            conversation.messages.extend(
+                (ROLES.index(row["role"]), row["content"], row["created_at"].timestamp()) for row in rows
+            )
+            conversation.last_active = time.time()
+            self._conversations[conversation_id] = conversation
+            self._messages += len(conversation.messages)
+            dropped = self._enforce_limit()
+        self._notify(dropped)
+
+    def append(self, conversation_id: str, role: str, content: str) -> int:
+        """Add a message (creating the conversation); returns its message count"""
+        now = time.time()
+        dropped = []
+        with self._lock:
+            dropped += self._expire(now)
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self._conversations[conversation_id] = _Conversation(self.max_messages)
+                dropped += self._enforce_limit()
+            else:
+                self._conversations.move_to_end(conversation_id)
+
+            if len(conversation.messages) < self.max_messages:
+                self._messages += 1
+            conversation.messages.append((ROLES.index(role), content, now))
+            conversation.last_active = now
+            count = len(conversation.messages)
+
+        if self._persisting():
+            self._pending.append((conversation_id, ROLES.index(role), content, now))
+            while len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self._dropped_writes += 1
+        self._notify(dropped)
+        return count
+
+    def messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """The conversation's messages as {"role", "content", "timestamp"} dicts, oldest first"""
+        with self._lock:
+            dropped = self._expire(time.time())
+            conversation = self._conversations.get(conversation_id)
+            stored = list(conversation.messages) if conversation is not None else []
+        self._notify(dropped)
+        return [
+            {"role": ROLES[role], "content": content, "timestamp": datetime.fromtimestamp(created, timezone.utc).isoformat()}
+            for role, content, created in stored
+        ]
+
+    async def delete(self, conversation_id: str) -> bool:
+        """Delete a conversation here, in the table and on every other worker"""
+        found = self._forget([conversation_id], deleted=True) > 0
+        if self._persisting():
+            # Under the flush lock, so a batch being written (or requeued) cannot bring it back
+            async with self._flush_lock:
+                found = self._drop_pending([conversation_id]) or found
+                async with db_manager.get_pool().acquire() as connection:
+                    result = await connection.execute(
+                        "DELETE FROM chat_messages WHERE conversation_id = $1", conversation_id
+                    )
+                    found = found or result != "DELETE 0"
+                    await self._publish(connection, "deleted", [conversation_id])
+        return found
+
+    def _forget(self, conversation_ids: List[str], deleted: bool) -> int:
+        """Drop conversations from memory (and, when deleted, their unflushed messages)"""
+        removed = 0
+        with self._lock:
+            for conversation_id in conversation_ids:
+                conversation = self._conversations.pop(conversation_id, None)
+                if conversation is not None:
+                    self._messages -= len(conversation.messages)
+                    removed += 1
+        if deleted and self._drop_pending(conversation_ids):
+            removed += 1
+        self._notify(conversation_ids)
+        return removed
+
+    def _drop_pending(self, conversation_ids: List[str]) -> bool:
+        dropped = set(conversation_ids)
+        kept = [pending for pending in self._pending if pending[0] not in dropped]
+        if len(kept) == len(self._pending):
+            return False
+        self._pending = deque(kept)
+        return True
+
+    async def flush(self):
+        """Write every buffered message in one statement, then tell the other workers"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pool = db_manager.get_pool()
+            if not pool:
+                return
+            batch = list(self._pending)
+            self._pending.clear()
+            try:
+                async with pool.acquire() as connection:
+                    await connection.execute('''
+                        INSERT INTO chat_messages (conversation_id, role, content, created_at)
+                        SELECT * FROM unnest($1::text[], $2::varchar[], $3::text[], $4::timestamptz[])
+                    ''',
+                        [pending[0] for pending in batch],
+                        [ROLES[pending[1]] for pending in batch],
+                        [pending[2] for pending in batch],
+                        [datetime.fromtimestamp(pending[3], timezone.utc) for pending in batch]
+                    )
+            except Exception as e:
+                # Back in front of anything appended meanwhile, for the next flush
+                self._pending.extendleft(reversed(batch))
+                while len(self._pending) > self.max_pending:
+                    self._pending.popleft()
+                    self._dropped_writes += 1
+                self._flush_failures += 1
+                print(f"❌ Failed to persist {len(batch)} chat message(s): {e}")
+                return
+            self._flushes += 1
+            self._flushed += len(batch)
+
+            try:
+                async with pool.acquire() as connection:
+                    await self._publish(connection, "updated", list(dict.fromkeys(pending[0] for pending in batch)))
+            except Exception as e:
+                print(f"⚠️ Could not notify other workers of conversation changes: {e}")
+
+    async def _publish(self, connection, event: str, conversation_ids: List[str]):
+        """NOTIFY the other workers, in as many payloads as the size limit needs"""
+        chunk: List[str] = []
+        size = 0
+        for conversation_id in conversation_ids:
+            if len(conversation_id) > MAX_NOTIFY_BYTES // 2:
+                continue  # Cannot be sent; other workers pick it up when it expires
+            if chunk and size + len(conversation_id) > MAX_NOTIFY_BYTES:
+                await self._send(connection, event, chunk)
+                chunk, size = [], 0
+            chunk.append(conversation_id)
+            size += len(conversation_id) + 4
+        if chunk:
+            await self._send(connection, event, chunk)
+
+    async def _send(self, connection, event: str, conversation_ids: List[str]):
+        payload = json.dumps({"worker": self._worker_id, "event": event, "ids": conversation_ids})
+        await connection.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            return
+        if change.get("worker") == self._worker_id:
+            return
+        # The next message reloads the conversation with the other worker's turns
+        self._invalidations += self._forget(change.get("ids", []), deleted=change.get("event") == "deleted")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Conversation flush error: {e}")
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                pool = db_manager.get_pool()
+                if not pool:
+                    continue
+                async with pool.acquire() as connection:
+                    deleted = await connection.execute('''
+                        DELETE FROM chat_messages
+                        WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                    ''', float(self.retention))
+                print(f"🧹 Chat message cleanup: {deleted}")
+            except Exception as e:
+                print(f"❌ Chat message cleanup error: {e}")
+
+    def _expire(self, now: float) -> List[str]:
+        """Drop conversations idle for longer than the TTL; the oldest are at the front"""
+        dropped = []
+        while self._conversations:
+            conversation = next(iter(self._conversations.values()))
+            if now - conversation.last_active <= self.ttl:
+                break
+            dropped.append(self._pop_oldest())
+            self._expired += 1
+        return dropped
+
+    def _enforce_limit(self) -> List[str]:
+        dropped = []
+        while len(self._conversations) > self.max_conversations:
+            dropped.append(self._pop_oldest())
+            self._evicted += 1
+        return dropped
+
+    def _pop_oldest(self) -> str:
+        conversation_id, conversation = self._conversations.popitem(last=False)
+        self._messages -= len(conversation.messages)
+        return conversation_id
+
+    def _notify(self, dropped: List[str]):
+        if self.on_evict is None:
+            return
+        for conversation_id in dropped:
+            try:
+                self.on_evict(conversation_id)
+            except Exception as e:
+                print(f"⚠️ Conversation eviction callback failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            dropped = self._expire(time.time())
+            conversations = len(self._conversations)
+            stats = {
+                "total_conversations": conversations,
+                "total_messages": self._messages,
+                "active_conversations": conversations,
+                "average_messages_per_conversation": self._messages / max(1, conversations),
+                "expired_conversations": self._expired,
+                "evicted_conversations": self._evicted,
+                "max_messages": self.max_messages,
+                "ttl": self.ttl,
+                "max_conversations": self.max_conversations,
+                "persistence": {
+                    "enabled": self._persisting(),
+                    "listening": self._listener is not None,
+                    "pending_writes": len(self._pending),
+                    "flushed_messages": self._flushed,
+                    "flushes": self._flushes,
+                    "flush_failures": self._flush_failures,
+                    "dropped_writes": self._dropped_writes,
+                    "loads": self._loads,
+                    "invalidations": self._invalidations
+                }
+            }
+        self._notify(dropped)
+        return stats
+
+# Global conversation store for /ai/chat
+conversation_store = ConversationStore(
+    max_messages=CONVERSATION_CONFIG["max_messages"],
+    ttl=CONVERSATION_CONFIG["ttl"],
+    max_conversations=CONVERSATION_CONFIG["max_conversations"],
+    persist=CONVERSATION_CONFIG["persist"],
+    flush_interval=CONVERSATION_CONFIG["flush_interval"],
+    max_pending=CONVERSATION_CONFIG["max_pending"],
+    retention=CONVERSATION_CONFIG["retention"],
+    cleanup_interval=CONVERSATION_CONFIG["cleanup_interval"]
+)
@@ -1,32 +1,134 @@
-import torch
-import torchvision.transforms as transforms
-from transformers import AutoImageProcessor, AutoModelForImageClassification, pipeline
 from PIL import Image
+import gc
 import io
+import os
 import json
+import queue
+import re
+import time
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import threading
 import logging
+from config.ai import (
+    CASCADE_CONFIG, DECODE_CONFIG, FOOD_MODEL_NAMES, HOT_SWAP_CONFIG, INFERENCE_CONFIG, MULTI_ITEM_CONFIG,
+    REPLICA_CONFIG, RESIDENCY_CONFIG
+)
+from models.inference_backend import create_backend, load_parity_samples, synthetic_samples
+from models.nutrition_store import nutrition_store
+from models.model_registry import model_registry
+from models.model_residency import model_residency, module_bytes
+
+class ClassifierStage:
+    """
+    One loaded classification model with its inference backend and label lookup.
+    classifier_pipeline is None for ONNX stages, which keep no torch model.
+    """
+    
+    def __init__(self, model_name: str, classifier_pipeline, backend, backend_report: Dict[str, Any],
+                 model_revision: str, label_table: Dict[str, Tuple[str, str, str]], input_size: int):
+        self.model_name = model_name
+        self.model_revision = model_revision
+        self.classifier_pipeline = classifier_pipeline
+        self.backend = backend
+        self.backend_report = backend_report
+        # Different backends give slightly different scores, so they must not share cache entries
+        self.model_version = f"{model_revision}+{backend.name}"
+        self.label_table = label_table
+        self.input_size = input_size
+        self.loaded_at = time.time()
+        # Requests currently classifying with this model; guarded by FoodClassifier._stage_lock
+        self.in_flight = 0
+        self.status = "active"  # active -> draining -> released
+    
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "version": self.model_version,
+            "status": self.status,
+            "in_flight": self.in_flight,
+            "loaded_at": self.loaded_at
+        }
+    
+    def resident_bytes(self) -> int:
+        """Memory held by the weights: the torch model, plus the exported graph for ONNX"""
+        total = 0
+        model = getattr(self.classifier_pipeline, "model", None)
+        if model is not None:
+            total += module_bytes(model)
+        onnx_path = getattr(self.backend, "onnx_path", None)
+        if onnx_path and os.path.exists(onnx_path):
+            total += os.path.getsize(onnx_path)
+        return total
+    
+    def release(self):
+        """Drop the references to the model so its memory can be reclaimed"""
+        self.classifier_pipeline = None
+        self.backend = None
+        self.status = "released"
 
 class FoodClassifier:
+    # Confidence levels, highest first: (minimum confidence, level)
+    CONFIDENCE_LEVELS = [
+        (0.8, "sangat_yakin"),  # Very confident
+        (0.6, "yakin"),         # Confident
+        (0.4, "cukup_yakin"),   # Somewhat confident
+        (0.2, "kurang_yakin"),  # Not very confident
+    ]
+    IS_FOOD_THRESHOLD = 0.15  # Reasonable threshold
+    
+
     def __init__(self, model_path: str = None):
         """
         Initialize the food classifier with specialized food classification models
         Using Hugging Face models specifically trained for food recognition
+        
+        Construction is cheap: torch and the model are only loaded by
+        start_background_load() (or the first _initialize_model() call).
         """
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.device = None  # Resolved when the model loads
         self.model = None
         self.processor = None
-        self.classifier_pipeline = None
+        # Accurate model, plus the fast first stage when the cascade is enabled
+        self.stage: Optional[ClassifierStage] = None
+        self.fast_stage: Optional[ClassifierStage] = None
+        # Taken briefly to read/switch the active stages and count in-flight requests
+        self._stage_lock = threading.Lock()
+        
+        # Hot swap: the model being replaced (until drained) and progress of the last swap
+        self.previous_stage: Optional[ClassifierStage] = None
+        self.swap_status: Dict[str, Any] = {"state": "idle"}
+        self._swap_thread: Optional[threading.Thread] = None
+        
+        # Cache identity of the models freed by an idle eviction
+        self._evicted_identity: Optional[Tuple[str, str]] = None
+        self.input_size = DECODE_CONFIG["target_size"]
         self.model_lock = threading.Lock()
+        # Optional process pool of replicas that serve inference on other cores
+        self.replica_pool = None
+        
+        # Cascade: the fast model's answer is kept when its top confidence reaches this level
+        self.cascade_threshold = self._confidence_threshold(CASCADE_CONFIG["min_confidence_level"])
+        self._cascade_lock = threading.Lock()
+        self._cascade_fast_answers = 0
+        self._cascade_escalations = 0
+        
+        # Calibration of full-decode cost (ms per megapixel, per image format),
+        # measured on sampled uploads by a background thread, never on a request
+        self._decode_lock = threading.Lock()
+        self._decode_count = 0
+        self._full_decode_ms_per_mp: Dict[str, float] = {}
+        self._calibration_queue: "queue.Queue[Tuple[str, bytes, float]]" = queue.Queue(maxsize=1)
+        self._calibration_thread: Optional[threading.Thread] = None
+        
+        # Readiness: not_started -> loading -> ready | failed
+        self.state = "not_started"
+        self.load_error: Optional[str] = None
+        self.load_time: Optional[float] = None
+        self._load_thread: Optional[threading.Thread] = None
         
         # Food-specific AI models to try (in order of preference)
-        self.food_models = [
-            "Kaludi/food-category-classification-v2.0",  # Specialized food classifier
-            "nateraw/food",  # Another food classifier
-            "microsoft/resnet-50",  # General vision model as fallback
-        ]
+        self.food_models = list(FOOD_MODEL_NAMES)
         
         # Enhanced food translations (English -> Indonesian)
         self.translation_dict = {
@@ -69,126 +171,888 @@ class FoodClassifier:
             "nasi gudeg": "Gudeg", "soto": "Soto", "bakso": "Bakso"
         }
         
-        self._initialize_model()
+        # Category keywords (checked in order, first match wins)
+        self.category_keywords = {
+            "buah": ["fruit", "apple", "banana", "orange", "strawberry", "grape", "mango"],
+            "sayuran": ["vegetable", "broccoli", "carrot", "tomato", "onion", "spinach", "lettuce"],
+            "protein": ["meat", "chicken", "fish", "beef", "pork", "egg", "tofu", "tempeh"],
+            "karbohidrat": ["rice", "bread", "noodle", "pasta", "potato", "wheat", "oats"],
+            "dairy": ["milk", "cheese", "butter", "yogurt"],
+            "makanan_siap": ["pizza", "burger", "sandwich", "cake", "cookie", "soup"],
+            "minuman": ["coffee", "tea", "juice", "water", "soda", "wine", "beer"]
+        }
+        
+        self._compile_label_matchers()
+    
+    @property
+    def classifier_pipeline(self):
+        return self.stage.classifier_pipeline if self.stage else None
+    
+    @property
+    def backend(self):
+        return self.stage.backend if self.stage else None
+    
+    @property
+    def backend_report(self) -> Optional[Dict[str, Any]]:
+        return self.stage.backend_report if self.stage else None
+    
+    @property
+    def model_name(self) -> Optional[str]:
+        return self.stage.model_name if self.stage else None
+    
+    @property
+    def model_version(self) -> Optional[str]:
+        return self.stage.model_version if self.stage else None
+    
+    def cache_identity(self) -> Optional[Tuple[str, str]]:
+        """(name, version) of everything that can answer a request, for cache keys"""
+        stage, fast_stage = self.stage, self.fast_stage
+        if stage is None:
+            return self._evicted_identity if self.state == "evicted" else None
+        if fast_stage is None:
+            return stage.model_name, stage.model_version
+        return (
+            f"{fast_stage.model_name}>{stage.model_name}@{self.cascade_threshold}",
+            f"{fast_stage.model_version}>{stage.model_version}"
+        )
+    
+    def start_background_load(self) -> bool:
+        """
+        Load the model on a background thread so the API can serve traffic meanwhile.
+        Returns False if a load is already running or the model is ready.
+        """
+        with self.model_lock:
+            if self.state in ("loading", "ready"):
+                return False
+            self.state = "loading"
+            self._load_thread = threading.Thread(
+                target=self._initialize_model,
+                name="food-classifier-loader",
+                daemon=True
+            )
+            self._load_thread.start()
+            return True
+    
+    def is_ready(self) -> bool:
+        # An evicted model reloads on the next request, so it still counts as ready
+        return self.state in ("ready", "evicted")
     
     def _initialize_model(self):
         """Initialize the best available food classification model"""
         print("🔄 Initializing advanced food classification model...")
         
         with self.model_lock:
-            if self.classifier_pipeline is not None:
+            if self.stage is not None:
                 return True
-                
+            
+            # Requests keep flowing while an evicted model reloads, so it is not "loading"
+            if self.state != "evicted":
+                self.state = "loading"
+            started_at = time.time()
+            
+            # Heavy imports happen here rather than at module import time
+            try:
+                import torch
+            except Exception as e:
+                print(f"❌ Failed to import AI libraries: {e}")
+                self.state = "failed"
+                self.load_error = str(e)
+                return False
+            
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            fast_model = CASCADE_CONFIG["fast_model"] if CASCADE_CONFIG["enabled"] else None
+            if CASCADE_CONFIG["enabled"] and not fast_model:
+                print("⚠️ AI_CASCADE_ENABLED is set without AI_CASCADE_FAST_MODEL; cascade disabled")
+            
             for model_name in self.food_models:
+                if model_name == fast_model:
+                    continue
                 try:
-                    print(f"🧠 Trying to load model: {model_name}")
-                    
-                    # Try to create image classification pipeline
-                    self.classifier_pipeline = pipeline(
-                        "image-classification",
-                        model=model_name,
-                        device=0 if torch.cuda.is_available() else -1,
-                        top_k=10  # Get top 10 predictions
-                    )
-                    
-                    print(f"✅ Successfully loaded food classification model: {model_name}")
-                    print(f"🎯 Using device: {self.device}")
-                    
-                    # Test the model with a simple prediction
-                    self._test_model()
-                    return True
-                    
+                    self.stage = self._load_stage(model_name)
                 except Exception as e:
                     print(f"⚠️ Failed to load {model_name}: {e}")
+                    self.load_error = f"{model_name}: {e}"
                     continue
+                
+                if fast_model:
+                    try:
+                        self.fast_stage = self._load_stage(fast_model)
+                        print(f"🪜 Cascade enabled: {fast_model} answers at confidence >= {self.cascade_threshold}")
+                    except Exception as e:
+                        # The accurate model alone still serves every request
+                        print(f"⚠️ Failed to load cascade model {fast_model}: {e}")
+                
+                self.input_size = max(stage.input_size for stage in (self.stage, self.fast_stage) if stage)
+                if REPLICA_CONFIG["enabled"]:
+                    self._start_replica_pool()
+                self.load_time = round(time.time() - started_at, 2)
+                self.load_error = None
+                self.state = "ready"
+                model_residency.mark_loaded("food_classifier")
+                return True
             
             print("❌ Failed to load any food classification model")
-            self.classifier_pipeline = None
+            self.state = "failed"
             return False
     
-    def _test_model(self):
+    def _load_stage(self, model_name: str) -> ClassifierStage:
+        """Load one model with its configured backend and test it"""
+        import torch
+        from transformers import AutoImageProcessor, AutoModelForImageClassification, pipeline
+        
+        print(f"🧠 Trying to load model: {model_name}")
+        
+        # Registry copies load offline from local safetensors; others come from the hub
+        source = model_registry.resolve(model_name)
+        
+        # Try to create image classification pipeline
+        classifier_pipeline = pipeline(
+            "image-classification",
+            model=AutoModelForImageClassification.from_pretrained(source.path, **source.model_kwargs()),
+            image_processor=AutoImageProcessor.from_pretrained(source.path, **source.files_kwargs()),
+            device=0 if torch.cuda.is_available() else -1,
+            top_k=10  # Get top 10 predictions
+        )
+        
+        model_revision = source.version or getattr(classifier_pipeline.model.config, "_commit_hash", None) or "unknown"
+        label_table = self._build_label_table(classifier_pipeline.model.config.id2label.values())
+        
+        print(f"✅ Successfully loaded food classification model: {model_name}")
+        print(f"🎯 Using device: {self.device}")
+        
+        # Swap in the configured CPU backend if it keeps parity with the pipeline
+        backend, backend_report = create_backend(classifier_pipeline, model_name, model_revision)
+        input_size = self._resolve_input_size(classifier_pipeline)
+        if hasattr(backend, "pipeline"):
+            classifier_pipeline = backend.pipeline
+        else:
+            # The ONNX session serves on its own; free the fp32 torch model it was exported from
+            classifier_pipeline = None
+            gc.collect()
+        
+        stage = ClassifierStage(
+            model_name, classifier_pipeline, backend, backend_report, model_revision,
+            label_table, input_size
+        )
+        
+        # Test the model with a simple prediction
+        self._test_model(stage)
+        return stage
+    
+    def _start_replica_pool(self):
+        """Spawn inference replicas; on failure, inference stays in this process"""
+        try:
+            self.replica_pool = self._create_replica_pool(self.stage, self.fast_stage)
+        except Exception as e:
+            print(f"⚠️ Failed to start classifier replicas, using in-process inference: {e}")
+    
+    @staticmethod
+    def _create_replica_pool(stage: ClassifierStage, fast_stage: Optional[ClassifierStage]):
+        from models.replica_pool import ReplicaPool
+        
+        pool = ReplicaPool(
+            REPLICA_CONFIG["replicas"],
+            REPLICA_CONFIG["threads_per_replica"],
+            REPLICA_CONFIG["startup_timeout"],
+            REPLICA_CONFIG["max_quantized_replicas"],
+            INFERENCE_CONFIG["timeout"]
+        )
+        pool.start(stage, fast_stage)
+        return pool
+    
+    def start_model_swap(self, model_name: str, target: str = "full") -> bool:
+        """
+        Replace the active model (target "full") or the cascade's fast model
+        (target "fast") without a restart: the new model loads and warms up on
+        a background thread while the current one keeps serving, then traffic
+        switches over in one step. Returns False if the classifier is not
+        ready or another swap is still running.
+        """
+        with self.model_lock:
+            if self.state != "ready" or (self._swap_thread and self._swap_thread.is_alive()):
+                return False
+            if target == "fast" and self.fast_stage is None:
+                raise ValueError("Cascade is not enabled, there is no fast model to replace")
+            current = self.fast_stage if target == "fast" else self.stage
+            self.swap_status = {
+                "state": "loading",
+                "target": target,
+                "model": model_name,
+                "from": {"model": current.model_name, "version": current.model_version},
+                "to": None,
+                "error": None,
+                "started_at": time.time(),
+                "finished_at": None
+            }
+            self._swap_thread = threading.Thread(
+                target=self._swap_model,
+                args=(model_name, target),
+                name="food-classifier-swap",
+                daemon=True
+            )
+            self._swap_thread.start()
+            return True
+    
+    def _swap_model(self, model_name: str, target: str):
+        status = self.swap_status
+        try:
+            new_stage = self._load_stage(model_name)
+            status["to"] = {"model": new_stage.model_name, "version": new_stage.model_version}
+            
+            status["state"] = "warming"
+            self._warm_up(new_stage)
+            
+            new_pool = None
+            if self.replica_pool is not None:
+                # Replicas need the new weights too; start them before switching
+                stage, fast_stage = (self.stage, new_stage) if target == "fast" else (new_stage, self.fast_stage)
+                new_pool = self._create_replica_pool(stage, fast_stage)
+            
+            with self._stage_lock:
+                if target == "fast":
+                    old_stage, self.fast_stage = self.fast_stage, new_stage
+                else:
+                    old_stage, self.stage = self.stage, new_stage
+                self.input_size = max(stage.input_size for stage in (self.stage, self.fast_stage) if stage)
+                old_pool = self.replica_pool
+                if new_pool is not None:
+                    self.replica_pool = new_pool
+                old_stage.status = "draining"
+                self.previous_stage = old_stage
+            print(f"🔀 Switched {target} model to {new_stage.model_name}@{new_stage.model_version}")
+            
+            status["state"] = "draining"
+            self._drain(old_stage, old_pool if new_pool is not None else None)
+            status["state"] = "done"
+            model_residency.mark_loaded("food_classifier")
+        except Exception as e:
+            print(f"❌ Model swap to {model_name} failed: {e}")
+            status["state"] = "failed"
+            status["error"] = str(e)
+        finally:
+            status["finished_at"] = time.time()
+    
+    def _warm_up(self, stage: ClassifierStage):
+        """_test_model-style probes that must all succeed before a model takes traffic"""
+        samples = load_parity_samples() or synthetic_samples()
+        for _ in range(max(1, HOT_SWAP_CONFIG["warmup_rounds"])):
+            results = stage.backend(samples)
+            if len(results) != len(samples) or not all(result and "label" in result[0] for result in results):
+                raise RuntimeError("Warm-up probe returned malformed predictions")
+        print(f"🔥 Warmed up {stage.model_name} with {len(samples)} probe image(s)")
+    
+    def _drain(self, old_stage: ClassifierStage, old_pool):
+        """Wait for requests still using the old model, then release it"""
+        deadline = time.time() + HOT_SWAP_CONFIG["drain_timeout"]
+        while time.time() < deadline:
+            with self._stage_lock:
+                busy = old_stage.in_flight
+            if old_pool is not None:
+                busy += old_pool.in_flight()
+            if busy == 0:
+                break
+            time.sleep(0.05)
+        else:
+            print(f"⚠️ {old_stage.in_flight} request(s) still on {old_stage.model_name} after drain timeout, releasing anyway")
+        
+        if old_pool is not None:
+            old_pool.shutdown()
+        old_stage.release()
+        gc.collect()
+        print(f"♻️ Released {old_stage.model_name}@{old_stage.model_version}")
+    
+    def _acquire_stages(self) -> Tuple[Optional[ClassifierStage], Optional[ClassifierStage]]:
+        """Current stages, counted as in use until _release_stages"""
+        while True:
+            with self._stage_lock:
+                if self.state != "evicted":
+                    stage, fast_stage = self.stage, self.fast_stage
+                    for loaded in (stage, fast_stage):
+                        if loaded is not None:
+                            loaded.in_flight += 1
+                    return stage, fast_stage
+            # First request after an idle eviction loads the models again
+            print("♻️ Reloading evicted food classifier...")
+            self._initialize_model()
+    
+    def unload(self) -> bool:
+        """
+        Free the weights after an idle period; the next request reloads them.
+        Refuses (returns False) while loading, swapping or serving requests.
+        """
+        if not self.model_lock.acquire(blocking=False):
+            return False
+        try:
+            swapping = self._swap_thread is not None and self._swap_thread.is_alive()
+            if self.state != "ready" or swapping:
+                return False
+            with self._stage_lock:
+                stages = [loaded for loaded in (self.stage, self.fast_stage, self.previous_stage) if loaded is not None]
+                if any(loaded.in_flight for loaded in stages):
+                    return False
+                if self.replica_pool is not None and self.replica_pool.in_flight():
+                    return False
+                # Cached results stay valid: the same models come back on reload
+                self._evicted_identity = self.cache_identity()
+                self.stage = self.fast_stage = self.previous_stage = None
+                pool, self.replica_pool = self.replica_pool, None
+                self.state = "evicted"
+        finally:
+            self.model_lock.release()
+        
+        if pool is not None:
+            pool.shutdown()
+        for loaded in stages:
+            loaded.release()
+        gc.collect()
+        return True
+    
+    def resident_bytes(self) -> int:
+        return sum(loaded.resident_bytes() for loaded in (self.stage, self.fast_stage) if loaded is not None)
+    
+    def _release_stages(self, stage: Optional[ClassifierStage], fast_stage: Optional[ClassifierStage]):
+        with self._stage_lock:
+            for loaded in (stage, fast_stage):
+                if loaded is not None:
+                    loaded.in_flight -= 1
+    
+    def get_version_status(self) -> Dict[str, Any]:
+        """Active and previous model versions, for /ai/model-status"""
+        with self._stage_lock:
+            return {
+                "active": self.stage.describe() if self.stage else None,
+                "fast": self.fast_stage.describe() if self.fast_stage else None,
+                "previous": self.previous_stage.describe() if self.previous_stage else None,
+                "swap": dict(self.swap_status)
+            }
+    
+    def shutdown(self):
+        if self.replica_pool is not None:
+            self.replica_pool.shutdown()
+            self.replica_pool = None
+    
+    def _test_model(self, stage: ClassifierStage):
         """Test the model to ensure it's working"""
         try:
             # Create a simple test image (white square)
             test_image = Image.new('RGB', (224, 224), color='white')
-            test_results = self.classifier_pipeline(test_image)
+            test_results = stage.backend([test_image])[0]
             print(f"🧪 Model test successful, got {len(test_results)} predictions")
         except Exception as e:
             print(f"⚠️ Model test failed: {e}")
     
+    @staticmethod
+    def _resolve_input_size(classifier_pipeline) -> int:
+        """Shortest edge a loaded model's image processor resizes to"""
+        processor = getattr(classifier_pipeline, "image_processor", None)
+        size = getattr(processor, "size", None) or {}
+        if isinstance(size, dict):
+            return int(size.get("shortest_edge") or min(size.get("height", 0), size.get("width", 0)) or DECODE_CONFIG["target_size"])
+        return int(size) if size else DECODE_CONFIG["target_size"]
+    
     def preprocess_image(self, image_bytes: bytes) -> Image.Image:
         """
         Preprocess image for model inference
         """
+        image, _ = self._decode_image(image_bytes)
+        return image
+    
+    def _decode_image(self, image_bytes: bytes) -> Tuple[Image.Image, Dict[str, Any]]:
+        """
+        Decode an upload for inference and report how long it took.
+        In fast mode, returns an image only as large as the model input needs.
+        """
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize if too large (for performance)
-            max_size = 1024
-            if max(image.size) > max_size:
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            return image
-            
+            marks: Dict[str, float] = {}
+            started_at = time.perf_counter()
+            if DECODE_CONFIG["fast_decode"]:
+                image, info = self._decode_fast(image_bytes, marks)
+            else:
+                image = self._decode_full(image_bytes, marks)
+                info = {"mode": "full", "format": None, "scale": 1}
+            finished_at = time.perf_counter()
         except Exception as e:
             raise ValueError(f"Error preprocessing image: {e}")
+        
+        decode_ms = (finished_at - started_at) * 1000
+        info["decoded_size"] = list(image.size)
+        info["decode_ms"] = round(decode_ms, 2)
+        # Share of decode_ms spent shrinking the decoded bitmap
+        info["resize_ms"] = round((finished_at - marks["resize"]) * 1000, 2)
+        if info["mode"] == "fast":
+            info["saved_ms"], info["saved_ms_basis"] = self._saved_decode_ms(image_bytes, info, decode_ms)
+        else:
+            info["saved_ms"], info["saved_ms_basis"] = 0.0, "full_decode"
+        return image, info
+    
+    def _decode_full(self, image_bytes: bytes, marks: Optional[Dict[str, float]] = None) -> Image.Image:
+        """Reference path: full-resolution decode, then LANCZOS thumbnail to 1024px"""
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        
+        # Convert to RGB if necessary
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        if marks is not None:
+            marks["resize"] = time.perf_counter()
+        
+        # Resize if too large (for performance)
+        max_size = 1024
+        if max(image.size) > max_size:
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        return image
+    
+    def _decode_fast(self, image_bytes: bytes, marks: Dict[str, float]) -> Tuple[Image.Image, Dict[str, Any]]:
+        """
+        Decode close to the model input size. JPEGs use DCT-domain scaling
+        (draft mode, 1/2 to 1/8) so the full-resolution bitmap is never built;
+        other formats get a cheap integer box reduction. The pipeline's own
+        resize then finishes the job, so there is no intermediate 1024px step.
+        """
+        image = Image.open(io.BytesIO(image_bytes))
+        original_size = image.size
+        image_format = image.format
+        target = self.input_size
+        
+        if image_format == "JPEG":
+            # Picks the largest reduction that keeps both sides >= target
+            image.draft("RGB", (target, target))
+        image.load()
+        
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        marks["resize"] = time.perf_counter()
+        factor = min(image.size) // target
+        if factor >= 2:
+            image = image.reduce(factor)
+        
+        info = {
+            "mode": "fast",
+            "format": image_format,
+            "original_size": list(original_size),
+            "scale": round(original_size[0] / image.size[0], 2)
+        }
+        return image, info
+    
+    def _saved_decode_ms(self, image_bytes: bytes, info: Dict[str, Any], fast_ms: float) -> Tuple[float, str]:
+        """
+        Estimated time saved versus the full decode path: the full decode's
+        cost per megapixel for this format times the image's megapixels,
+        minus the measured fast decode. The cost starts at the configured
+        default ("default") and is replaced by background measurements
+        ("calibrated"); the request itself never runs the full decode.
+        """
+        image_format = info["format"] or "unknown"
+        megapixels = info["original_size"][0] * info["original_size"][1] / 1_000_000
+        every = DECODE_CONFIG["calibrate_every"]
+        
+        with self._decode_lock:
+            self._decode_count += 1
+            ms_per_mp = self._full_decode_ms_per_mp.get(image_format)
+            sample = every > 0 and (ms_per_mp is None or self._decode_count % every == 0)
+        if sample:
+            self._queue_calibration(image_format, image_bytes, megapixels)
+        
+        if ms_per_mp is None:
+            return round(DECODE_CONFIG["full_decode_ms_per_mp"] * megapixels - fast_ms, 2), "default"
+        return round(ms_per_mp * megapixels - fast_ms, 2), "calibrated"
+    
+    def _queue_calibration(self, image_format: str, image_bytes: bytes, megapixels: float):
+        """Hand a sample to the calibration thread; dropped if it is still busy with the last one"""
+        with self._decode_lock:
+            if self._calibration_thread is None:
+                self._calibration_thread = threading.Thread(
+                    target=self._calibration_loop, name="decode-calibration", daemon=True
+                )
+                self._calibration_thread.start()
+        try:
+            # bytes are immutable, so the sample needs no copy
+            self._calibration_queue.put_nowait((image_format, image_bytes, megapixels))
+        except queue.Full:
+            pass
+    
+    def _calibration_loop(self):
+        """Time full decodes of sampled uploads at the lowest scheduling priority"""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)  # Linux: this thread only
+        except (AttributeError, OSError):
+            pass
+        while True:
+            image_format, image_bytes, megapixels = self._calibration_queue.get()
+            try:
+                started_at = time.perf_counter()
+                self._decode_full(image_bytes)
+                measured = (time.perf_counter() - started_at) * 1000 / max(megapixels, 1e-6)
+            except Exception as e:
+                print(f"⚠️ Decode calibration failed: {e}")
+                continue
+            with self._decode_lock:
+                previous = self._full_decode_ms_per_mp.get(image_format)
+                self._full_decode_ms_per_mp[image_format] = measured if previous is None else 0.8 * previous + 0.2 * measured
     
     def predict(self, image_bytes: bytes, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Advanced AI food classification using specialized models
         """
-        print("🤖 Starting advanced food classification with specialized AI model...")
+        return self.predict_batch([image_bytes], top_k=top_k)[0]
+    
+    def predict_batch(self, image_bytes_list: List[bytes], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Classify several images with a single batched pipeline call.
+        Returns one prediction list per input image, in input order.
+        """
+        if self._replicas_available():
+            return self._call_replica("predict_batch", image_bytes_list, top_k)
+        return [predictions for predictions, _ in self._classify_images(image_bytes_list, top_k)]
+    
+    def _classify_images(self, image_bytes_list: List[bytes], top_k: int) -> List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        """
+        Batched classification returning (predictions, info) per image, where
+        info holds the decode and cascade details and per-stage timings in ms
+        (None for fallback predictions).
+        """
+        print(f"🤖 Starting advanced food classification for {len(image_bytes_list)} image(s)...")
         
-        if self.classifier_pipeline is None:
-            print("⚠️ AI model not available, initializing...")
-            if not self._initialize_model():
-                return self._fallback_prediction()
+        # Hold the stages for the whole call so a hot swap waits for this request to drain
+        with model_residency.in_use("food_classifier"):
+            stage, fast_stage = self._acquire_stages()
+            try:
+                return self._classify_with_stages(stage, fast_stage, image_bytes_list, top_k)
+            finally:
+                self._release_stages(stage, fast_stage)
+    
+    def _classify_with_stages(self, stage: Optional[ClassifierStage], fast_stage: Optional[ClassifierStage],
+                              image_bytes_list: List[bytes], top_k: int) -> List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        if stage is None:
+            # Loading is owned by the background loader; never block a request on it
+            print("⚠️ AI model not available, using fallback")
+            return [(self._fallback_prediction(), None) for _ in image_bytes_list]
+        
+        # Preprocess every image; a broken upload only affects its own result
+        images = []
+        decode_infos = []
+        for image_bytes in image_bytes_list:
+            try:
+                image, decode_info = self._decode_image(image_bytes)
+            except ValueError as e:
+                print(f"⚠️ {e}")
+                image, decode_info = None, None
+            images.append(image)
+            decode_infos.append(decode_info)
+        
+        valid_images = [image for image in images if image is not None]
+        if not valid_images:
+            return [(self._fallback_prediction(), None) for _ in image_bytes_list]
         
         try:
-            # Preprocess image
-            image = self.preprocess_image(image_bytes)
-            print(f"📷 Image preprocessed, size: {image.size}")
-            
-            # Make prediction with specialized food classification model
-            raw_predictions = self.classifier_pipeline(image)
-            print(f"🔮 AI model returned {len(raw_predictions)} predictions")
-            
-            # Process and enhance predictions
-            predictions = []
-            for i, pred in enumerate(raw_predictions[:top_k]):
-                confidence = float(pred['score'])
-                label = pred['label']
-                
-                # Clean and translate the label
-                cleaned_label = self._clean_label(label)
-                translated_label = self._translate_to_indonesian(cleaned_label)
-                
-                # Determine food category
-                category = self._determine_food_category(cleaned_label)
-                
-                prediction = {
-                    "food_type": translated_label,
-                    "confidence": confidence,
-                    "category": category,
-                    "source": "specialized_ai",
-                    "original_label": label,
-                    "cleaned_label": cleaned_label,
-                    "category_id": i
+            forward_started = time.perf_counter()
+            answers = self._forward(stage, fast_stage, valid_images)
+            forward_ms = round((time.perf_counter() - forward_started) * 1000, 2)
+            print(f"🔮 AI model returned predictions for {len(answers)} image(s)")
+        except Exception as e:
+            print(f"❌ Error during AI food classification: {e}")
+            return [(self._fallback_prediction(), None) for _ in image_bytes_list]
+        
+        results = []
+        answer_iter = iter(answers)
+        for image, decode_info in zip(images, decode_infos):
+            if image is None:
+                results.append((self._fallback_prediction(), None))
+                continue
+            raw, answered_by, source, cascade_info = next(answer_iter)
+            postprocess_started = time.perf_counter()
+            predictions = self._process_predictions(raw, top_k, answered_by, source)
+            results.append((predictions, {
+                "decode": decode_info,
+                "cascade": cascade_info,
+                # The stage that answered: with the cascade this may be the fast model's backend
+                "inference_backend": answered_by.backend.name,
+                "timings": {
+                    "decode_ms": round(decode_info["decode_ms"] - decode_info["resize_ms"], 2),
+                    "resize_ms": decode_info["resize_ms"],
+                    # The whole batch's forward pass, which this image waited for
+                    "forward_ms": forward_ms,
+                    "postprocess_ms": round((time.perf_counter() - postprocess_started) * 1000, 3)
                 }
+            }))
+        
+        print(f"🎉 Advanced AI food classification complete: {len(results)} image(s)")
+        return results
+    
+    def _forward(self, stage: ClassifierStage, fast_stage: Optional[ClassifierStage],
+                 images: List[Image.Image]) -> List[Tuple[List[Dict[str, Any]], ClassifierStage, str, Optional[Dict[str, Any]]]]:
+        """Raw predictions for decoded images as (raw, stage, source, cascade_info)"""
+        if fast_stage is not None:
+            return self._run_cascade(fast_stage, stage, images)
+        # One forward pass over the whole batch
+        return [(raw, stage, "specialized_ai", None) for raw in stage.backend(images)]
+    
+    def predict_multi_item(self, image_bytes: bytes, grid: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Detect several foods in one photo (a fridge shelf, a table spread).
+        The image is cut into a grid x grid set of overlapping tiles which,
+        together with the whole image, are classified in a single batched
+        forward pass. Labels found in several tiles are merged into one item
+        carrying its best confidence and the tiles it was seen in.
+        """
+        if self._replicas_available():
+            return self._call_replica("predict_multi_item", image_bytes, grid)
+        
+        grid = min(max(1, grid or MULTI_ITEM_CONFIG["grid"]), MULTI_ITEM_CONFIG["max_grid"])
+        overlap = MULTI_ITEM_CONFIG["overlap"]
+        
+        with model_residency.in_use("food_classifier"):
+            stage, fast_stage = self._acquire_stages()
+            try:
+                if stage is None:
+                    print("⚠️ AI model not available, using fallback")
+                    return self._build_multi_item([(self._fallback_prediction(), None)], grid, {})
                 
-                predictions.append(prediction)
-                print(f"  {i+1}. {cleaned_label} -> {translated_label} ({confidence:.4f}) [{category}]")
+                decode_started = time.perf_counter()
+                try:
+                    image = self._decode_for_tiles(image_bytes, grid, overlap)
+                except Exception as e:
+                    raise ValueError(f"Error preprocessing image: {e}")
+                boxes = self._tile_boxes(image.size, grid, overlap)
+                crops = [image.crop(box) for box in boxes]
+                if MULTI_ITEM_CONFIG["include_full_image"] and grid > 1:
+                    crops.append(image)
+                decode_ms = round((time.perf_counter() - decode_started) * 1000, 2)
+                
+                forward_started = time.perf_counter()
+                try:
+                    answers = self._forward(stage, fast_stage, crops)
+                except Exception as e:
+                    print(f"❌ Error during AI food classification: {e}")
+                    return self._build_multi_item([(self._fallback_prediction(), None)], grid, {})
+                forward_ms = round((time.perf_counter() - forward_started) * 1000, 2)
+                print(f"🔮 AI model returned predictions for {len(answers)} tile(s)")
+            finally:
+                self._release_stages(stage, fast_stage)
+        
+        postprocess_started = time.perf_counter()
+        tiles = []
+        for i, (raw, answered_by, source, _) in enumerate(answers):
+            # Tiles past the grid are the whole image, reported without a position
+            position = divmod(i, grid) if i < len(boxes) else None
+            predictions = self._process_predictions(raw, MULTI_ITEM_CONFIG["labels_per_tile"], answered_by, source)
+            tiles.append((predictions, position))
+        
+        result = self._build_multi_item(tiles, grid, {
+            "decoded_size": list(image.size),
+            "tiles": len(crops),
+            "model_type": stage.model_name,
+            # Tiles the cascade settled on the fast model ran on its backend
+            "inference_backend": "+".join(sorted({answered_by.backend.name for _, answered_by, _, _ in answers}))
+        })
+        result["processing_metadata"]["stage_timings"] = {
+            "decode_ms": decode_ms,
+            "forward_ms": forward_ms,
+            "postprocess_ms": round((time.perf_counter() - postprocess_started) * 1000, 3)
+        }
+        return result
+    
+    def _decode_for_tiles(self, image_bytes: bytes, grid: int, overlap: float) -> Image.Image:
+        """Decode at just enough resolution for each tile to cover the model input"""
+        image = Image.open(io.BytesIO(image_bytes))
+        # Shortest image side at which a tile's shortest side equals the model input
+        needed = int(self.input_size * (grid - (grid - 1) * overlap))
+        if image.format == "JPEG":
+            image.draft("RGB", (needed, needed))
+        image.load()
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        factor = min(image.size) // needed
+        if factor >= 2:
+            image = image.reduce(factor)
+        return image
+    
+    @staticmethod
+    def _tile_boxes(size: Tuple[int, int], grid: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+        """Row-major (left, top, right, bottom) boxes of grid x grid tiles overlapping by `overlap`"""
+        width, height = size
+        tile_width = width / (grid - (grid - 1) * overlap)
+        tile_height = height / (grid - (grid - 1) * overlap)
+        boxes = []
+        for row in range(grid):
+            for col in range(grid):
+                left = col * tile_width * (1 - overlap)
+                top = row * tile_height * (1 - overlap)
+                boxes.append((
+                    int(left), int(top),
+                    min(width, int(round(left + tile_width))), min(height, int(round(top + tile_height)))
+                ))
+        return boxes
+    
+    def _build_multi_item(self, tiles: List[Tuple[List[Dict[str, Any]], Optional[Tuple[int, int]]]],
+                          grid: int, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge per-tile predictions into distinct items, best confidence first"""
+        min_confidence = MULTI_ITEM_CONFIG["min_confidence"]
+        items: Dict[str, Dict[str, Any]] = {}
+        for predictions, position in tiles:
+            for prediction in predictions:
+                if prediction["confidence"] < min_confidence and prediction["source"] != "fallback":
+                    continue
+                # Same food from neighbouring tiles (or from the whole image) is one item
+                key = prediction["food_type"].lower()
+                item = items.get(key)
+                if item is None:
+                    item = items[key] = {
+                        "food_type": prediction["food_type"],
+                        "confidence": prediction["confidence"],
+                        "category": prediction["category"],
+                        "source": prediction["source"],
+                        "original_label": prediction["original_label"],
+                        "tiles": []
+                    }
+                elif prediction["confidence"] > item["confidence"]:
+                    item["confidence"] = prediction["confidence"]
+                    item["source"] = prediction["source"]
+                if position is not None and list(position) not in item["tiles"]:
+                    item["tiles"].append(list(position))
+        
+        detected = sorted(items.values(), key=lambda item: item["confidence"], reverse=True)
+        detected = detected[:MULTI_ITEM_CONFIG["max_items"]]
+        for item in detected:
+            item["confidence_level"] = self._get_confidence_level(item["confidence"])
+            item["tile_count"] = len(item["tiles"])
+        
+        return {
+            "items": detected,
+            "total_items": len(detected),
+            "grid": [grid, grid],
+            "processing_metadata": {
+                **metadata,
+                "overlap": MULTI_ITEM_CONFIG["overlap"],
+                "min_confidence": min_confidence,
+                "device_used": str(self.device)
+            }
+        }
+    
+    def _run_cascade(self, fast_stage: ClassifierStage, stage: ClassifierStage, images: List[Image.Image]) -> List[Tuple[List[Dict[str, Any]], ClassifierStage, str, Dict[str, Any]]]:
+        """
+        Run the fast model on the whole batch, then send only the images whose
+        top confidence is below the cascade threshold through the accurate
+        model, in one batched call. Returns (raw, stage, source, cascade_info)
+        per image.
+        """
+        fast_raw = fast_stage.backend(images)
+        fast_confidences = [float(raw[0]["score"]) if raw else 0.0 for raw in fast_raw]
+        escalate = [i for i, confidence in enumerate(fast_confidences) if confidence < self.cascade_threshold]
+        
+        answers = [
+            (raw, fast_stage, "cascade_fast", {"stage": "fast", "model": fast_stage.model_name, "fast_confidence": confidence})
+            for raw, confidence in zip(fast_raw, fast_confidences)
+        ]
+        if escalate:
+            full_raw = stage.backend([images[i] for i in escalate])
+            for i, raw in zip(escalate, full_raw):
+                answers[i] = (raw, stage, "cascade_full", {"stage": "full", "model": stage.model_name, "fast_confidence": fast_confidences[i]})
+        
+        with self._cascade_lock:
+            self._cascade_fast_answers += len(images) - len(escalate)
+            self._cascade_escalations += len(escalate)
+        return answers
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        with self._cascade_lock:
+            answered = self._cascade_fast_answers + self._cascade_escalations
+            return {
+                "enabled": self.fast_stage is not None,
+                "fast_model": self.fast_stage.model_name if self.fast_stage else None,
+                "full_model": self.model_name,
+                "min_confidence_level": CASCADE_CONFIG["min_confidence_level"],
+                "threshold": self.cascade_threshold,
+                "fast_answers": self._cascade_fast_answers,
+                "escalations": self._cascade_escalations,
+                "fast_answer_rate": round(self._cascade_fast_answers / max(1, answered), 4)
+            }
+    
+    def _process_predictions(self, raw_predictions: List[Dict[str, Any]], top_k: int,
+                             stage: ClassifierStage, source: str = "specialized_ai") -> List[Dict[str, Any]]:
+        """Clean, translate and categorize raw pipeline output for one image"""
+        predictions = []
+        for i, pred in enumerate(raw_predictions[:top_k]):
+            confidence = float(pred['score'])
+            label = pred['label']
             
-            print(f"🎉 Advanced AI food classification complete: {len(predictions)} predictions")
-            return predictions
+            # Clean, translate and categorize (precomputed for the model's labels)
+            cleaned_label, translated_label, category = self._resolve_label(label, stage.label_table)
             
-        except Exception as e:
-            print(f"❌ Error during AI food classification: {e}")
-            return self._fallback_prediction()
+            prediction = {
+                "food_type": translated_label,
+                "confidence": confidence,
+                "category": category,
+                "source": source,
+                "original_label": label,
+                "cleaned_label": cleaned_label,
+                "category_id": i
+            }
+            
+            predictions.append(prediction)
+        
+        return predictions
+    
+    def _compile_label_matchers(self):
+        """
+        Compile translation and category keywords into single regexes.
+        Each pattern is a lookahead alternation in dictionary order, so one
+        scan finds every (possibly overlapping) keyword; taking the lowest
+        dictionary index among the hits gives the same answer as the
+        original first-match-in-order loops.
+        """
+        def lookahead(words: List[str]) -> "re.Pattern":
+            return re.compile("(?=(" + "|".join(re.escape(word) for word in words) + "))")
+        
+        translation_keys = list(self.translation_dict.keys())
+        self._translation_values = list(self.translation_dict.values())
+        self._translation_index = {word: i for i, word in enumerate(translation_keys)}
+        self._translation_pattern = lookahead(translation_keys)
+        
+        # Partial matches only matter for multi-word keys; single words were tried above
+        self._translation_part_index: Dict[str, int] = {}
+        for i, word in enumerate(translation_keys):
+            if " " in word:
+                for part in word.split():
+                    self._translation_part_index.setdefault(part, i)
+        self._translation_part_pattern = lookahead(list(self._translation_part_index)) if self._translation_part_index else None
+        
+        self._category_names = list(self.category_keywords.keys())
+        self._category_index: Dict[str, int] = {}
+        for i, keywords in enumerate(self.category_keywords.values()):
+            for keyword in keywords:
+                self._category_index.setdefault(keyword, i)
+        self._category_pattern = lookahead(list(self._category_index))
+    
+    @staticmethod
+    def _first_in_order(pattern: Optional["re.Pattern"], index: Dict[str, int], text: str) -> Optional[int]:
+        """Lowest dictionary index of any keyword found in text"""
+        if pattern is None:
+            return None
+        return min((index[match.group(1)] for match in pattern.finditer(text)), default=None)
+    
+    def _build_label_table(self, labels) -> Dict[str, Tuple[str, str, str]]:
+        """Precompute (cleaned, translated, category) for every label the model can emit"""
+        table = {}
+        for label in labels:
+            cleaned_label = self._clean_label(label)
+            table[label] = (
+                cleaned_label,
+                self._translate_to_indonesian(cleaned_label),
+                self._determine_food_category(cleaned_label)
+            )
+        return table
+    
+    def _resolve_label(self, label: str, label_table: Dict[str, Tuple[str, str, str]]) -> Tuple[str, str, str]:
+        """(cleaned, translated, category) for a raw model label"""
+        resolved = label_table.get(label)
+        if resolved is not None:
+            return resolved
+        cleaned_label = self._clean_label(label)
+        return cleaned_label, self._translate_to_indonesian(cleaned_label), self._determine_food_category(cleaned_label)
     
     def _clean_label(self, label: str) -> str:
         """Clean up model prediction labels"""
@@ -210,36 +1074,23 @@ class FoodClassifier:
         english_lower = english_text.lower()
         
         # Direct translation lookup
-        for eng_word, indo_word in self.translation_dict.items():
-            if eng_word in english_lower:
-                return indo_word
+        match = self._first_in_order(self._translation_pattern, self._translation_index, english_lower)
+        if match is not None:
+            return self._translation_values[match]
         
         # Try partial matches for compound foods
-        for eng_word, indo_word in self.translation_dict.items():
-            if any(part in english_lower for part in eng_word.split()):
-                return f"{indo_word} (variant)"
+        match = self._first_in_order(self._translation_part_pattern, self._translation_part_index, english_lower)
+        if match is not None:
+            return f"{self._translation_values[match]} (variant)"
         
         # If no translation found, return cleaned English
         return self._clean_label(english_text)
     
     def _determine_food_category(self, food_name: str) -> str:
         """Determine food category based on the food name"""
-        food_lower = food_name.lower()
-        
-        # Category keywords
-        categories = {
-            "buah": ["fruit", "apple", "banana", "orange", "strawberry", "grape", "mango"],
-            "sayuran": ["vegetable", "broccoli", "carrot", "tomato", "onion", "spinach", "lettuce"],
-            "protein": ["meat", "chicken", "fish", "beef", "pork", "egg", "tofu", "tempeh"],
-            "karbohidrat": ["rice", "bread", "noodle", "pasta", "potato", "wheat", "oats"],
-            "dairy": ["milk", "cheese", "butter", "yogurt"],
-            "makanan_siap": ["pizza", "burger", "sandwich", "cake", "cookie", "soup"],
-            "minuman": ["coffee", "tea", "juice", "water", "soda", "wine", "beer"]
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in food_lower for keyword in keywords):
-                return category
+        match = self._first_in_order(self._category_pattern, self._category_index, food_name.lower())
+        if match is not None:
+            return self._category_names[match]
         
         return "lainnya"  # Other
     
@@ -261,8 +1112,40 @@ class FoodClassifier:
         """
         Complete food analysis using advanced AI models
         """
-        predictions = self.predict(image_bytes, top_k=5)
+        return self.predict_food_categories_batch([image_bytes])[0]
+    
+    def predict_food_categories_batch(self, image_bytes_list: List[bytes]) -> List[Dict[str, Any]]:
+        """
+        Complete food analysis for several images sharing one forward pass
+        """
+        if self._replicas_available():
+            return self._call_replica("predict_food_categories_batch", image_bytes_list)
+        analyses = []
+        for predictions, info in self._classify_images(image_bytes_list, top_k=5):
+            started_at = time.perf_counter()
+            analysis = self._build_analysis(predictions, info)
+            if info is not None:
+                info["timings"]["postprocess_ms"] = round(info["timings"]["postprocess_ms"] + (time.perf_counter() - started_at) * 1000, 3)
+            analyses.append(analysis)
+        return analyses
+    
+    def _replicas_available(self) -> bool:
+        return self.replica_pool is not None and self.replica_pool.is_available()
+    
+    def _call_replica(self, method: str, *args):
+        """Run a batch method on the least-loaded replica, or here if the replicas are gone"""
+        from models.replica_pool import ReplicaUnavailableError
         
+        try:
+            with model_residency.in_use("food_classifier"):
+                return self.replica_pool.call(method, *args)
+        except ReplicaUnavailableError as e:
+            # Retries on another live replica, or in-process once none are left
+            print(f"⚠️ {e}, retrying")
+            return getattr(self, method)(*args)
+    
+    def _build_analysis(self, predictions: List[Dict[str, Any]], info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the full analysis dict from one image's predictions"""
         # Get the top prediction
         top_prediction = predictions[0] if predictions else self._fallback_prediction()[0]
         
@@ -279,7 +1162,7 @@ class FoodClassifier:
                 } 
                 for p in predictions[1:] if p["confidence"] > 0.1
             ],
-            "is_food": top_prediction["confidence"] > 0.15,  # Reasonable threshold
+            "is_food": top_prediction["confidence"] > self.IS_FOOD_THRESHOLD,
             "confidence_level": self._get_confidence_level(top_prediction["confidence"]),
             "detailed_predictions": predictions,
             "ai_model": "specialized_food_classifier",
@@ -287,7 +1170,11 @@ class FoodClassifier:
             "processing_metadata": {
                 "total_predictions": len(predictions),
                 "model_type": "transformer_based",
-                "device_used": str(self.device)
+                "inference_backend": info["inference_backend"] if info else None,
+                "device_used": str(self.device),
+                "decode": info["decode"] if info else None,
+                "cascade": info["cascade"] if info else None,
+                "stage_timings": info["timings"] if info else None
             }
         }
         
@@ -295,43 +1182,30 @@ class FoodClassifier:
     
     def _get_confidence_level(self, confidence: float) -> str:
         """Get human-readable confidence level"""
-        if confidence >= 0.8:
-            return "sangat_yakin"  # Very confident
-        elif confidence >= 0.6:
-            return "yakin"        # Confident
-        elif confidence >= 0.4:
-            return "cukup_yakin"  # Somewhat confident
-        elif confidence >= 0.2:
-            return "kurang_yakin" # Not very confident
-        else:
-            return "tidak_yakin"  # Not confident
+        for threshold, level in self.CONFIDENCE_LEVELS:
+            if confidence >= threshold:
+                return level
+        return "tidak_yakin"  # Not confident
+    
+    def _confidence_threshold(self, level: str) -> float:
+        """Minimum confidence for a named level (or "is_food" for the food threshold)"""
+        if level == "is_food":
+            return self.IS_FOOD_THRESHOLD
+        for threshold, name in self.CONFIDENCE_LEVELS:
+            if name == level:
+                return threshold
+        print(f"⚠️ Unknown confidence level '{level}', using 'yakin'")
+        return self._confidence_threshold("yakin")
     
     def get_nutritional_info(self, food_type: str) -> Dict[str, Any]:
         """Get basic nutritional information for detected food"""
-        # Basic nutritional database (could be expanded)
-        nutrition_db = {
-            "pisang": {"kalori": 89, "karbohidrat": 23, "protein": 1, "lemak": 0.3},
-            "apel": {"kalori": 52, "karbohidrat": 14, "protein": 0.3, "lemak": 0.2},
-            "nasi": {"kalori": 130, "karbohidrat": 28, "protein": 2.7, "lemak": 0.3},
-            "ayam": {"kalori": 165, "karbohidrat": 0, "protein": 31, "lemak": 3.6},
-            "telur": {"kalori": 155, "karbohidrat": 1, "protein": 13, "lemak": 11}
-        }
-        
-        food_lower = food_type.lower()
-        for food_key, nutrition in nutrition_db.items():
-            if food_key in food_lower:
-                return {
-                    "found": True,
-                    "food": food_type,
-                    "nutrition": nutrition,
-                    "per_serving": "100g"
-                }
-        
-        return {
-            "found": False,
-            "food": food_type,
-            "message": "Data nutrisi tidak tersedia"
-        }
+        return nutrition_store.lookup(food_type)
 
-# Global classifier instance
-food_classifier = FoodClassifier()
\ No newline at end of file
+# Global classifier instance (model loads via start_background_load)
+food_classifier = FoodClassifier()
+model_residency.register(
+    "food_classifier",
+    food_classifier.unload,
+    food_classifier.resident_bytes,
+    RESIDENCY_CONFIG["classifier_idle_timeout"]
+)
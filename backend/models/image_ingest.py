@@ -0,0 +1,178 @@
+"""
+Streaming, size-capped ingestion of uploaded images
+"""
+import io
+import json
+import warnings
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import UploadFile
+from PIL import Image, UnidentifiedImageError
+from config.ai import UPLOAD_CONFIG
+
+ALLOWED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "BMP", "GIF"}
+
+class UploadRejectedError(Exception):
+    """An upload failed validation; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def sniff_image_header(data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Read format and pixel dimensions from the start of an image without
+    decoding any pixel data. Returns None if data does not yet contain the
+    whole header.
+    """
+    try:
+        with warnings.catch_warnings():
+            # Size limits are enforced by validate_image_header instead
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as image:
+                return {"format": image.format, "width": image.size[0], "height": image.size[1]}
+    except Image.DecompressionBombError:
+        raise UploadRejectedError(413, "Resolusi gambar terlalu besar")
+    except (UnidentifiedImageError, SyntaxError, OSError, ValueError, EOFError):
+        return None
+
+def validate_image_header(header: Dict[str, Any]):
+    """Reject unsupported formats and oversized images before anything is decoded"""
+    if header["format"] not in ALLOWED_FORMATS:
+        raise UploadRejectedError(415, f"Format gambar {header['format']} tidak didukung")
+    if max(header["width"], header["height"]) > UPLOAD_CONFIG["max_side"]:
+        raise UploadRejectedError(413, "Dimensi gambar terlalu besar")
+    if header["width"] * header["height"] > UPLOAD_CONFIG["max_pixels"]:
+        raise UploadRejectedError(413, "Resolusi gambar terlalu besar")
+
+def inspect_image_bytes(data: bytes) -> Dict[str, Any]:
+    """Validate an image that is already fully in memory (e.g. a zip entry)"""
+    if len(data) == 0:
+        raise UploadRejectedError(400, "File gambar kosong")
+    if len(data) > UPLOAD_CONFIG["max_bytes"]:
+        raise UploadRejectedError(413, "Ukuran file gambar terlalu besar")
+    header = sniff_image_header(data)
+    if header is None:
+        raise UploadRejectedError(400, "File bukan gambar yang valid")
+    validate_image_header(header)
+    return {"data": data, "size": len(data), **header}
+
+async def iter_upload_chunks(file: UploadFile, max_bytes: int, too_large_detail: str) -> AsyncIterator[bytes]:
+    """Yield an upload in chunks, aborting as soon as it exceeds max_bytes"""
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise UploadRejectedError(413, too_large_detail)
+
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CONFIG["chunk_size"])
+        if not chunk:
+            return
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejectedError(413, too_large_detail)
+        yield chunk
+
+def join_chunks(chunks: List[bytes]) -> bytes:
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """Read a non-image upload (e.g. a zip archive) with a hard byte cap"""
+    chunks = [chunk async for chunk in iter_upload_chunks(file, max_bytes, "Ukuran file terlalu besar")]
+    return join_chunks(chunks) if chunks else b""
+
+async def read_image_upload(file: UploadFile) -> Dict[str, Any]:
+    """
+    Stream an image upload with a hard byte cap. The header is sniffed from
+    the first chunks, so wrong formats, oversized dimensions and
+    decompression bombs are rejected before the rest is read or decoded.
+
+    By the time this runs Starlette has already spooled the whole multipart
+    body, so the cap here only bounds the read-back into memory. The request
+    body itself is capped earlier by UploadSizeLimitMiddleware.
+
+    Returns {"data", "size", "format", "width", "height"}. data is a single
+    bytes object (the chunks joined once, or the only chunk as-is), which
+    io.BytesIO and hashlib can use without copying it again.
+    """
+    chunks: List[bytes] = []
+    total = 0
+    header = None
+    async for chunk in iter_upload_chunks(file, UPLOAD_CONFIG["max_bytes"], "Ukuran file gambar terlalu besar"):
+        chunks.append(chunk)
+        total += len(chunk)
+
+        if header is None:
+            header = sniff_image_header(join_chunks(chunks))
+            if header is not None:
+                validate_image_header(header)
+            elif total >= UPLOAD_CONFIG["max_header_bytes"]:
+                raise UploadRejectedError(400, "File bukan gambar yang valid")
+
+    if total == 0:
+        raise UploadRejectedError(400, "File gambar kosong")
+    if header is None:
+        raise UploadRejectedError(400, "File bukan gambar yang valid")
+
+    return {"data": join_chunks(chunks), "size": total, **header}
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that caps request bodies on upload endpoints before
+    Starlette spools them: a declared Content-Length over the limit is
+    refused outright, and bodies without one (chunked) are counted as they
+    arrive and cut off with a 413 as soon as they pass it.
+
+    limits maps full request paths to their largest accepted body in bytes;
+    other paths pass through untouched.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    await self._reject(send)
+                    return
+                break
+
+        state = {"received": 0, "rejected": False, "response_started": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request" and not state["rejected"]:
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > limit:
+                    state["rejected"] = True
+                    if not state["response_started"]:
+                        await self._reject(send)
+                    # The app sees a disconnect and stops parsing; whatever it answers is dropped
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if state["rejected"]:
+                return
+            if message["type"] == "http.response.start":
+                state["response_started"] = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": "Ukuran permintaan terlalu besar"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,244 @@
+"""
+Pluggable inference backends for the food classifier
+"""
+import os
+import re
+from typing import Any, Callable, Dict, List
+import numpy as np
+from PIL import Image
+from config.ai import BACKEND_CONFIG
+
+# Number of labels every backend returns per image (same as the pipeline's top_k)
+RAW_TOP_K = 10
+
+class PipelineBackend:
+    """Reference backend: the float32 transformers pipeline as loaded"""
+    name = "pipeline"
+
+    def __init__(self, classifier_pipeline):
+        self.pipeline = classifier_pipeline
+
+    def __call__(self, images: List[Image.Image]) -> List[List[Dict[str, Any]]]:
+        return self.pipeline(images, batch_size=len(images))
+
+class QuantizedTorchBackend(PipelineBackend):
+    """
+    Dynamic INT8 quantization of the model's Linear layers. Weights are stored
+    as int8 and activations quantized on the fly, which roughly quarters the
+    Linear weight memory and speeds up CPU matmuls.
+    """
+    name = "quantized"
+
+    def __init__(self, classifier_pipeline, already_quantized: bool = False):
+        import torch
+        from transformers import pipeline
+
+        if already_quantized:
+            # e.g. a replica process receiving the model quantized by its parent
+            super().__init__(classifier_pipeline)
+            return
+
+        quantized_model = torch.quantization.quantize_dynamic(
+            classifier_pipeline.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(pipeline(
+            "image-classification",
+            model=quantized_model,
+            image_processor=classifier_pipeline.image_processor,
+            device=-1,
+            top_k=RAW_TOP_K
+        ))
+
+class OnnxRuntimeBackend:
+    """
+    Runs an ONNX export of the model with ONNX Runtime on CPU. The export is
+    written once per model name/version under BACKEND_CONFIG["onnx_dir"] and
+    reused on later starts. Preprocessing still uses the model's own image
+    processor, so inputs match the reference pipeline exactly.
+    """
+    name = "onnx"
+
+    def __init__(self, image_processor, id2label: Dict[int, str], onnx_path: str):
+        import onnxruntime as ort
+
+        # Holds no torch objects, so the fp32 model can be freed once the session is open
+        self.image_processor = image_processor
+        self.id2label = id2label
+        self.onnx_path = onnx_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if BACKEND_CONFIG["num_threads"] > 0:
+            options.intra_op_num_threads = BACKEND_CONFIG["num_threads"]
+        self.session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+
+    @classmethod
+    def from_pipeline(cls, classifier_pipeline, model_name: str, model_version: str) -> "OnnxRuntimeBackend":
+        """Export the pipeline's model (or reuse an earlier export) and open a session on it"""
+        onnx_path = cls._export(classifier_pipeline, model_name, model_version)
+        return cls(classifier_pipeline.image_processor, classifier_pipeline.model.config.id2label, onnx_path)
+
+    @staticmethod
+    def _export(classifier_pipeline, model_name: str, model_version: str) -> str:
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{model_name}@{model_version}")
+        onnx_path = os.path.join(BACKEND_CONFIG["onnx_dir"], f"{safe_name}.onnx")
+        if os.path.exists(onnx_path):
+            return onnx_path
+
+        import torch
+
+        print(f"📦 Exporting {model_name} to ONNX: {onnx_path}")
+        os.makedirs(BACKEND_CONFIG["onnx_dir"], exist_ok=True)
+        model = classifier_pipeline.model.eval()
+        dummy = classifier_pipeline.image_processor(
+            images=[Image.new("RGB", (224, 224), color="white")], return_tensors="pt"
+        )["pixel_values"]
+
+        class LogitsOnly(torch.nn.Module):
+            def __init__(self, wrapped):
+                super().__init__()
+                self.wrapped = wrapped
+
+            def forward(self, pixel_values):
+                return self.wrapped(pixel_values=pixel_values).logits
+
+        tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                LogitsOnly(model),
+                (dummy,),
+                tmp_path,
+                input_names=["pixel_values"],
+                output_names=["logits"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=14
+            )
+        os.replace(tmp_path, onnx_path)
+        return onnx_path
+
+    def __call__(self, images: List[Image.Image]) -> List[List[Dict[str, Any]]]:
+        pixel_values = self.image_processor(images=images, return_tensors="np")["pixel_values"]
+        logits = self.session.run(["logits"], {"pixel_values": pixel_values.astype(np.float32)})[0]
+
+        # Softmax, as the image-classification pipeline applies for single-label models
+        logits = logits - logits.max(axis=1, keepdims=True)
+        scores = np.exp(logits)
+        scores /= scores.sum(axis=1, keepdims=True)
+
+        results = []
+        for row in scores:
+            top = np.argsort(-row)[:RAW_TOP_K]
+            results.append([{"label": self.id2label[int(i)], "score": float(row[i])} for i in top])
+        return results
+
+def load_parity_samples() -> List[Image.Image]:
+    """
+    Real images for the parity check, from the configured sample directory.
+    Empty when no directory is configured: agreement on synthetic images says
+    nothing about agreement on food photos, so there is nothing to compare on.
+    """
+    sample_dir = BACKEND_CONFIG["parity_sample_dir"]
+    max_samples = BACKEND_CONFIG["parity_max_samples"]
+    samples = []
+    if sample_dir and os.path.isdir(sample_dir):
+        for file_name in sorted(os.listdir(sample_dir)):
+            if len(samples) >= max_samples:
+                break
+            try:
+                with Image.open(os.path.join(sample_dir, file_name)) as image:
+                    samples.append(image.convert("RGB"))
+            except Exception:
+                continue
+    return samples
+
+def synthetic_samples() -> List[Image.Image]:
+    """A few flat colours and a gradient, for smoke tests that only check a backend runs"""
+    gradient = np.tile(np.linspace(0, 255, 224, dtype=np.uint8), (224, 1))
+    return [
+        Image.new("RGB", (224, 224), color="white"),
+        Image.new("RGB", (224, 224), color=(200, 40, 30)),
+        Image.new("RGB", (224, 224), color=(60, 160, 50)),
+        Image.fromarray(np.stack([gradient, gradient.T, 255 - gradient], axis=2)),
+    ]
+
+def check_parity(reference: Callable, candidate: Callable, samples: List[Image.Image]) -> Dict[str, Any]:
+    """Compare a candidate backend with the reference on the sample set"""
+    reference_results = reference(samples)
+    candidate_results = candidate(samples)
+
+    agreements = 0
+    score_diffs = []
+    for ref, cand in zip(reference_results, candidate_results):
+        if ref[0]["label"] == cand[0]["label"]:
+            agreements += 1
+        cand_scores = {p["label"]: p["score"] for p in cand}
+        score_diffs.append(abs(ref[0]["score"] - cand_scores.get(ref[0]["label"], 0.0)))
+
+    top1_agreement = agreements / max(1, len(samples))
+    return {
+        "samples": len(samples),
+        "top1_agreement": round(top1_agreement, 4),
+        "max_top1_score_diff": round(max(score_diffs, default=0.0), 4),
+        "status": "passed" if top1_agreement >= BACKEND_CONFIG["parity_min_agreement"] else "failed"
+    }
+
+def create_backend(classifier_pipeline, model_name: str, model_version: str):
+    """
+    Build the configured backend for a freshly loaded pipeline.
+    Returns (backend, report). Optimized backends must not fail the parity
+    check against the reference pipeline; otherwise the reference is used.
+    Without real sample images the check cannot run, so the candidate is only
+    smoke-tested and report["parity"] says "unverified" rather than "passed".
+    """
+    reference = PipelineBackend(classifier_pipeline)
+    requested = BACKEND_CONFIG["backend"]
+    report: Dict[str, Any] = {
+        "requested": requested, "active": reference.name, "parity": None, "parity_details": None, "error": None
+    }
+
+    if BACKEND_CONFIG["num_threads"] > 0:
+        import torch
+        torch.set_num_threads(BACKEND_CONFIG["num_threads"])
+
+    if requested == reference.name:
+        return reference, report
+
+    try:
+        if requested == QuantizedTorchBackend.name:
+            candidate = QuantizedTorchBackend(classifier_pipeline)
+        elif requested == OnnxRuntimeBackend.name:
+            candidate = OnnxRuntimeBackend.from_pipeline(classifier_pipeline, model_name, model_version)
+        else:
+            raise ValueError(f"Unknown inference backend '{requested}'")
+
+        samples = load_parity_samples()
+        if samples:
+            report["parity_details"] = check_parity(reference, candidate, samples)
+            report["parity"] = report["parity_details"]["status"]
+            print(f"⚖️ Parity check for {requested} backend: {report['parity_details']}")
+            if report["parity"] != "passed":
+                print(f"⚠️ {requested} backend failed the parity check, using the reference pipeline")
+                return reference, report
+        else:
+            candidate(synthetic_samples())
+            report["parity"] = "unverified"
+            print(f"⚠️ No parity samples (set AI_PARITY_SAMPLE_DIR), {requested} backend is active but unverified")
+
+        report["active"] = candidate.name
+        return candidate, report
+
+    except Exception as e:
+        print(f"⚠️ Could not create {requested} backend: {e}")
+        report["error"] = str(e)
+        return reference, report
+
+def restore_backend(backend_name: str, classifier_pipeline):
+    """
+    Rebuild a torch backend that create_backend already validated, around a
+    pipeline whose model is already converted (quantized models arrive
+    quantized). No parity check. ONNX backends are rebuilt directly from
+    their export with OnnxRuntimeBackend(...), as they carry no torch model.
+    """
+    if backend_name == QuantizedTorchBackend.name:
+        return QuantizedTorchBackend(classifier_pipeline, already_quantized=True)
+    return PipelineBackend(classifier_pipeline)
@@ -0,0 +1,155 @@
+"""
+Bounded executor for blocking AI inference work
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+from config.ai import CHAT_INFERENCE_CONFIG, INFERENCE_CONFIG
+
+class InferenceQueueFullError(Exception):
+    """Raised when the executor already holds as many jobs as it may queue"""
+    pass
+
+class InferenceTimeoutError(Exception):
+    """Raised when a job does not finish within the executor timeout"""
+    pass
+
+class InferenceExecutor:
+    """
+    Runs blocking model calls on a dedicated thread pool so async handlers
+    can await them without freezing the event loop.
+
+    At most max_workers jobs run at once and at most max_queue_size more may
+    wait; anything beyond that is rejected immediately instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue_size: int, timeout: float):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(0, max_queue_size)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"{name}-worker"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0  # queued + running
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._run_time_total = 0.0
+        self._run_time_max = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, Dict[str, float]]:
+        """
+        Run fn(*args, **kwargs) on the pool and await its result.
+        Returns (result, timing) where timing holds queue_wait and run_time in seconds.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue_size:
+                self._rejected += 1
+                raise InferenceQueueFullError(
+                    f"{self.name} executor is full ({self._pending} jobs pending)"
+                )
+            self._pending += 1
+            self._submitted += 1
+
+        submitted_at = time.perf_counter()
+        timing: Dict[str, float] = {}
+
+        def job():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            succeeded = False
+            try:
+                result = fn(*args, **kwargs)
+                succeeded = True
+                return result
+            finally:
+                finished_at = time.perf_counter()
+                timing["queue_wait"] = started_at - submitted_at
+                timing["run_time"] = finished_at - started_at
+                self._record_finished(timing, succeeded)
+
+        future: Future = self._executor.submit(job)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            self._cancel_if_waiting(future)
+            raise InferenceTimeoutError(
+                f"{self.name} inference did not finish within {self.timeout}s"
+            )
+        except asyncio.CancelledError:
+            self._cancel_if_waiting(future)
+            raise
+
+        return result, dict(timing)
+
+    def _cancel_if_waiting(self, future: Future):
+        """Drop a job that never started; a running job keeps its slot until it returns"""
+        if future.cancel():
+            with self._lock:
+                self._pending -= 1
+
+    def _record_finished(self, timing: Dict[str, float], succeeded: bool):
+        with self._lock:
+            self._pending -= 1
+            self._running -= 1
+            if succeeded:
+                self._completed += 1
+            else:
+                self._failed += 1
+            self._queue_wait_total += timing["queue_wait"]
+            self._queue_wait_max = max(self._queue_wait_max, timing["queue_wait"])
+            self._run_time_total += timing["run_time"]
+            self._run_time_max = max(self._run_time_max, timing["run_time"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of executor load and timing, used to size workers and queue"""
+        with self._lock:
+            finished = max(1, self._completed + self._failed)
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "timeout": self.timeout,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_queue_wait": round(self._queue_wait_total / finished, 4),
+                "max_queue_wait": round(self._queue_wait_max, 4),
+                "avg_run_time": round(self._run_time_total / finished, 4),
+                "max_run_time": round(self._run_time_max, 4)
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Global executor for food classification work
+inference_executor = InferenceExecutor(
+    "food-classifier",
+    max_workers=INFERENCE_CONFIG["max_workers"],
+    max_queue_size=INFERENCE_CONFIG["max_queue_size"],
+    timeout=INFERENCE_CONFIG["timeout"]
+)
+
+# Global executor for chat generation, so slow replies never hold up classification
+chat_executor = InferenceExecutor(
+    "chat",
+    max_workers=CHAT_INFERENCE_CONFIG["max_workers"],
+    max_queue_size=CHAT_INFERENCE_CONFIG["max_queue_size"],
+    timeout=CHAT_INFERENCE_CONFIG["timeout"]
+)
@@ -0,0 +1,154 @@
+"""
+Dynamic micro-batching of concurrent inference requests
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from config.ai import BATCHING_CONFIG
+from models.food_classifier import food_classifier
+from models.inference_executor import InferenceExecutor, InferenceQueueFullError, inference_executor
+
+class MicroBatcher:
+    """
+    Coalesces requests that arrive within max_wait_ms of each other into a
+    single call of batch_fn (up to max_batch_size items), runs it on the
+    inference executor and hands each caller its own result.
+
+    batch_fn must take a list of items and return a list of results in the
+    same order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        executor: InferenceExecutor,
+        max_batch_size: int,
+        max_wait_ms: float
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        # Items allowed to wait for a batch before callers are turned away
+        self.max_pending = self.max_batch_size * (executor.max_workers + executor.max_queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Batches handed to the executor and not yet answered
+        self._inflight: Set[asyncio.Task] = set()
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    async def submit(self, item: Any) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Queue one item and await its result.
+        Returns (result, timing) where timing is the executor timing of the
+        batch the item ran in, plus its batch_size.
+        """
+        if self.max_batch_size == 1:
+            results, timing = await self.executor.run(self.batch_fn, [item])
+            self._record_batch(1)
+            return results[0], {**timing, "batch_size": 1}
+
+        self._ensure_collector()
+        if self._queue.qsize() >= self.max_pending:
+            raise InferenceQueueFullError(f"{self.name} batcher has {self._queue.qsize()} items waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def _ensure_collector(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queue and collector are bound to the loop that created them
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._collector = None
+            self._inflight = set()
+        if self._collector is None or self._collector.done():
+            self._collector = loop.create_task(self._collect())
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Dispatch without blocking collection of the next batch
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        # Callers that gave up while waiting do not need a slot in the batch
+        live = [(item, future) for item, future in batch if not future.done()]
+        if not live:
+            return
+
+        try:
+            results, timing = await self.executor.run(self.batch_fn, [item for item, _ in live])
+        except Exception as e:
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record_batch(len(live))
+        batch_timing = {**timing, "batch_size": len(live)}
+        for (_, future), result in zip(live, results):
+            if not future.done():
+                future.set_result((result, batch_timing))
+
+    async def close(self):
+        """
+        Stop collecting, let batches already on the executor answer their
+        callers, and cancel items still waiting for a batch.
+        """
+        if self._loop is not asyncio.get_running_loop():
+            return  # Nothing was started on this loop
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+            self._collector = None
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+
+    def _record_batch(self, size: int):
+        self._batches += 1
+        self._items += size
+        self._largest_batch = max(self._largest_batch, size)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "waiting": self._queue.qsize() if self._queue else 0,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / max(1, self._batches), 2),
+            "largest_batch": self._largest_batch
+        }
+
+# Global batcher in front of the food classifier
+food_batcher = MicroBatcher(
+    "food-classifier",
+    food_classifier.predict_food_categories_batch,
+    inference_executor,
+    max_batch_size=BATCHING_CONFIG["max_batch_size"],
+    max_wait_ms=BATCHING_CONFIG["max_wait_ms"]
+)
@@ -0,0 +1,250 @@
+"""
+Local model registry: pre-downloaded models with a checksummed manifest
+
+Populate it on a machine with network access, then ship the directory:
+
+    python -m models.model_registry pull            # every model the API uses
+    python -m models.model_registry pull nateraw/food --kind image-classification
+    python -m models.model_registry list
+    python -m models.model_registry verify
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from config.ai import CASCADE_CONFIG, CHAT_MODEL_NAME, FOOD_MODEL_NAMES, REGISTRY_CONFIG
+
+MANIFEST_NAME = "manifest.json"
+KINDS = ("image-classification", "text-generation")
+
+class ModelNotInRegistryError(Exception):
+    """Raised when the registry is required but holds no entry for a model"""
+    pass
+
+class ModelRegistryError(Exception):
+    """Raised when a registry entry is missing files or fails verification"""
+    pass
+
+class ModelSource:
+    """Where a loader should read a model from"""
+
+    def __init__(self, name: str, path: str, version: Optional[str], local: bool):
+        self.name = name
+        self.path = path  # registry directory, or the hub name when not local
+        self.version = version
+        self.local = local
+
+    def files_kwargs(self) -> Dict[str, Any]:
+        """from_pretrained arguments for configs, tokenizers and image processors"""
+        return {"local_files_only": True} if self.local else {}
+
+    def model_kwargs(self) -> Dict[str, Any]:
+        """from_pretrained arguments for weights: offline, memory-mapped safetensors"""
+        return {**self.files_kwargs(), "use_safetensors": True} if self.local else {}
+
+def _safe_dir_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "__", name)
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ModelRegistry:
+    """
+    A directory of saved models plus manifest.json describing each one:
+    name, version (hub commit), format, kind, files with size and sha256,
+    and an overall checksum. Loaders resolve hub names through resolve();
+    registry entries are always loaded offline from disk. With required set,
+    models missing from the registry are refused instead of downloaded.
+    """
+
+    def __init__(self, root: str, required: bool, verify_on_load: bool):
+        self.root = root
+        self.required = required
+        self.verify_on_load = verify_on_load
+        self._lock = threading.Lock()
+        self._manifest: Optional[Dict[str, Any]] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except FileNotFoundError:
+                self._manifest = {"models": {}}
+        return self._manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest = manifest
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return dict(self._load_manifest()["models"])
+
+    def resolve(self, name: str) -> ModelSource:
+        """Registry location of a model, or its hub name when it is not registered"""
+        entry = self.entries().get(name)
+        if entry is None:
+            if self.required:
+                raise ModelNotInRegistryError(
+                    f"{name} is not in the model registry at {self.root}; "
+                    f"run python -m models.model_registry pull {name}"
+                )
+            return ModelSource(name, name, None, False)
+
+        path = os.path.join(self.root, entry["path"])
+        self.check(entry, full=self.verify_on_load)
+        return ModelSource(name, path, entry["version"], True)
+
+    def check(self, entry: Dict[str, Any], full: bool):
+        """Every file present with the recorded size; with full, the sha256 as well"""
+        path = os.path.join(self.root, entry["path"])
+        for file_info in entry["files"]:
+            file_path = os.path.join(path, file_info["path"])
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != file_info["size"]:
+                raise ModelRegistryError(f"{entry['name']}: {file_info['path']} is missing or truncated")
+            if full and _sha256_file(file_path) != file_info["sha256"]:
+                raise ModelRegistryError(f"{entry['name']}: checksum mismatch for {file_info['path']}")
+
+    def pull(self, name: str, kind: str) -> Dict[str, Any]:
+        """Download a model from the hub and store it in the registry as safetensors"""
+        from transformers import (
+            AutoImageProcessor, AutoModelForCausalLM,
+            AutoModelForImageClassification, AutoTokenizer
+        )
+
+        if kind == "image-classification":
+            model = AutoModelForImageClassification.from_pretrained(name)
+            companion = AutoImageProcessor.from_pretrained(name)
+        elif kind == "text-generation":
+            model = AutoModelForCausalLM.from_pretrained(name)
+            companion = AutoTokenizer.from_pretrained(name)
+        else:
+            raise ValueError(f"Unknown model kind '{kind}', expected one of {KINDS}")
+
+        version = getattr(model.config, "_commit_hash", None) or time.strftime("%Y%m%d%H%M%S")
+        relative_path = os.path.join(_safe_dir_name(name), version)
+        target = os.path.join(self.root, relative_path)
+        staging = f"{target}.{os.getpid()}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+
+        model.save_pretrained(staging, safe_serialization=True)
+        companion.save_pretrained(staging)
+
+        files = []
+        for directory, _, file_names in os.walk(staging):
+            for file_name in sorted(file_names):
+                file_path = os.path.join(directory, file_name)
+                files.append({
+                    "path": os.path.relpath(file_path, staging),
+                    "size": os.path.getsize(file_path),
+                    "sha256": _sha256_file(file_path)
+                })
+        files.sort(key=lambda file_info: file_info["path"])
+        checksum = hashlib.sha256(
+            "\n".join(f"{file_info['path']}:{file_info['sha256']}" for file_info in files).encode()
+        ).hexdigest()
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+
+        entry = {
+            "name": name,
+            "version": version,
+            "kind": kind,
+            "format": "safetensors",
+            "path": relative_path,
+            "checksum": checksum,
+            "files": files,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+        # Older versions stay on disk: running processes may still map their weights
+        with self._lock:
+            manifest = self._load_manifest()
+            manifest["models"][name] = entry
+            self._save_manifest(manifest)
+        return entry
+
+    def verify(self) -> Dict[str, Optional[str]]:
+        """Full checksum verification of every entry; name -> error (None if intact)"""
+        results = {}
+        for name, entry in self.entries().items():
+            try:
+                self.check(entry, full=True)
+                results[name] = None
+            except ModelRegistryError as e:
+                results[name] = str(e)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "root": self.root,
+            "required": self.required,
+            "models": {name: entry["version"] for name, entry in self.entries().items()}
+        }
+
+# Global model registry
+model_registry = ModelRegistry(
+    root=REGISTRY_CONFIG["root"],
+    required=REGISTRY_CONFIG["required"],
+    verify_on_load=REGISTRY_CONFIG["verify_on_load"]
+)
+
+def default_models() -> List[Dict[str, str]]:
+    """Every model the API loads: the classifier candidates and the chat model"""
+    names = list(FOOD_MODEL_NAMES)
+    if CASCADE_CONFIG["enabled"] and CASCADE_CONFIG["fast_model"] and CASCADE_CONFIG["fast_model"] not in names:
+        names.append(CASCADE_CONFIG["fast_model"])
+    models = [{"name": name, "kind": "image-classification"} for name in names]
+    models.append({"name": CHAT_MODEL_NAME, "kind": "text-generation"})
+    return models
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the local model registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pull_parser = commands.add_parser("pull", help="download models into the registry")
+    pull_parser.add_argument("names", nargs="*", help="hub model names (default: every model the API uses)")
+    pull_parser.add_argument("--kind", choices=KINDS, default="image-classification")
+    commands.add_parser("list", help="show registered models")
+    commands.add_parser("verify", help="check every file against its checksum")
+    args = parser.parse_args(argv)
+
+    if args.command == "pull":
+        targets = [{"name": name, "kind": args.kind} for name in args.names] or default_models()
+        for target in targets:
+            print(f"📥 Pulling {target['name']} ({target['kind']})...")
+            entry = model_registry.pull(target["name"], target["kind"])
+            print(f"✅ {entry['name']}@{entry['version']} -> {entry['path']} ({entry['checksum'][:12]})")
+        return 0
+
+    if args.command == "list":
+        for name, entry in sorted(model_registry.entries().items()):
+            print(f"{name}\t{entry['version']}\t{entry['kind']}\t{entry['format']}\t{entry['checksum'][:12]}")
+        return 0
+
+    failures = 0
+    for name, error in sorted(model_registry.verify().items()):
+        print(f"❌ {error}" if error else f"✅ {name}")
+        failures += bool(error)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,194 @@
+"""
+Idle eviction of loaded models to cap the process's resident memory
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from config.ai import RESIDENCY_CONFIG
+
+def module_bytes(module) -> int:
+    """
+    Approximate memory held by a torch module's weights: every tensor in its
+    state dict, including the packed int8 weights of quantized layers.
+    """
+    import torch
+
+    total = 0
+    pending = list(module.state_dict().values())
+    while pending:
+        value = pending.pop()
+        if isinstance(value, torch.Tensor):
+            total += value.numel() * value.element_size()
+        elif isinstance(value, (tuple, list)):
+            pending.extend(value)
+    return total
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (Linux), or None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class _ResidentModel:
+    def __init__(self, name: str, unload: Callable[[], bool], size: Callable[[], int], idle_timeout: float):
+        self.name = name
+        self.unload = unload
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.loaded = False
+        self.resident_bytes = 0
+        self.in_flight = 0
+        self.last_used = time.time()
+        self.loads = 0
+        self.evictions = 0
+        self.last_evicted_at: Optional[float] = None
+
+class ModelResidencyManager:
+    """
+    Tracks when each loaded model was last used and frees the weights of
+    models that sat idle longer than their idle timeout. While the loaded
+    models together exceed the memory budget, idle ones are also evicted,
+    least recently used first. Owners register an unload callback (which
+    may refuse, e.g. while the model is busy) and reload on their own the
+    next time a request needs the model.
+    """
+
+    def __init__(self, enabled: bool, memory_budget_mb: float, check_interval: float):
+        self.enabled = enabled
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.check_interval = check_interval
+        self._models: Dict[str, _ResidentModel] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, unload: Callable[[], bool], size: Callable[[], int], idle_timeout: float):
+        with self._lock:
+            self._models[name] = _ResidentModel(name, unload, size, idle_timeout)
+
+    def mark_loaded(self, name: str):
+        """Record a (re)load; the sweeper then checks the memory budget"""
+        model = self._models[name]
+        try:
+            resident_bytes = model.size()
+        except Exception as e:
+            print(f"⚠️ Could not measure memory of {name}: {e}")
+            resident_bytes = 0
+        with self._lock:
+            model.loaded = True
+            model.resident_bytes = resident_bytes
+            model.last_used = time.time()
+            model.loads += 1
+        # Evicting from the loading thread could deadlock on another model's lock
+        self._wake.set()
+
+    def touch(self, name: str):
+        model = self._models.get(name)
+        if model is not None:
+            model.last_used = time.time()
+
+    @contextmanager
+    def in_use(self, name: str) -> Iterator[None]:
+        """Keep a model from being evicted while a request uses it"""
+        model = self._models[name]
+        with self._lock:
+            model.in_flight += 1
+            model.last_used = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                model.in_flight -= 1
+                model.last_used = time.time()
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="model-residency", daemon=True)
+        self._thread.start()
+        budget = f"{self.memory_budget // (1024 * 1024)}MB" if self.memory_budget else "unlimited"
+        print(f"🧹 Idle model eviction started (memory budget {budget})")
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Model eviction sweep error: {e}")
+
+    def sweep(self):
+        now = time.time()
+        for model in list(self._models.values()):
+            idle = now - model.last_used
+            if model.loaded and model.in_flight == 0 and 0 < model.idle_timeout <= idle:
+                self._evict(model, f"idle for {int(idle)}s")
+
+        if not self.memory_budget:
+            return
+        with self._lock:
+            loaded = [model for model in self._models.values() if model.loaded]
+        total = sum(model.resident_bytes for model in loaded)
+        for model in sorted(loaded, key=lambda m: m.last_used):
+            if total <= self.memory_budget:
+                break
+            if model.in_flight == 0 and self._evict(model, "over memory budget"):
+                total -= model.resident_bytes
+
+    def _evict(self, model: _ResidentModel, reason: str) -> bool:
+        if not model.unload():
+            return False
+        with self._lock:
+            model.loaded = False
+            model.evictions += 1
+            model.last_evicted_at = time.time()
+        print(f"💤 Unloaded {model.name} ({model.resident_bytes / (1024 * 1024):.1f}MB): {reason}")
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            models = {
+                model.name: {
+                    "loaded": model.loaded,
+                    "resident_mb": round(model.resident_bytes / (1024 * 1024), 1) if model.loaded else 0.0,
+                    "idle_seconds": round(now - model.last_used, 1),
+                    "idle_timeout": model.idle_timeout,
+                    "in_flight": model.in_flight,
+                    "loads": model.loads,
+                    "evictions": model.evictions,
+                    "last_evicted_at": model.last_evicted_at
+                }
+                for model in self._models.values()
+            }
+        rss = process_rss_bytes()
+        return {
+            "enabled": self.enabled,
+            "memory_budget_mb": self.memory_budget // (1024 * 1024) if self.memory_budget else None,
+            "models_resident_mb": round(sum(m["resident_mb"] for m in models.values()), 1),
+            "process_rss_mb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+            "models": models
+        }
+
+# Global model residency manager
+model_residency = ModelResidencyManager(
+    enabled=RESIDENCY_CONFIG["enabled"],
+    memory_budget_mb=RESIDENCY_CONFIG["memory_budget_mb"],
+    check_interval=RESIDENCY_CONFIG["check_interval"]
+)
@@ -0,0 +1,246 @@
+"""
+Nutrition facts store with an in-memory lookup index
+"""
+import bisect
+import difflib
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from database.connection import db_manager
+from config.ai import NUTRITION_CONFIG
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+def normalize_food_name(text: str) -> str:
+    """Lowercase, punctuation and parentheses to spaces, single-spaced"""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+class _NutritionIndex:
+    def __init__(self, entries, exact, sorted_keys, token_index, key_tokens, entry_keys, keys_by_length):
+        self.entries: List[Dict[str, Any]] = entries
+        self.exact: Dict[str, int] = exact  # normalized name -> entry
+        self.sorted_keys: List[str] = sorted_keys
+        self.token_index: Dict[str, Set[int]] = token_index  # word -> entries
+        self.key_tokens: Dict[str, Tuple[str, ...]] = key_tokens
+        self.entry_keys: List[List[str]] = entry_keys
+        self.keys_by_length: Dict[int, List[str]] = keys_by_length  # sorted names per length, for fuzzy
+
+class NutritionStore:
+    """
+    Nutrition facts per 100g, kept in the nutrition_facts table (seeded from
+    the bundled dataset) and served from an in-memory index:
+
+    - exact: normalized name or alias
+    - token: every word of a name appears in the query ("Nasi Goreng Spesial"
+      -> nasi goreng); the name with the most words wins, then the longest
+      name, then the alphabetically first
+    - prefix: the query starts a name ("kent" -> kentang)
+    - fuzzy: close spelling of the whole query or of one of its words; the
+      highest ratio wins, then the alphabetically first name. Only names
+      whose length can reach the cutoff are compared, at most
+      fuzzy_max_candidates of them
+
+    Until the database has been read, the bundled dataset is served directly.
+    """
+
+    def __init__(self, dataset_path: str, fuzzy_cutoff: float, fuzzy_max_candidates: int):
+        self.dataset_path = dataset_path
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.fuzzy_max_candidates = fuzzy_max_candidates
+        self.source: Optional[str] = None
+        self._lock = threading.Lock()
+        self._index: Optional[_NutritionIndex] = None
+
+    def load_dataset(self) -> List[Dict[str, Any]]:
+        with open(self.dataset_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _ensure_loaded(self):
+        if self.source is None:
+            with self._lock:
+                if self.source is None:
+                    self._build_index(self.load_dataset(), "dataset")
+
+    def _build_index(self, entries: List[Dict[str, Any]], source: str):
+        exact: Dict[str, int] = {}
+        token_index: Dict[str, Set[int]] = {}
+        key_tokens: Dict[str, Tuple[str, ...]] = {}
+        entry_keys: List[List[str]] = []
+        for i, entry in enumerate(entries):
+            entry_keys.append([])
+            for name in [entry["name"], *entry.get("aliases", [])]:
+                key = normalize_food_name(name)
+                if not key or key in exact:
+                    continue
+                exact[key] = i
+                entry_keys[i].append(key)
+                key_tokens[key] = tuple(key.split())
+                for token in key_tokens[key]:
+                    token_index.setdefault(token, set()).add(i)
+
+        sorted_keys = sorted(exact)
+        keys_by_length: Dict[int, List[str]] = {}
+        for key in sorted_keys:
+            keys_by_length.setdefault(len(key), []).append(key)
+
+        # One reference swap, so concurrent lookups always see a consistent index
+        self._index = _NutritionIndex(entries, exact, sorted_keys, token_index, key_tokens, entry_keys, keys_by_length)
+        self.source = source
+        print(f"🥗 Nutrition index built from {source}: {len(entries)} foods, {len(exact)} names")
+
+    async def sync_with_database(self) -> bool:
+        """Seed nutrition_facts with any missing bundled foods, then index the table"""
+        pool = db_manager.get_pool()
+        if not pool:
+            self._ensure_loaded()
+            return False
+        try:
+            dataset = self.load_dataset()
+            async with pool.acquire() as connection:
+                # Rows edited in the database are kept; only new foods are added
+                await connection.executemany('''
+                    INSERT INTO nutrition_facts (name, aliases, kalori, karbohidrat, protein, lemak)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    ON CONFLICT (name) DO NOTHING
+                ''', [
+                    (
+                        entry["name"], entry.get("aliases", []),
+                        entry["nutrition"]["kalori"], entry["nutrition"]["karbohidrat"],
+                        entry["nutrition"]["protein"], entry["nutrition"]["lemak"]
+                    )
+                    for entry in dataset
+                ])
+                rows = await connection.fetch('''
+                    SELECT name, aliases, kalori, karbohidrat, protein, lemak, per_serving
+                    FROM nutrition_facts
+                    ORDER BY name
+                ''')
+        except Exception as e:
+            print(f"❌ Failed to sync nutrition facts: {e}")
+            self._ensure_loaded()
+            return False
+
+        entries = [
+            {
+                "name": row["name"],
+                "aliases": list(row["aliases"] or []),
+                "per_serving": row["per_serving"],
+                "nutrition": {
+                    "kalori": row["kalori"],
+                    "karbohidrat": row["karbohidrat"],
+                    "protein": row["protein"],
+                    "lemak": row["lemak"]
+                }
+            }
+            for row in rows
+        ]
+        with self._lock:
+            self._build_index(entries, "database")
+        return True
+
+    def _match(self, index: "_NutritionIndex", query: str) -> Optional[Tuple[int, str]]:
+        """(entry index, match type) for a normalized query"""
+        exact = index.exact.get(query)
+        if exact is not None:
+            return exact, "exact"
+
+        tokens = query.split()
+        token_set = set(tokens)
+        candidates: Set[int] = set()
+        for token in token_set:
+            candidates |= index.token_index.get(token, set())
+        # Most words, then longest name, then name: independent of set iteration order
+        best: Optional[Tuple[Tuple[int, int, str], int]] = None
+        for i in candidates:
+            for key in index.entry_keys[i]:
+                name_tokens = index.key_tokens[key]
+                rank = (-len(name_tokens), -len(key), key)
+                if token_set.issuperset(name_tokens) and (best is None or rank < best[0]):
+                    best = (rank, i)
+        if best is not None:
+            return best[1], "token"
+
+        position = bisect.bisect_left(index.sorted_keys, query)
+        prefixed = []
+        while position < len(index.sorted_keys) and index.sorted_keys[position].startswith(query):
+            prefixed.append(index.sorted_keys[position])
+            position += 1
+        if prefixed:
+            return index.exact[min(prefixed, key=len)], "prefix"
+
+        for word in [query, *tokens]:
+            close = self._close_match(index, word)
+            if close is not None:
+                return index.exact[close], "fuzzy"
+        return None
+
+    def _close_match(self, index: "_NutritionIndex", word: str) -> Optional[str]:
+        """
+        The name closest to word by difflib ratio, ties broken by name. A ratio
+        is at most 2 * min(a, b) / (a + b) for lengths a and b, so names of
+        other lengths cannot reach the cutoff and are never compared.
+        """
+        cutoff = self.fuzzy_cutoff
+        length = len(word)
+        same_initial, others = [], []
+        for key_length, keys in index.keys_by_length.items():
+            if 2 * min(length, key_length) / (length + key_length) >= cutoff:
+                for key in keys:
+                    (same_initial if key[0] == word[0] else others).append(key)
+        # A typo is rarer in the first letter, so those names are compared first
+        candidates = (same_initial + others)[:self.fuzzy_max_candidates]
+
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(word)
+        best: Optional[Tuple[float, str]] = None
+        for key in candidates:
+            matcher.set_seq1(key)
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            score = matcher.ratio()
+            if score >= cutoff and (best is None or (-score, key) < best):
+                best = (-score, key)
+        return best[1] if best is not None else None
+
+    def lookup(self, food_type: str) -> Dict[str, Any]:
+        """Nutrition info for a food name, in the shape get_nutritional_info returns"""
+        self._ensure_loaded()
+        index = self._index
+        query = normalize_food_name(food_type)
+        match = self._match(index, query) if query else None
+        if match is None:
+            return {
+                "found": False,
+                "food": food_type,
+                "message": "Data nutrisi tidak tersedia"
+            }
+
+        i, match_type = match
+        entry = index.entries[i]
+        return {
+            "found": True,
+            "food": food_type,
+            "nutrition": dict(entry["nutrition"]),
+            "per_serving": entry.get("per_serving") or "100g",
+            "matched_food": entry["name"],
+            "match_type": match_type
+        }
+
+    def lookup_many(self, food_types: List[str]) -> List[Dict[str, Any]]:
+        return [self.lookup(food_type) for food_type in food_types]
+
+    def get_stats(self) -> Dict[str, Any]:
+        index = self._index
+        return {
+            "source": self.source,
+            "foods": len(index.entries) if index else 0,
+            "names": len(index.exact) if index else 0
+        }
+
+# Global nutrition store
+nutrition_store = NutritionStore(
+    dataset_path=NUTRITION_CONFIG["dataset_path"],
+    fuzzy_cutoff=NUTRITION_CONFIG["fuzzy_cutoff"],
+    fuzzy_max_candidates=NUTRITION_CONFIG["fuzzy_max_candidates"]
+)
@@ -0,0 +1,328 @@
+"""
+Process pool of food classifier replicas for multi-core CPU inference
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+from models.inference_executor import InferenceTimeoutError
+
+class ReplicaUnavailableError(Exception):
+    """Raised when no replica process is alive to take a request"""
+    pass
+
+def _stage_spec(stage) -> Dict[str, Any]:
+    """
+    Everything a replica needs to rebuild a ClassifierStage. The model's
+    tensors have been moved to shared memory, so pickling them for the child
+    sends handles to the same pages rather than copies of the weights. ONNX
+    stages send no model at all, only the path of the export.
+    """
+    classifier_pipeline = stage.classifier_pipeline
+    image_processor = classifier_pipeline.image_processor if classifier_pipeline is not None else stage.backend.image_processor
+    return {
+        "model_name": stage.model_name,
+        "model_revision": stage.model_revision,
+        "backend": stage.backend.name,
+        "backend_report": stage.backend_report,
+        "model": classifier_pipeline.model if classifier_pipeline is not None else None,
+        "image_processor": image_processor,
+        "id2label": getattr(stage.backend, "id2label", None),
+        "onnx_path": getattr(stage.backend, "onnx_path", None),
+        "label_table": stage.label_table,
+        "input_size": stage.input_size
+    }
+
+def _rebuild_stage(spec: Dict[str, Any]):
+    from transformers import pipeline
+    from models.food_classifier import ClassifierStage
+    from models.inference_backend import RAW_TOP_K, OnnxRuntimeBackend, restore_backend
+
+    if spec["backend"] == OnnxRuntimeBackend.name:
+        classifier_pipeline = None
+        backend = OnnxRuntimeBackend(spec["image_processor"], spec["id2label"], spec["onnx_path"])
+    else:
+        classifier_pipeline = pipeline(
+            "image-classification",
+            model=spec["model"],
+            image_processor=spec["image_processor"],
+            device=-1,
+            top_k=RAW_TOP_K
+        )
+        backend = restore_backend(spec["backend"], classifier_pipeline)
+    return ClassifierStage(
+        spec["model_name"], classifier_pipeline, backend, spec["backend_report"],
+        spec["model_revision"], spec["label_table"], spec["input_size"]
+    )
+
+def _replica_main(index: int, conn, stage_spec: Dict[str, Any], fast_stage_spec: Optional[Dict[str, Any]], num_threads: int):
+    """Replica process: rebuild the classifier, then serve (method, args) calls one at a time"""
+    import torch
+    from models.food_classifier import FoodClassifier
+
+    torch.set_num_threads(num_threads)
+
+    classifier = FoodClassifier()
+    classifier.device = torch.device("cpu")
+    classifier.stage = _rebuild_stage(stage_spec)
+    classifier.fast_stage = _rebuild_stage(fast_stage_spec) if fast_stage_spec else None
+    classifier.input_size = max(stage.input_size for stage in (classifier.stage, classifier.fast_stage) if stage)
+    classifier.state = "ready"
+
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break  # Parent went away
+        if message is None:
+            break
+        method, args = message
+        try:
+            conn.send(("ok", getattr(classifier, method)(*args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+class _Replica:
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.alive = True
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        # Replies come back in request order, so callers wait in a FIFO
+        self.waiters: "deque[Future]" = deque()
+        self.send_lock = threading.Lock()
+
+class ReplicaPool:
+    """
+    Runs N classifier replicas in separate processes, each with its own
+    torch intra-op thread count, and routes every call to the replica with
+    the fewest requests in flight.
+
+    Weights are loaded once by the parent and moved to shared memory before
+    the replicas are spawned, so all processes map the same pages and RAM
+    does not grow with N. Two exceptions:
+    - ONNX Runtime sessions: each replica opens the exported file itself.
+    - The quantized backend: quantize_dynamic stores INT8 weights in packed
+      parameter objects rather than tensors, which share_memory() does not
+      reach, so each replica unpickles a private copy (about a quarter of
+      the fp32 Linear weights per replica). The pool is capped at
+      max_quantized_replicas replicas in that case.
+
+    A call that gets no reply within call_timeout seconds fails with
+    InferenceTimeoutError; the replica it went to is treated as hung, killed
+    and replaced by a freshly spawned one in the same slot.
+    """
+
+    def __init__(self, replicas: int, threads_per_replica: int, startup_timeout: float,
+                 max_quantized_replicas: int = 2, call_timeout: Optional[float] = None):
+        self.size = max(1, replicas)
+        self.threads_per_replica = max(1, threads_per_replica)
+        self.startup_timeout = startup_timeout
+        self.max_quantized_replicas = max(1, max_quantized_replicas)
+        self.call_timeout = call_timeout
+        self.recycled = 0
+        self._replicas: List[_Replica] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stage_spec: Optional[Dict[str, Any]] = None
+        self._fast_stage_spec: Optional[Dict[str, Any]] = None
+        self._context = None
+
+    def start(self, stage, fast_stage=None):
+        """Spawn the replicas and wait until each has rebuilt its model"""
+        import torch.multiprocessing as mp
+        from models.inference_backend import QuantizedTorchBackend
+
+        quantized = any(
+            loaded is not None and loaded.backend.name == QuantizedTorchBackend.name for loaded in (stage, fast_stage)
+        )
+        if quantized and self.size > self.max_quantized_replicas:
+            print(f"⚠️ Quantized weights are copied into every replica, starting {self.max_quantized_replicas} "
+                  f"instead of {self.size} (AI_MAX_QUANTIZED_REPLICAS)")
+            self.size = self.max_quantized_replicas
+
+        for loaded in (stage, fast_stage):
+            if loaded is not None and loaded.classifier_pipeline is not None:
+                loaded.classifier_pipeline.model.share_memory()
+
+        # Kept for respawning replicas that hang
+        self._stage_spec = _stage_spec(stage)
+        self._fast_stage_spec = _stage_spec(fast_stage) if fast_stage is not None else None
+        self._context = mp.get_context("spawn")
+
+        pending = [(index, *self._spawn(index)) for index in range(self.size)]
+
+        for index, process, conn in pending:
+            if not conn.poll(self.startup_timeout):
+                self.shutdown()
+                for _, started, _ in pending:
+                    started.kill()
+                raise RuntimeError(f"Replica {index} did not start within {self.startup_timeout}s")
+            self._attach(index, process, conn)
+
+    def _spawn(self, index: int):
+        """Start one replica process; returns (process, parent end of its pipe)"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_replica_main,
+            args=(index, child_conn, self._stage_spec, self._fast_stage_spec, self.threads_per_replica),
+            name=f"food-classifier-replica-{index}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _attach(self, index: int, process, conn):
+        """Take a started replica's ready message and put it into slot index"""
+        status, pid = conn.recv()
+        replica = _Replica(index, process, conn)
+        with self._lock:
+            if index < len(self._replicas):
+                self._replicas[index] = replica
+            else:
+                self._replicas.append(replica)
+        threading.Thread(
+            target=self._read_replies,
+            args=(replica,),
+            name=f"food-classifier-replica-{index}-reader",
+            daemon=True
+        ).start()
+        print(f"🧩 Classifier replica {index} ready (pid {pid}, {self.threads_per_replica} threads)")
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(replica.in_flight for replica in self._replicas if replica.alive)
+
+    def is_available(self) -> bool:
+        return any(replica.alive for replica in self._replicas)
+
+    def call(self, method: str, *args) -> Any:
+        """Run classifier.method(*args) on the least-loaded replica and block for the result"""
+        with self._lock:
+            alive = [replica for replica in self._replicas if replica.alive]
+            if not alive:
+                raise ReplicaUnavailableError("No classifier replica is running")
+            replica = min(alive, key=lambda r: r.in_flight)
+            replica.in_flight += 1
+
+        future: Future = Future()
+        try:
+            with replica.send_lock:
+                replica.waiters.append(future)
+                replica.conn.send((method, args))
+        except (OSError, ValueError) as e:
+            self._mark_dead(replica, e)
+        try:
+            return future.result(timeout=self.call_timeout)
+        except FutureTimeoutError:
+            self._recycle(replica)
+            raise InferenceTimeoutError(
+                f"Replica {replica.index} did not answer {method} within {self.call_timeout}s"
+            )
+
+    def _recycle(self, replica: _Replica):
+        """Kill a replica that stopped answering and start a replacement in its slot"""
+        if not replica.alive:
+            return  # Already stopped; whoever noticed first handles it
+        self._mark_dead(replica, TimeoutError(f"no reply within {self.call_timeout}s"))
+        replica.process.kill()
+        with self._lock:
+            if self._closed:
+                return
+            self.recycled += 1
+        threading.Thread(
+            target=self._replace,
+            args=(replica.index,),
+            name=f"food-classifier-replica-{replica.index}-respawn",
+            daemon=True
+        ).start()
+
+    def _replace(self, index: int):
+        try:
+            process, conn = self._spawn(index)
+            if not conn.poll(self.startup_timeout):
+                process.kill()
+                raise RuntimeError(f"did not start within {self.startup_timeout}s")
+            with self._lock:
+                closed = self._closed
+            if closed:
+                process.kill()
+                return
+            self._attach(index, process, conn)
+        except Exception as e:
+            print(f"❌ Failed to replace classifier replica {index}: {e}")
+
+    def _read_replies(self, replica: _Replica):
+        while True:
+            try:
+                status, payload = replica.conn.recv()
+            except (EOFError, OSError) as e:
+                self._mark_dead(replica, e)
+                return
+
+            with self._lock:
+                if not replica.alive:
+                    return  # Recycled; its waiters have already been failed
+                future = replica.waiters.popleft()
+                replica.in_flight -= 1
+                if status == "ok":
+                    replica.completed += 1
+                else:
+                    replica.failed += 1
+            if status == "ok":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(f"Replica {replica.index} failed: {payload}"))
+
+    def _mark_dead(self, replica: _Replica, reason: Exception):
+        with self._lock:
+            if replica.alive:
+                print(f"❌ Classifier replica {replica.index} stopped: {reason}")
+            replica.alive = False
+            replica.in_flight = 0
+            waiters, replica.waiters = replica.waiters, deque()
+        for future in waiters:
+            if not future.done():
+                future.set_exception(ReplicaUnavailableError(f"Replica {replica.index} stopped"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replicas": self.size,
+                "threads_per_replica": self.threads_per_replica,
+                "alive": sum(1 for replica in self._replicas if replica.alive),
+                "recycled": self.recycled,
+                "workers": [
+                    {
+                        "index": replica.index,
+                        "pid": replica.process.pid,
+                        "alive": replica.alive,
+                        "in_flight": replica.in_flight,
+                        "completed": replica.completed,
+                        "failed": replica.failed
+                    }
+                    for replica in self._replicas
+                ]
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        for replica in self._replicas:
+            try:
+                with replica.send_lock:
+                    replica.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for replica in self._replicas:
+            replica.process.join(timeout=5)
+            if replica.process.is_alive():
+                replica.process.terminate()
+            replica.alive = False
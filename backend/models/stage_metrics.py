@@ -0,0 +1,84 @@
+"""
+Latency histograms for the stages of the classification pipeline
+"""
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+# Upper bounds in seconds (Prometheus-style cumulative buckets, plus +Inf)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StageMetrics:
+    """
+    One latency histogram per named stage (upload_read, decode, resize,
+    forward, postprocess, nutrition, ...). Observations are in seconds;
+    render_prometheus() writes them in the Prometheus text format.
+    """
+
+    def __init__(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # stage -> [per-bucket counts (+Inf last), sum, count]
+        self._histograms: Dict[str, List[Any]] = {}
+
+    def observe(self, stage: str, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def observe_ms(self, timings: Optional[Dict[str, Optional[float]]]):
+        """Observe a {"<stage>_ms": milliseconds} dict, skipping missing values"""
+        for key, value in (timings or {}).items():
+            if value is not None and key.endswith("_ms"):
+                self.observe(key[:-3], value / 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                stage: {
+                    "count": count,
+                    "avg_ms": round(total / max(1, count) * 1000, 3),
+                    "p50_ms": self._quantile_ms(counts, count, 0.5),
+                    "p95_ms": self._quantile_ms(counts, count, 0.95)
+                }
+                for stage, (counts, total, count) in self._histograms.items()
+            }
+
+    def _quantile_ms(self, counts: List[int], count: int, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if it is +Inf)"""
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound * 1000
+        return None
+
+    def render_prometheus(self) -> str:
+        metric = f"{self.name}_seconds"
+        lines = [
+            f"# HELP {metric} Latency of each classification pipeline stage",
+            f"# TYPE {metric} histogram"
+        ]
+        with self._lock:
+            for stage in sorted(self._histograms):
+                counts, total, count = self._histograms[stage]
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+# Global histograms for the food classification pipeline
+classification_metrics = StageMetrics("food_classification_stage")
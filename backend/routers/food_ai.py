@@ -1,23 +1,46 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Header, Form
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import asyncpg
 import json
 import os
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import asyncio
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+import gc
+import io
+import time
+import uuid
+import zipfile
 import threading
 import logging
 
+from database.connection import db_manager
+
 # Import our improved food classifier
 from models.food_classifier import food_classifier
+from models.inference_executor import inference_executor, chat_executor, InferenceQueueFullError, InferenceTimeoutError
+from models.micro_batcher import food_batcher
+from models.classification_cache import classification_cache
+from models.image_ingest import read_image_upload, read_upload, inspect_image_bytes, UploadRejectedError
+from models.classification_jobs import classification_job_queue
+from models.nutrition_store import nutrition_store
+from models.stage_metrics import classification_metrics
+from models.model_registry import model_registry
+from models.model_residency import model_residency, module_bytes
+from models.chat_engine import chat_engine, chat_kv_cache
+from models.conversation_store import conversation_store
+from config.ai import (
+    CACHE_CONFIG, MODEL_LOADING_CONFIG, BATCHING_CONFIG, UPLOAD_CONFIG, JOB_QUEUE_CONFIG,
+    NUTRITION_CONFIG, HOT_SWAP_CONFIG, RESIDENCY_CONFIG, MULTI_ITEM_CONFIG, INVENTORY_SCAN_CONFIG,
+    CHAT_INFERENCE_CONFIG, CHAT_GENERATION_CONFIG, CHAT_BATCHING_CONFIG, CHAT_KV_CACHE_CONFIG, CHAT_MODEL_NAME
+)
 
 router = APIRouter()
 
 # Initialize AI model - using free Hugging Face model
-MODEL_NAME = "microsoft/DialoGPT-small"  # Lighter, faster model
-device = "cuda" if torch.cuda.is_available() else "cpu"
+MODEL_NAME = CHAT_MODEL_NAME
+device = None  # Resolved when the model loads
 
 # Global model variables
 tokenizer = None
@@ -27,7 +50,7 @@ model_lock = threading.Lock()
 
 def initialize_ai_model():
     """Initialize AI model on first use - with better error handling"""
-    global tokenizer, model, chatbot_pipeline
+    global tokenizer, model, chatbot_pipeline, device
     
     if chatbot_pipeline is None:
         with model_lock:
@@ -35,12 +58,21 @@ def initialize_ai_model():
                 try:
                     print("🤖 Loading AI model... This might take a moment on first use")
                     
+                    # Imported lazily so the API starts without paying for torch
+                    import torch
+                    from transformers import AutoTokenizer, AutoModelForCausalLM
+                    device = "cuda" if torch.cuda.is_available() else "cpu"
+                    
+                    # Registry copies load offline from local safetensors; otherwise the hub
+                    source = model_registry.resolve(MODEL_NAME)
+                    
                     # Load tokenizer and model with better settings
-                    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, padding_side='left')
+                    tokenizer = AutoTokenizer.from_pretrained(source.path, padding_side='left', **source.files_kwargs())
                     model = AutoModelForCausalLM.from_pretrained(
-                        MODEL_NAME,
+                        source.path,
                         torch_dtype=torch.float32,  # Use float32 for better compatibility
-                        device_map="auto" if device == "cuda" else None
+                        device_map="auto" if device == "cuda" else None,
+                        **source.model_kwargs()
                     )
                     
                     # Add padding token if not exists
@@ -57,6 +89,7 @@ def initialize_ai_model():
                     
                     # Set as loaded
                     chatbot_pipeline = True  # Just mark as loaded
+                    model_residency.mark_loaded("chat")
                     
                 except Exception as e:
                     print(f"❌ Error loading AI model: {str(e)}")
@@ -65,6 +98,35 @@ def initialize_ai_model():
                     
     return chatbot_pipeline is not None
 
+def unload_ai_model() -> bool:
+    """Free the chat model after an idle period; initialize_ai_model reloads it on demand"""
+    global tokenizer, model, chatbot_pipeline
+    
+    if not model_lock.acquire(blocking=False):
+        return False  # Loading right now
+    try:
+        if chatbot_pipeline is None:
+            return False
+        # Requests already generating hold their own references until they finish
+        tokenizer = model = chatbot_pipeline = None
+        # Cached past key/values belong to the unloaded weights
+        chat_kv_cache.clear()
+    finally:
+        model_lock.release()
+    
+    gc.collect()
+    if device == "cuda":
+        import torch
+        torch.cuda.empty_cache()
+    return True
+
+def chat_model_bytes() -> int:
+    return module_bytes(model) if model is not None else 0
+
+model_residency.register("chat", unload_ai_model, chat_model_bytes, RESIDENCY_CONFIG["chat_idle_timeout"])
+# Decode steps hold the chat model, so it is not evicted mid-batch
+chat_engine.residency_key = "chat"
+
 class ChatMessage(BaseModel):
     message: str
     ingredients: List[str] = []
@@ -75,8 +137,77 @@ class ChatResponse(BaseModel):
     suggested_recipes: List[Dict[str, Any]] = []
     conversation_id: str
 
-# In-memory conversation storage (in production, use Redis or database)
-conversation_history = {}
+# Cached model state of a dropped conversation must not outlive it
+conversation_store.on_evict = chat_kv_cache.discard
+
+async def run_chat_turn(chat_message: ChatMessage, on_text: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """One chat exchange: record the message, generate, validate and record the reply"""
+    # Initialize conversation if needed
+    conv_id = chat_message.conversation_id or f"conv_{datetime.now().timestamp()}"
+    
+    # Read-through: another worker may have served this conversation so far
+    try:
+        await conversation_store.load(conv_id)
+    except Exception as e:
+        print(f"⚠️ Could not load conversation {conv_id}: {e}")
+    
+    # Add user message to history
+    conversation_store.append(conv_id, "user", chat_message.message)
+    history = conversation_store.messages(conv_id)
+    
+    # Generate AI response using real model or enhanced fallback
+    ai_response = await generate_ai_response(
+        message=chat_message.message,
+        ingredients=chat_message.ingredients,
+        conversation_history=history,
+        on_text=on_text,
+        conversation_id=conv_id
+    )
+    
+    # ALWAYS validate response quality before sending
+    if not is_response_quality_good(ai_response["response"], chat_message.message):
+        print("🔄 Response quality check failed, generating better response...")
+        ai_response = await generate_better_response(
+            message=chat_message.message,
+            ingredients=chat_message.ingredients,
+            conversation_history=history
+        )
+    
+    # The cached model state must match the reply the history records
+    if ai_response.get("model_used") != MODEL_NAME:
+        chat_kv_cache.discard(conv_id)
+    
+    # Add AI response to history
+    message_count = conversation_store.append(conv_id, "assistant", ai_response["response"])
+    
+    # Generate recipe suggestions if cooking-related and has ingredients
+    recipe_suggestions = []
+    if is_cooking_related(chat_message.message) and chat_message.ingredients:
+        recipe_suggestions = await generate_recipe_suggestions(
+            ingredients=chat_message.ingredients,
+            user_message=chat_message.message
+        )
+    
+    return {
+        "response": ai_response["response"],
+        "suggested_recipes": recipe_suggestions,
+        "conversation_id": conv_id,
+        "message_count": message_count,
+        "model_used": ai_response.get("model_used")
+    }
+
+def chat_error_response(chat_message: ChatMessage, error: Exception) -> Dict[str, Any]:
+    print(f"❌ Error in chat_with_ai: {str(error)}")
+    import traceback
+    print(f"📊 Full traceback: {traceback.format_exc()}")
+    
+    # Return friendly error message
+    return {
+        "response": "Maaf, saya sedang mengalami gangguan teknis. Bisa coba lagi dalam beberapa saat? 😅",
+        "suggested_recipes": [],
+        "conversation_id": chat_message.conversation_id or "error",
+        "error": True
+    }
 
 @router.post("/chat", response_model=Dict[str, Any])
 async def chat_with_ai(chat_message: ChatMessage) -> Dict[str, Any]:
@@ -84,140 +215,233 @@ async def chat_with_ai(chat_message: ChatMessage) -> Dict[str, Any]:
     Real AI chatbot that can chat about anything using OpenAI GPT
     """
     try:
-        # Initialize conversation if needed
-        conv_id = chat_message.conversation_id or f"conv_{datetime.now().timestamp()}"
-        
-        if conv_id not in conversation_history:
-            conversation_history[conv_id] = []
+        return await run_chat_turn(chat_message)
+    except Exception as e:
+        return chat_error_response(chat_message, e)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_with_ai_stream(chat_message: ChatMessage) -> StreamingResponse:
+    """
+    Same as /chat, streamed as Server-Sent Events: "token" events carry text
+    as the model decodes it, then one "done" event carries the cleaned
+    response, suggested_recipes and conversation_id. The final response can
+    differ from the streamed text (cleanup or fallback), so clients should
+    replace what they showed with it.
+    """
+    loop = asyncio.get_running_loop()
+    pieces: asyncio.Queue = asyncio.Queue()
+    
+    def on_text(piece: str):
+        # Called from the generating thread (chat engine or chat executor)
+        loop.call_soon_threadsafe(pieces.put_nowait, piece)
+    
+    async def events():
+        turn = asyncio.ensure_future(run_chat_turn(chat_message, on_text))
+        # Queued after every token the turn produced, since both go through the loop in order
+        turn.add_done_callback(lambda _: pieces.put_nowait(None))
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is None:
+                    break
+                yield sse_event("token", {"text": piece})
+            
+            try:
+                result = turn.result()
+            except Exception as e:
+                result = chat_error_response(chat_message, e)
+            yield sse_event("done", result)
+        finally:
+            # Client went away: stop generating for it
+            if not turn.done():
+                turn.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def incremental_text_decoder(
+    chat_tokenizer, on_text: Callable[[str], None]
+) -> Tuple[Callable[[int], None], Callable[[], None]]:
+    """
+    Token callback that reports newly decoded text, and a flush to call once
+    generation is over. The whole reply is re-decoded each time, because BPE
+    pieces only become text once merged with their neighbours.
+    """
+    token_ids: List[int] = []
+    state = {"text": ""}
+    
+    def emit(text: str):
+        if not text.startswith(state["text"]):
+            return
+        piece = text[len(state["text"]):]
+        if not state["text"]:
+            piece = piece.lstrip()  # The final response is stripped too
+        if piece:
+            state["text"] = text
+            on_text(piece)
+    
+    def on_token(token_id: int):
+        token_ids.append(token_id)
+        text = chat_tokenizer.decode(token_ids, skip_special_tokens=True)
+        # Hold back a trailing partial character until it completes
+        if not text.endswith("\ufffd"):
+            emit(text)
+    
+    def flush():
+        # Whatever was held back is final now, complete or not
+        emit(chat_tokenizer.decode(token_ids, skip_special_tokens=True))
+    
+    return on_token, flush
+
+class TokenCallbackStreamer:
+    """
+    generate() streamer that hands every new token id to on_token. The first
+    put() is the prompt, and the final EOS is not part of the reply.
+    """
+    
+    def __init__(self, on_token: Callable[[int], None], eos_token_id: int):
+        self.on_token = on_token
+        self.eos_token_id = eos_token_id
+        self.prompt_seen = False
+    
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        for token_id in value.reshape(-1).tolist():
+            if token_id != self.eos_token_id:
+                self.on_token(token_id)
+    
+    def end(self):
+        pass
+
+def run_dialogpt_generation(
+    chat_tokenizer, chat_model, conversation_text: str, on_token: Optional[Callable[[int], None]] = None
+) -> Tuple[str, int]:
+    """
+    Blocking DialoGPT generation, run on the chat executor.
+    on_token is called with each generated token id, from the executor thread.
+    Returns (generated text after the prompt, total tokens).
+    """
+    import torch
+    sampling = {
+        "temperature": CHAT_GENERATION_CONFIG["temperature"],
+        "top_p": CHAT_GENERATION_CONFIG["top_p"]
+    } if CHAT_GENERATION_CONFIG["do_sample"] else {}
+    with torch.no_grad(), model_residency.in_use("chat"):  # Save memory
+        # Tokenize input
+        inputs = chat_tokenizer.encode(conversation_text + chat_tokenizer.eos_token, return_tensors="pt")
         
-        # Add user message to history
-        conversation_history[conv_id].append({
-            "role": "user",
-            "content": chat_message.message,
-            "timestamp": datetime.now().isoformat()
-        })
+        # Move to device if needed
+        if device == "cuda" and torch.cuda.is_available():
+            inputs = inputs.cuda()
         
-        # Generate AI response using real model or enhanced fallback
-        ai_response = await generate_ai_response(
-            message=chat_message.message,
-            ingredients=chat_message.ingredients,
-            conversation_history=conversation_history[conv_id]
+        # Generate response
+        outputs = chat_model.generate(
+            inputs,
+            max_length=inputs.shape[1] + CHAT_GENERATION_CONFIG["max_new_tokens"],
+            num_return_sequences=1,
+            do_sample=CHAT_GENERATION_CONFIG["do_sample"],
+            **sampling,
+            pad_token_id=chat_tokenizer.eos_token_id,
+            eos_token_id=chat_tokenizer.eos_token_id,
+            repetition_penalty=CHAT_GENERATION_CONFIG["repetition_penalty"],
+            no_repeat_ngram_size=CHAT_GENERATION_CONFIG["no_repeat_ngram_size"],
+            # Stop decoding once the caller has given up, freeing the worker
+            max_time=CHAT_INFERENCE_CONFIG["timeout"],
+            streamer=TokenCallbackStreamer(on_token, chat_tokenizer.eos_token_id) if on_token else None
         )
         
-        # ALWAYS validate response quality before sending
-        if not is_response_quality_good(ai_response["response"], chat_message.message):
-            print("🔄 Response quality check failed, generating better response...")
-            ai_response = await generate_better_response(
-                message=chat_message.message,
-                ingredients=chat_message.ingredients,
-                conversation_history=conversation_history[conv_id]
-            )
-        
-        # Add AI response to history
-        conversation_history[conv_id].append({
-            "role": "assistant", 
-            "content": ai_response["response"],
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Generate recipe suggestions if cooking-related and has ingredients
-        recipe_suggestions = []
-        if is_cooking_related(chat_message.message) and chat_message.ingredients:
-            recipe_suggestions = await generate_recipe_suggestions(
-                ingredients=chat_message.ingredients,
-                user_message=chat_message.message
-            )
+        # Decode response
+        response_text = chat_tokenizer.decode(outputs[0], skip_special_tokens=True)
         
-        return {
-            "response": ai_response["response"],
-            "suggested_recipes": recipe_suggestions,
-            "conversation_id": conv_id,
-            "message_count": len(conversation_history[conv_id])
-        }
-        
-    except Exception as e:
-        print(f"❌ Error in chat_with_ai: {str(e)}")
-        import traceback
-        print(f"📊 Full traceback: {traceback.format_exc()}")
-        
-        # Return friendly error message
-        return {
-            "response": "Maaf, saya sedang mengalami gangguan teknis. Bisa coba lagi dalam beberapa saat? 😅",
-            "suggested_recipes": [],
-            "conversation_id": chat_message.conversation_id or "error",
-            "error": True
-        }
+        # Extract just the new part (after the input)
+        input_text = chat_tokenizer.decode(inputs[0], skip_special_tokens=True)
+        return response_text[len(input_text):].strip(), len(outputs[0])
 
 async def generate_ai_response(
     message: str, 
     ingredients: List[str], 
-    conversation_history: List[Dict]
+    conversation_history: List[Dict],
+    on_text: Optional[Callable[[str], None]] = None,
+    conversation_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Generate real AI response using Hugging Face Transformers (FREE!)
+    on_text receives the raw reply as it decodes, from the generating thread.
+    With the KV cache, conversation_id picks up the model state of the
+    conversation's previous turn, so only the new message is encoded.
     """
-    try:
-        # Initialize model if needed
-        model_available = initialize_ai_model()
-        
-        if not model_available or tokenizer is None or model is None:
-            print("⚠️ AI model not available, using enhanced smart fallback")
+    # Initialize model if needed (again after an idle eviction); loading blocks, so off the loop
+    if chatbot_pipeline is None:
+        try:
+            await chat_executor.run(initialize_ai_model)
+        except (InferenceQueueFullError, InferenceTimeoutError) as e:
+            print(f"⏱️ Chat model still loading ({e}), using smart fallback")
             return await smart_fallback_response(message, ingredients, conversation_history)
-        
-        # Build conversation for DialoGPT
+    
+    # Local references keep the weights alive for this request even if evicted meanwhile
+    chat_tokenizer, chat_model = tokenizer, model
+    if chatbot_pipeline is None or chat_tokenizer is None or chat_model is None:
+        print("⚠️ AI model not available, using enhanced smart fallback")
+        return await smart_fallback_response(message, ingredients, conversation_history)
+    
+    # Build conversation for DialoGPT
+    use_kv_cache = CHAT_BATCHING_CONFIG["enabled"] and CHAT_KV_CACHE_CONFIG["enabled"] and conversation_id
+    if use_kv_cache:
+        conversation_text, turn_text = build_dialogpt_turns(
+            message, ingredients, conversation_history, chat_tokenizer.eos_token
+        )
+    else:
         conversation_text = build_dialogpt_input(message, ingredients, conversation_history)
-        
-        # Generate response using the model
-        try:
-            with torch.no_grad():  # Save memory
-                # Tokenize input
-                inputs = tokenizer.encode(conversation_text + tokenizer.eos_token, return_tensors="pt")
-                
-                # Move to device if needed
-                if device == "cuda" and torch.cuda.is_available():
-                    inputs = inputs.cuda()
-                
-                # Generate response
-                outputs = model.generate(
-                    inputs,
-                    max_length=inputs.shape[1] + 50,  # Shorter responses for better quality
-                    num_return_sequences=1,
-                    temperature=0.8,
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=tokenizer.eos_token_id,
-                    eos_token_id=tokenizer.eos_token_id,
-                    repetition_penalty=1.1,
-                    no_repeat_ngram_size=3
+    
+    # Generate response using the model, off the event loop. Only generation
+    # failures fall back; anything else is a bug and reaches the caller.
+    on_token, flush_text = incremental_text_decoder(chat_tokenizer, on_text) if on_text else (None, None)
+    try:
+        if CHAT_BATCHING_CONFIG["enabled"]:
+            # Shares decode steps with every other chat in flight
+            if use_kv_cache:
+                ai_response, tokens_used = await chat_engine.generate(
+                    chat_model, chat_tokenizer, conversation_text, on_token=on_token,
+                    cache_key=conversation_id, turn_text=turn_text
                 )
-                
-                # Decode response
-                response_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-                
-                # Extract just the new part (after the input)
-                input_text = tokenizer.decode(inputs[0], skip_special_tokens=True)
-                ai_response = response_text[len(input_text):].strip()
-                
-                # Clean up and validate response
-                ai_response = clean_ai_response(ai_response, message)
-                
-                if len(ai_response) < 5 or is_bad_response(ai_response):
-                    print("🔄 Generated response too short/bad, using smart fallback")
-                    return await smart_fallback_response(message, ingredients, conversation_history)
-                
-                return {
-                    "response": ai_response,
-                    "model_used": MODEL_NAME,
-                    "tokens_used": len(outputs[0])
-                }
-                
-        except Exception as model_error:
-            print(f"Model generation error: {str(model_error)}")
-            return await smart_fallback_response(message, ingredients, conversation_history)
-            
-    except Exception as e:
-        print(f"Error in AI response generation: {str(e)}")
+            else:
+                ai_response, tokens_used = await chat_engine.generate(
+                    chat_model, chat_tokenizer, conversation_text, on_token=on_token
+                )
+        else:
+            (ai_response, tokens_used), _ = await chat_executor.run(
+                run_dialogpt_generation, chat_tokenizer, chat_model, conversation_text, on_token
+            )
+    except (InferenceQueueFullError, InferenceTimeoutError) as e:
+        print(f"⏱️ Chat generation unavailable ({e}), using smart fallback")
+        return await smart_fallback_response(message, ingredients, conversation_history)
+    except RuntimeError as model_error:
+        # torch failures (out of memory, bad device state) and a stopped chat engine
+        print(f"Model generation error: {str(model_error)}")
         return await smart_fallback_response(message, ingredients, conversation_history)
+    if flush_text is not None:
+        flush_text()  # Stream the tail the decoder held back
+    
+    # Clean up and validate response
+    ai_response = clean_ai_response(ai_response, message)
+    
+    if len(ai_response) < 5 or is_bad_response(ai_response):
+        print("🔄 Generated response too short/bad, using smart fallback")
+        return await smart_fallback_response(message, ingredients, conversation_history)
+    
+    return {
+        "response": ai_response,
+        "model_used": MODEL_NAME,
+        "tokens_used": tokens_used
+    }
 
 def build_dialogpt_input(message: str, ingredients: List[str], conversation_history: List[Dict]) -> str:
     """
@@ -245,6 +469,29 @@ def build_dialogpt_input(message: str, ingredients: List[str], conversation_hist
     
     return " ".join(conversation_parts)
 
+def build_dialogpt_turns(message: str, ingredients: List[str], conversation_history: List[Dict], eos_token: str) -> Tuple[str, str]:
+    """
+    DialoGPT input as EOS-separated turns, for use with the KV cache.
+    Returns (full prompt, current turn): with cached state only the current
+    turn is encoded, and the full prompt (recent history, then the turn)
+    produces the same sequence when nothing is cached.
+    """
+    # conversation_history already ends with the current message
+    previous = conversation_history[:-1][-4:]
+    turns = []
+    for msg in previous:
+        if msg["role"] == "user":
+            turns.append(f"User: {msg['content']} Bot:{eos_token}")
+        elif msg["role"] == "assistant":
+            turns.append(f" {msg['content']}{eos_token}")
+    
+    current_turn = f"User: {message}"
+    if ingredients:
+        current_turn += f" (ingredients: {', '.join(ingredients[:3])})"
+    current_turn += " Bot:"
+    
+    return "".join(turns) + current_turn, current_turn
+
 def clean_ai_response(response: str, original_message: str) -> str:
     """
     Clean up AI response text with better filtering
@@ -342,42 +589,6 @@ def build_conversation_context(message: str, ingredients: List[str], conversatio
     
     return "\n".join(context_parts)
 
-def clean_ai_response(response: str) -> str:
-    """
-    Clean up AI response text
-    """
-    # Remove common unwanted patterns
-    response = response.strip()
-    
-    # Remove repetitive patterns
-    lines = response.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        line = line.strip()
-        if line and line not in cleaned_lines:  # Remove duplicates
-            cleaned_lines.append(line)
-    
-    response = '\n'.join(cleaned_lines)
-    
-    # Remove weird artifacts
-    response = response.replace('<|endoftext|>', '')
-    response = response.replace('<pad>', '')
-    response = response.replace('<unk>', '')
-    
-    # Ensure response isn't too long
-    if len(response) > 300:
-        # Find last complete sentence within limit
-        sentences = response.split('. ')
-        result = ""
-        for sentence in sentences:
-            if len(result + sentence + '. ') <= 300:
-                result += sentence + '. '
-            else:
-                break
-        response = result.strip()
-    
-    return response
-
 async def smart_fallback_response(
     message: str, 
     ingredients: List[str], 
@@ -1104,8 +1315,12 @@ async def health_check():
 @router.delete("/conversation/{conversation_id}")
 async def clear_conversation(conversation_id: str):
     """Clear a specific conversation history"""
-    if conversation_id in conversation_history:
-        del conversation_history[conversation_id]
+    # Every worker forgets it too; the store's eviction callback drops the cached model state
+    try:
+        deleted = await conversation_store.delete(conversation_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal menghapus percakapan: {str(e)}")
+    if deleted:
         return {"message": "Conversation cleared successfully"}
     else:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -1114,14 +1329,11 @@ async def clear_conversation(conversation_id: str):
 @router.get("/stats")
 async def get_chat_stats():
     """Get chatbot usage statistics"""
-    total_conversations = len(conversation_history)
-    total_messages = sum(len(conv) for conv in conversation_history.values())
-    
     return {
-        "total_conversations": total_conversations,
-        "total_messages": total_messages,
-        "active_conversations": total_conversations,
-        "average_messages_per_conversation": total_messages / max(1, total_conversations)
+        **conversation_store.get_stats(),
+        "chat_executor": chat_executor.get_stats(),
+        "chat_batching": chat_engine.get_stats(),
+        "chat_kv_cache": chat_kv_cache.get_stats()
     }
 
 # === FOOD CLASSIFICATION ENDPOINTS ===
@@ -1139,6 +1351,69 @@ class FoodClassificationResponse(BaseModel):
     processing_time: float
     metadata: Dict[str, Any]
 
+def classification_cache_key(image_bytes: bytes) -> Optional[str]:
+    """Cache key for an upload, or None when caching is off or no model is loaded yet"""
+    identity = food_classifier.cache_identity()
+    if not CACHE_CONFIG["enabled"] or identity is None:
+        return None
+    return classification_cache.make_key(image_bytes, *identity)
+
+def ensure_classifier_ready():
+    """
+    Readiness gate for classification: while the model is still warming up,
+    answer 503 with Retry-After instead of queueing work behind the load.
+    A failed load is let through so requests get the fallback prediction.
+    """
+    state = food_classifier.state
+    if state == "not_started":
+        food_classifier.start_background_load()
+        state = "loading"
+    if state == "loading":
+        raise HTTPException(
+            status_code=503,
+            detail="Model AI sedang dimuat, coba lagi sebentar lagi",
+            headers={"Retry-After": str(MODEL_LOADING_CONFIG["retry_after"])}
+        )
+
+MODEL_STAGES = ("decode_ms", "resize_ms", "forward_ms", "postprocess_ms")
+
+def model_stage_timings(analysis: Dict[str, Any], timing: Dict[str, Any], cache_hit: bool) -> Dict[str, Optional[float]]:
+    """Queue and model-side stage timings (ms) of one result; all None on a cache hit"""
+    stage_timings = None if cache_hit else analysis["processing_metadata"].get("stage_timings")
+    timings = {"queue_wait_ms": None if cache_hit else round(timing["queue_wait"] * 1000, 2)}
+    for key in MODEL_STAGES:
+        timings[key] = stage_timings.get(key) if stage_timings else None
+    return timings
+
+def record_model_stages(analysis: Dict[str, Any], timing: Dict[str, Any]):
+    """Feed a freshly computed result's stage timings into the histograms"""
+    classification_metrics.observe_ms(model_stage_timings(analysis, timing, False))
+
+async def classify_with_cache(image_bytes: bytes):
+    """
+    Full food analysis for one upload, served from the result cache when the
+    same image was already classified by the current model.
+    Returns (analysis, timing, cache_hit).
+    """
+    ensure_classifier_ready()
+    
+    cache_key = classification_cache_key(image_bytes)
+    if cache_key is not None:
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            return cached, {"queue_wait": 0.0, "run_time": 0.0, "batch_size": 0}, True
+    
+    analysis, timing = await food_batcher.submit(image_bytes)
+    record_model_stages(analysis, timing)
+    
+    # Only real model output is worth keeping; fallbacks should be retried
+    if analysis["detection_source"] != "fallback":
+        cache_key = cache_key or classification_cache_key(image_bytes)
+        if cache_key is not None:
+            classification_cache.put(cache_key, analysis)
+    
+    return analysis, timing, False
+
 @router.post("/classify-food", response_model=FoodClassificationResponse)
 async def classify_food_image(file: UploadFile = File(...)) -> FoodClassificationResponse:
     """
@@ -1153,23 +1428,28 @@ async def classify_food_image(file: UploadFile = File(...)) -> FoodClassificatio
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File harus berupa gambar")
         
-        # Read image bytes
-        image_bytes = await file.read()
-        
-        if len(image_bytes) == 0:
-            raise HTTPException(status_code=400, detail="File gambar kosong")
+        # Stream the upload with a size cap, validating the image header early
+        read_started = time.perf_counter()
+        upload = await read_image_upload(file)
+        image_bytes = upload["data"]
+        upload_read_ms = round((time.perf_counter() - read_started) * 1000, 2)
+        classification_metrics.observe("upload_read", upload_read_ms / 1000)
         
         print(f"🖼️ Processing food image: {file.filename} ({len(image_bytes)} bytes)")
         
-        # Classify the food using our advanced AI model
-        classification_result = food_classifier.predict_food_categories(image_bytes)
+        # Classify the food using our advanced AI model (cached, batched, off the event loop)
+        classification_result, inference_timing, cache_hit = await classify_with_cache(image_bytes)
         
         # Get nutritional information for the detected food
+        nutrition_started = time.perf_counter()
         nutritional_info = food_classifier.get_nutritional_info(
             classification_result["primary_food_type"]
         )
+        nutrition_ms = round((time.perf_counter() - nutrition_started) * 1000, 3)
+        classification_metrics.observe("nutrition", nutrition_ms / 1000)
         
         processing_time = time.time() - start_time
+        classification_metrics.observe("total", processing_time)
         
         # Build comprehensive response
         response = FoodClassificationResponse(
@@ -1186,9 +1466,21 @@ async def classify_food_image(file: UploadFile = File(...)) -> FoodClassificatio
             metadata={
                 "file_name": file.filename,
                 "file_size": len(image_bytes),
+                "image_format": upload["format"],
+                "image_dimensions": [upload["width"], upload["height"]],
                 "ai_model": classification_result["ai_model"],
                 "device_used": classification_result["processing_metadata"]["device_used"],
-                "total_predictions": classification_result["processing_metadata"]["total_predictions"]
+                "total_predictions": classification_result["processing_metadata"]["total_predictions"],
+                "queue_wait": round(inference_timing["queue_wait"], 3),
+                "inference_time": round(inference_timing["run_time"], 3),
+                "batch_size": inference_timing["batch_size"],
+                "cache_hit": cache_hit,
+                "decode": None if cache_hit else classification_result["processing_metadata"].get("decode"),
+                "stage_timings": {
+                    "upload_read_ms": upload_read_ms,
+                    **model_stage_timings(classification_result, inference_timing, cache_hit),
+                    "nutrition_ms": nutrition_ms
+                }
             }
         )
         
@@ -1198,6 +1490,12 @@ async def classify_food_image(file: UploadFile = File(...)) -> FoodClassificatio
         
     except HTTPException:
         raise
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except InferenceQueueFullError:
+        raise HTTPException(status_code=503, detail="Server AI sedang sibuk, coba lagi nanti")
+    except InferenceTimeoutError:
+        raise HTTPException(status_code=504, detail="Klasifikasi gambar melebihi batas waktu")
     except Exception as e:
         print(f"❌ Error in food classification: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing gambar: {str(e)}")
@@ -1213,8 +1511,9 @@ async def classify_food_simple(file: UploadFile = File(...)) -> Dict[str, Any]:
             raise HTTPException(status_code=400, detail="File harus berupa gambar")
         
         # Read and process image
-        image_bytes = await file.read()
-        predictions = food_classifier.predict(image_bytes, top_k=3)
+        upload = await read_image_upload(file)
+        classification_result, _, _ = await classify_with_cache(upload["data"])
+        predictions = classification_result["detailed_predictions"][:3]
         
         if not predictions:
             return {
@@ -1239,6 +1538,21 @@ async def classify_food_simple(file: UploadFile = File(...)) -> Dict[str, Any]:
             ]
         }
         
+    except InferenceQueueFullError:
+        return {
+            "success": False,
+            "message": "Server AI sedang sibuk, coba lagi nanti"
+        }
+    except InferenceTimeoutError:
+        return {
+            "success": False,
+            "message": "Klasifikasi gambar melebihi batas waktu"
+        }
+    except (HTTPException, UploadRejectedError) as e:
+        return {
+            "success": False,
+            "message": e.detail
+        }
     except Exception as e:
         print(f"❌ Error in simple classification: {e}")
         return {
@@ -1246,6 +1560,446 @@ async def classify_food_simple(file: UploadFile = File(...)) -> Dict[str, Any]:
             "message": f"Error: {str(e)}"
         }
 
+def upload_body_limits(prefix: str) -> Dict[str, int]:
+    """Largest request body each upload endpoint accepts, for UploadSizeLimitMiddleware"""
+    overhead = UPLOAD_CONFIG["multipart_overhead_bytes"]
+    single = UPLOAD_CONFIG["max_bytes"] + overhead
+    many = max(
+        BATCHING_CONFIG["max_archive_bytes"],
+        BATCHING_CONFIG["max_files_per_request"] * UPLOAD_CONFIG["max_bytes"]
+    ) + overhead
+    limits = {
+        "/classify-food": single,
+        "/classify-food-simple": single,
+        "/classify-food/multi": single,
+        "/classify-food/jobs": single,
+        "/classify-food/batch": many,
+        "/classify-food/inventory": many
+    }
+    return {prefix + path: limit for path, limit in limits.items()}
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+
+def is_zip_upload(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+def extract_zip_images(archive_bytes: bytes) -> List[Dict[str, Any]]:
+    """Pull image entries out of an uploaded zip, guarding against oversized archives"""
+    max_files = BATCHING_CONFIG["max_files_per_request"]
+    max_bytes = BATCHING_CONFIG["max_archive_bytes"]
+    
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="File zip tidak valid")
+    
+    entries = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    if len(entries) > max_files:
+        raise HTTPException(status_code=400, detail=f"Maksimal {max_files} gambar per permintaan")
+    if sum(info.file_size for info in entries) > max_bytes:
+        raise HTTPException(status_code=413, detail="Isi file zip terlalu besar")
+    
+    items = []
+    for info in entries:
+        item = {"file_name": info.filename, "image_bytes": b"", "error": None}
+        if info.file_size > UPLOAD_CONFIG["max_bytes"]:
+            item["error"] = "Ukuran file gambar terlalu besar"
+        else:
+            try:
+                item["image_bytes"] = inspect_image_bytes(archive.read(info))["data"]
+            except UploadRejectedError as e:
+                item["error"] = e.detail
+        items.append(item)
+    return items
+
+async def read_batch_uploads(files: List[UploadFile]) -> List[Dict[str, Any]]:
+    """Read every image of a batch request, expanding a single zip archive"""
+    if len(files) == 1 and is_zip_upload(files[0]):
+        try:
+            archive_bytes = await read_upload(files[0], BATCHING_CONFIG["max_archive_bytes"])
+        except UploadRejectedError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        return extract_zip_images(archive_bytes)
+    
+    max_files = BATCHING_CONFIG["max_files_per_request"]
+    if len(files) > max_files:
+        raise HTTPException(status_code=400, detail=f"Maksimal {max_files} gambar per permintaan")
+    
+    items = []
+    for file in files:
+        item = {"file_name": file.filename, "image_bytes": b"", "error": None}
+        if not file.content_type or not file.content_type.startswith('image/'):
+            item["error"] = "File harus berupa gambar"
+        else:
+            try:
+                item["image_bytes"] = (await read_image_upload(file))["data"]
+            except UploadRejectedError as e:
+                item["error"] = e.detail
+        items.append(item)
+    return items
+
+def build_batch_result(index: int, item: Dict[str, Any], analysis: Dict[str, Any],
+                       timing: Dict[str, Any], cache_hit: bool) -> Dict[str, Any]:
+    """One NDJSON line of /classify-food/batch output"""
+    return {
+        "index": index,
+        "file_name": item["file_name"],
+        "success": True,
+        "primary_food_type": analysis["primary_food_type"],
+        "confidence": analysis["confidence"],
+        "category": analysis["category"],
+        "confidence_level": analysis["confidence_level"],
+        "alternative_types": analysis["alternative_types"],
+        "is_food": analysis["is_food"],
+        "detailed_predictions": analysis["detailed_predictions"],
+        "nutritional_info": food_classifier.get_nutritional_info(analysis["primary_food_type"]),
+        "metadata": {
+            "file_size": len(item["image_bytes"]),
+            "ai_model": analysis["ai_model"],
+            "device_used": analysis["processing_metadata"]["device_used"],
+            "queue_wait": round(timing["queue_wait"], 3),
+            "inference_time": round(timing["run_time"], 3),
+            "batch_size": timing["batch_size"],
+            "cache_hit": cache_hit,
+            "decode": None if cache_hit else analysis["processing_metadata"].get("decode"),
+            "stage_timings": model_stage_timings(analysis, timing, cache_hit)
+        }
+    }
+
+@router.post("/classify-food/batch")
+async def classify_food_batch(files: List[UploadFile] = File(...)) -> StreamingResponse:
+    """
+    Classify many food images (multiple files or a single zip archive) in one request.
+    Images run through the classifier in true batches and results stream back as
+    NDJSON, one line per image as soon as its batch finishes, then a summary line.
+    """
+    start_time = time.time()
+    ensure_classifier_ready()
+    items = await read_batch_uploads(files)
+    if not items:
+        raise HTTPException(status_code=400, detail="Tidak ada gambar untuk diklasifikasi")
+    
+    async def run_chunk(chunk: List[int]):
+        try:
+            analyses, timing = await inference_executor.run(
+                food_classifier.predict_food_categories_batch,
+                [items[i]["image_bytes"] for i in chunk]
+            )
+        except (InferenceQueueFullError, InferenceTimeoutError) as e:
+            return chunk, None, None, str(e)
+        return chunk, analyses, {**timing, "batch_size": len(chunk)}, None
+    
+    async def stream_results():
+        ready_lines = []
+        pending = []
+        succeeded = 0
+        
+        for index, item in enumerate(items):
+            if item["error"]:
+                ready_lines.append({"index": index, "file_name": item["file_name"], "success": False, "error": item["error"]})
+                continue
+            item["cache_key"] = classification_cache_key(item["image_bytes"])
+            cached = classification_cache.get(item["cache_key"]) if item["cache_key"] else None
+            if cached is not None:
+                timing = {"queue_wait": 0.0, "run_time": 0.0, "batch_size": 0}
+                ready_lines.append(build_batch_result(index, item, cached, timing, True))
+                succeeded += 1
+            else:
+                pending.append(index)
+        
+        for line in ready_lines:
+            yield json.dumps(line) + "\n"
+        
+        batch_size = BATCHING_CONFIG["max_batch_size"]
+        tasks = [
+            asyncio.ensure_future(run_chunk(pending[i:i + batch_size]))
+            for i in range(0, len(pending), batch_size)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                chunk, analyses, timing, error = await next_done
+                if error:
+                    for index in chunk:
+                        yield json.dumps({"index": index, "file_name": items[index]["file_name"], "success": False, "error": error}) + "\n"
+                    continue
+                for index, analysis in zip(chunk, analyses):
+                    item = items[index]
+                    record_model_stages(analysis, timing)
+                    if analysis["detection_source"] != "fallback" and item["cache_key"]:
+                        classification_cache.put(item["cache_key"], analysis)
+                    succeeded += 1
+                    yield json.dumps(build_batch_result(index, item, analysis, timing, False)) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        yield json.dumps({
+            "done": True,
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "processing_time": round(time.time() - start_time, 3)
+        }) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@router.post("/classify-food/multi")
+async def classify_food_multi_item(file: UploadFile = File(...), grid: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Detect several foods in one photo (e.g. a whole fridge shelf). The image is
+    split into overlapping grid x grid tiles classified in one batched pass;
+    the same food seen in several tiles is reported once.
+    """
+    start_time = time.time()
+    
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File harus berupa gambar")
+    if grid is not None and not 1 <= grid <= MULTI_ITEM_CONFIG["max_grid"]:
+        raise HTTPException(status_code=400, detail=f"Grid harus antara 1 dan {MULTI_ITEM_CONFIG['max_grid']}")
+    
+    try:
+        upload = await read_image_upload(file)
+        ensure_classifier_ready()
+        result, timing = await inference_executor.run(food_classifier.predict_multi_item, upload["data"], grid)
+    except HTTPException:
+        raise
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except InferenceQueueFullError:
+        raise HTTPException(status_code=503, detail="Server AI sedang sibuk, coba lagi nanti")
+    except InferenceTimeoutError:
+        raise HTTPException(status_code=504, detail="Klasifikasi gambar melebihi batas waktu")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error in multi-item classification: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing gambar: {str(e)}")
+    
+    for item in result["items"]:
+        item["nutritional_info"] = food_classifier.get_nutritional_info(item["food_type"])
+    
+    print(f"✅ Multi-item classification complete: {result['total_items']} item(s)")
+    return {
+        "success": True,
+        **result,
+        "processing_time": round(time.time() - start_time, 3),
+        "metadata": {
+            "file_name": file.filename,
+            "file_size": len(upload["data"]),
+            "image_dimensions": [upload["width"], upload["height"]],
+            "queue_wait": round(timing["queue_wait"], 3),
+            "inference_time": round(timing["run_time"], 3)
+        }
+    }
+
+def inventory_product_type(category: str) -> str:
+    return INVENTORY_SCAN_CONFIG["type_by_category"].get(category, INVENTORY_SCAN_CONFIG["default_type"])
+
+def default_expiry_date(type_product: str) -> date:
+    days = INVENTORY_SCAN_CONFIG["expiry_days_by_type"].get(
+        type_product, INVENTORY_SCAN_CONFIG["expiry_days_by_type"][INVENTORY_SCAN_CONFIG["default_type"]]
+    )
+    return date.today() + timedelta(days=days)
+
+async def detect_inventory_items(image_bytes: bytes, multi_item: bool) -> List[Dict[str, Any]]:
+    """Foods detected in one image as {food_type, confidence, category, source}"""
+    if multi_item:
+        result, _ = await inference_executor.run(food_classifier.predict_multi_item, image_bytes, None)
+        return result["items"]
+    analysis, _, _ = await classify_with_cache(image_bytes)
+    return [{
+        "food_type": analysis["primary_food_type"],
+        "confidence": analysis["confidence"],
+        "category": analysis["category"],
+        "source": analysis["detection_source"]
+    }]
+
+@router.post("/classify-food/inventory")
+async def classify_food_into_inventory(
+    user_id: int = Form(...),
+    files: List[UploadFile] = File(...),
+    count: int = Form(1),
+    multi_item: bool = Form(False)
+) -> Dict[str, Any]:
+    """
+    Scan and add to inventory in one call: classify one or many images (or a
+    zip archive) and insert the detected foods as the user's products in a
+    single transaction. The product type follows the food category and the
+    expiry date defaults to the category's typical shelf life. With
+    multi_item, every food found in a photo becomes its own product.
+    """
+    start_time = time.time()
+    
+    if count < 1:
+        raise HTTPException(status_code=400, detail="Jumlah produk minimal 1")
+    pool = db_manager.get_pool()
+    if not pool:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    ensure_classifier_ready()
+    items = await read_batch_uploads(files)
+    if not items:
+        raise HTTPException(status_code=400, detail="Tidak ada gambar untuk diklasifikasi")
+    
+    # Concurrent submissions share micro-batches (or the tiled pass per image)
+    valid = [item for item in items if not item["error"]]
+    try:
+        detections = await asyncio.gather(*(
+            detect_inventory_items(item["image_bytes"], multi_item) for item in valid
+        ))
+    except InferenceQueueFullError:
+        raise HTTPException(status_code=503, detail="Server AI sedang sibuk, coba lagi nanti")
+    except InferenceTimeoutError:
+        raise HTTPException(status_code=504, detail="Klasifikasi gambar melebihi batas waktu")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    skipped = [{"file_name": item["file_name"], "reason": item["error"]} for item in items if item["error"]]
+    # The same food seen several times becomes one product with the summed count
+    products: Dict[str, Dict[str, Any]] = {}
+    for item, detected in zip(valid, detections):
+        added = 0
+        for food in detected:
+            if food["source"] == "fallback" or food["confidence"] < INVENTORY_SCAN_CONFIG["min_confidence"]:
+                continue
+            type_product = inventory_product_type(food["category"])
+            product = products.get(food["food_type"])
+            if product is None:
+                product = products[food["food_type"]] = {
+                    "product_name": food["food_type"][:100],
+                    "type_product": type_product,
+                    "expiry_date": default_expiry_date(type_product),
+                    "count": 0,
+                    "confidence": food["confidence"],
+                    "category": food["category"],
+                    "file_names": []
+                }
+            product["count"] += count
+            product["confidence"] = max(product["confidence"], food["confidence"])
+            product["file_names"].append(item["file_name"])
+            added += 1
+        if not added:
+            skipped.append({"file_name": item["file_name"], "reason": "Tidak ada makanan yang dikenali"})
+    
+    inserted = []
+    if products:
+        pending = list(products.values())
+        try:
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    # One round trip for every product of the scan
+                    rows = await connection.fetch(
+                        """INSERT INTO products (user_id, product_name, expiry_date, count, type_product)
+                           SELECT $1, product_name, expiry_date, count, type_product
+                           FROM unnest($2::varchar[], $3::date[], $4::int[], $5::varchar[])
+                               AS scanned(product_name, expiry_date, count, type_product)
+                           RETURNING product_id, user_id, product_name, expiry_date, count, type_product, created_at""",
+                        user_id,
+                        [product["product_name"] for product in pending],
+                        [product["expiry_date"] for product in pending],
+                        [product["count"] for product in pending],
+                        [product["type_product"] for product in pending]
+                    )
+        except asyncpg.exceptions.ForeignKeyViolationError:
+            raise HTTPException(status_code=400, detail="Invalid user_id")
+        except Exception as e:
+            print(f"❌ Error inserting scanned products: {e}")
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        
+        by_name = {product["product_name"]: product for product in pending}
+        for row in rows:
+            product = by_name[row["product_name"]]
+            inserted.append({
+                **dict(row),
+                "confidence": round(product["confidence"], 3),
+                "category": product["category"],
+                "file_names": product["file_names"]
+            })
+    
+    print(f"🧺 Scan to inventory: {len(inserted)} product(s) added for user {user_id}")
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "products": inserted,
+        "skipped": skipped,
+        "images": len(items),
+        "processing_time": round(time.time() - start_time, 3)
+    }
+
+async def process_classification_job(image_bytes: bytes, file_name: Optional[str]) -> Dict[str, Any]:
+    """Job handler for classification_job_queue: the same result as one /classify-food/batch line"""
+    analysis, timing, cache_hit = await classify_with_cache(image_bytes)
+    result = build_batch_result(0, {"file_name": file_name, "image_bytes": image_bytes}, analysis, timing, cache_hit)
+    del result["index"]
+    return result
+
+def classifier_accepts_jobs() -> bool:
+    """Job workers only claim work once the model has settled (loaded or fallback)"""
+    return food_classifier.state in ("ready", "evicted", "failed")
+
+def parse_job_id(job_id: str) -> str:
+    try:
+        return str(uuid.UUID(job_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job tidak ditemukan")
+
+@router.post("/classify-food/jobs", status_code=202)
+async def submit_classification_job(file: UploadFile = File(...)) -> Dict[str, Any]:
+    """
+    Queue a food image for classification and return a job id immediately.
+    Poll GET /ai/classify-food/jobs/{job_id} (optionally with ?wait=seconds) for the result.
+    """
+    if not JOB_QUEUE_CONFIG["enabled"]:
+        raise HTTPException(status_code=404, detail="Antrian klasifikasi tidak aktif")
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File harus berupa gambar")
+    
+    try:
+        upload = await read_image_upload(file)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    # Jobs wait in the queue while the model warms up, so start loading without a 503
+    if food_classifier.state == "not_started":
+        food_classifier.start_background_load()
+    
+    try:
+        job_id = await classification_job_queue.submit(upload["data"], file.filename)
+    except Exception as e:
+        print(f"❌ Failed to queue classification job: {e}")
+        raise HTTPException(status_code=503, detail="Antrian klasifikasi tidak tersedia")
+    
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/ai/classify-food/jobs/{job_id}"
+    }
+
+@router.get("/classify-food/jobs/{job_id}")
+async def get_classification_job(job_id: str, wait: float = 0) -> Dict[str, Any]:
+    """
+    Status and result of a classification job. With wait > 0 the request is
+    held (long-poll, capped by AI_JOB_MAX_WAIT) until the job finishes.
+    """
+    job_id = parse_job_id(job_id)
+    try:
+        if wait > 0:
+            job = await classification_job_queue.wait(job_id, wait)
+        else:
+            job = await classification_job_queue.get(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job tidak ditemukan")
+    return job
+
 @router.get("/food-categories")
 async def get_food_categories():
     """
@@ -1268,6 +2022,28 @@ async def get_food_categories():
         "supported_languages": ["Indonesian", "English"]
     }
 
+class NutritionBatchRequest(BaseModel):
+    foods: List[str]
+
+@router.post("/nutrition")
+async def get_food_nutrition_batch(request: NutritionBatchRequest) -> Dict[str, Any]:
+    """
+    Get nutritional information for many food items in one call
+    """
+    if len(request.foods) > NUTRITION_CONFIG["max_batch_size"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maksimal {NUTRITION_CONFIG['max_batch_size']} makanan per permintaan"
+        )
+    
+    results = nutrition_store.lookup_many(request.foods)
+    return {
+        "success": True,
+        "total": len(results),
+        "found": sum(1 for result in results if result["found"]),
+        "results": results
+    }
+
 @router.get("/nutrition/{food_name}")
 async def get_food_nutrition(food_name: str):
     """
@@ -1296,15 +2072,37 @@ async def get_model_status():
     """
     try:
         model_status = {
-            "model_loaded": food_classifier.classifier_pipeline is not None,
+            "model_loaded": food_classifier.stage is not None,
+            "state": food_classifier.state,
+            "active_model": food_classifier.model_name,
+            "model_version": food_classifier.model_version,
+            "inference_backend": food_classifier.backend_report,
+            "load_time": food_classifier.load_time,
+            "load_error": food_classifier.load_error,
             "device": str(food_classifier.device),
             "available_models": food_classifier.food_models,
             "translation_support": len(food_classifier.translation_dict),
-            "ready": food_classifier.classifier_pipeline is not None
+            "ready": food_classifier.is_ready(),
+            "cascade": food_classifier.get_cascade_stats(),
+            "replicas": food_classifier.replica_pool.get_stats() if food_classifier.replica_pool else None,
+            "inference_executor": inference_executor.get_stats(),
+            "batching": food_batcher.get_stats(),
+            "cache": classification_cache.get_stats(),
+            "jobs": classification_job_queue.get_stats(),
+            "stage_latency": classification_metrics.get_stats(),
+            "model_registry": model_registry.get_stats(),
+            "memory": model_residency.get_stats(),
+            "versions": food_classifier.get_version_status()
         }
         
-        if food_classifier.classifier_pipeline is not None:
+        if food_classifier.stage is not None:
             model_status["model_info"] = "Specialized food classification model loaded"
+        elif food_classifier.state == "evicted":
+            model_status["model_info"] = "Model unloaded after inactivity - reloads on the next request"
+        elif food_classifier.state == "loading":
+            model_status["model_info"] = "Model is loading in the background"
+        elif food_classifier.state == "failed":
+            model_status["model_info"] = "Model failed to load - using fallback predictions"
         else:
             model_status["model_info"] = "Model not loaded - will initialize on first use"
         
@@ -1314,4 +2112,68 @@ async def get_model_status():
         return {
             "error": str(e),
             "model_loaded": False
-        }
\ No newline at end of file
+        }
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints are only enabled when AI_ADMIN_TOKEN is configured"""
+    expected = HOT_SWAP_CONFIG["admin_token"]
+    if not expected or x_admin_token != expected:
+        raise HTTPException(status_code=403, detail="Akses admin ditolak")
+
+class ModelSwapRequest(BaseModel):
+    model_name: str
+    stage: str = "full"  # "full" model, or the cascade's "fast" model
+    
+    class Config:
+        protected_namespaces = ()
+
+@router.post("/admin/model-swap", status_code=202, dependencies=[Depends(require_admin_token)])
+async def swap_model(request: ModelSwapRequest):
+    """
+    Replace the food classifier with another model without downtime. The new
+    model loads and warms up in the background while the current one keeps
+    serving; poll GET /ai/admin/model-swap for progress.
+    """
+    if request.stage not in ("full", "fast"):
+        raise HTTPException(status_code=400, detail="Stage harus 'full' atau 'fast'")
+    try:
+        started = food_classifier.start_model_swap(request.model_name, request.stage)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not started:
+        raise HTTPException(
+            status_code=409,
+            detail="Model belum siap atau penggantian model lain sedang berjalan"
+        )
+    return {
+        "success": True,
+        "message": f"Penggantian model ke {request.model_name} dimulai",
+        "swap": food_classifier.get_version_status()["swap"]
+    }
+
+@router.get("/admin/model-swap", dependencies=[Depends(require_admin_token)])
+async def get_model_swap_status():
+    """
+    Progress of the last model swap and the versions currently loaded
+    """
+    return food_classifier.get_version_status()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    """
+    Per-stage latency histograms of the classification pipeline, in the Prometheus text format
+    """
+    return classification_metrics.render_prometheus()
+
+@router.get("/ready")
+async def readiness_probe():
+    """
+    Readiness probe for the food classifier: 200 once the model is ready, 503 otherwise
+    """
+    body = {
+        "ready": food_classifier.is_ready(),
+        "state": food_classifier.state
+    }
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
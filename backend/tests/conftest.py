@@ -0,0 +1,117 @@
+"""
+Shared fixtures. Run from backend/: python -m pytest tests
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def tiny_chat_model(tmp_path_factory):
+    """
+    A 2-layer GPT-2 with random weights and a byte-level tokenizer without
+    merges (one token per byte, EOS = 256): the DialoGPT code paths without
+    a download.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+    files = tmp_path_factory.mktemp("tiny_chat_model")
+    vocab = {char: index for index, char in enumerate(bytes_to_unicode().values())}
+    vocab["<|endoftext|>"] = len(vocab)
+    (files / "vocab.json").write_text(json.dumps(vocab))
+    (files / "merges.txt").write_text("#version: 0.2\n")
+    tokenizer = transformers.GPT2Tokenizer(str(files / "vocab.json"), str(files / "merges.txt"))
+
+    torch.manual_seed(0)
+    model = transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=len(vocab), n_positions=1024, n_embd=32, n_layer=2, n_head=2,
+        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id
+    ))
+    model.eval()
+    return tokenizer, model
+
+@pytest.fixture
+def chat_client(monkeypatch, tiny_chat_model):
+    """
+    /ai routes with the tiny model loaded as the chat model. The quality
+    gates are opened, since a random model never writes a good reply; the
+    tests check the plumbing, not the prose.
+    """
+    import torch
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from routers import food_ai
+
+    chat_tokenizer, chat_model = tiny_chat_model
+    monkeypatch.setattr(food_ai, "tokenizer", chat_tokenizer)
+    monkeypatch.setattr(food_ai, "model", chat_model)
+    monkeypatch.setattr(food_ai, "chatbot_pipeline", object())  # Marks the chat model as loaded
+    monkeypatch.setattr(food_ai, "device", "cpu")
+    monkeypatch.setattr(food_ai, "is_response_quality_good", lambda response, message: True)
+    monkeypatch.setattr(food_ai, "is_bad_response", lambda response: False)
+    torch.manual_seed(0)
+
+    app = FastAPI()
+    app.include_router(food_ai.router, prefix="/ai")
+    return TestClient(app)
+
+STUB_REPLY = "Try this: stir fry the chicken with garlic, ginger and a splash of soy sauce."
+
+class StubTokenizer:
+    """Byte-level stand-in for the DialoGPT tokenizer: one token per UTF-8 byte, EOS = 256"""
+    eos_token = "<|endoftext|>"
+    eos_token_id = 256
+
+    def encode(self, text, return_tensors=None):
+        return list(text.replace(self.eos_token, "").encode("utf-8")) + [self.eos_token_id] * text.count(self.eos_token)
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return bytes(t for t in token_ids if t != self.eos_token_id).decode("utf-8", errors="replace")
+
+@pytest.fixture
+def stub_chat_client(monkeypatch):
+    """
+    /ai routes with the chat model stubbed out: no torch, and both generation
+    paths (continuous batching and the executor) answer STUB_REPLY, token by
+    token. The quality gates stay as they are, so a reply that comes back as
+    the fallback shows up as a failure. client.generated records which path ran.
+    """
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from routers import food_ai
+
+    chat_tokenizer = StubTokenizer()
+    generated = []
+    reply_ids = chat_tokenizer.encode(STUB_REPLY) + [chat_tokenizer.eos_token_id]
+
+    async def engine_generate(chat_model, tokenizer, prompt, on_token=None, cache_key=None, turn_text=None):
+        generated.append("engine")
+        for token_id in reply_ids[:-1]:
+            if on_token is not None:
+                on_token(token_id)
+        return " " + STUB_REPLY, len(tokenizer.encode(prompt)) + len(reply_ids)
+
+    def executor_generate(tokenizer, chat_model, conversation_text, *args, **kwargs):
+        generated.append("executor")
+        on_token = kwargs.get("on_token") or (args[0] if args else None)
+        for token_id in reply_ids[:-1]:
+            if on_token is not None:
+                on_token(token_id)
+        return " " + STUB_REPLY, len(tokenizer.encode(conversation_text)) + len(reply_ids)
+
+    monkeypatch.setattr(food_ai, "tokenizer", chat_tokenizer)
+    monkeypatch.setattr(food_ai, "model", object())
+    monkeypatch.setattr(food_ai, "chatbot_pipeline", object())  # Marks the chat model as loaded
+    monkeypatch.setattr(food_ai.chat_engine, "generate", engine_generate)
+    monkeypatch.setattr(food_ai, "run_dialogpt_generation", executor_generate)
+
+    app = FastAPI()
+    app.include_router(food_ai.router, prefix="/ai")
+    client = TestClient(app)
+    client.generated = generated
+    return client
@@ -0,0 +1,120 @@
+"""
+/ai/chat generation path
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from config.ai import CHAT_BATCHING_CONFIG
+from conftest import STUB_REPLY
+from routers import food_ai
+
+def parse_sse(body: str) -> List[Tuple[str, Dict[str, Any]]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_chat_turn_uses_the_model(chat_client):
+    reply = chat_client.post("/ai/chat", json={"message": "halo, masak apa hari ini?"}).json()
+
+    assert "error" not in reply
+    assert reply["model_used"] == food_ai.MODEL_NAME
+    assert reply["response"]
+
+def test_clean_ai_response_is_not_shadowed():
+    assert food_ai.clean_ai_response("Bot: enak sekali ", "halo") == "enak sekali"
+
+def test_stream_done_event_matches_streamed_text(chat_client):
+    message = "halo, masak apa hari ini?"
+    with chat_client.stream("POST", "/ai/chat/stream", json={"message": message}) as response:
+        events = parse_sse("".join(response.iter_text()))
+
+    pieces = [data["text"] for event, data in events if event == "token"]
+    event, done = events[-1]
+    assert event == "done"
+    assert pieces
+    assert done["model_used"] == food_ai.MODEL_NAME
+    assert done["response"] == food_ai.clean_ai_response("".join(pieces), message)
+
+def test_text_decoder_flushes_held_back_characters():
+    class ByteTokenizer:
+        def decode(self, token_ids, skip_special_tokens=True):
+            return bytes(token_ids).decode("utf-8", errors="replace")
+
+    pieces = []
+    on_token, flush = food_ai.incremental_text_decoder(ByteTokenizer(), pieces.append)
+    for token_id in " enak \xc3\xa9 \xe2".encode("latin-1"):
+        on_token(token_id)
+    assert "".join(pieces) == "enak \u00e9 "
+
+    flush()
+    assert "".join(pieces) == "enak \u00e9 \ufffd"
+
+def test_second_turn_reuses_the_kv_cache(chat_client):
+    hits = food_ai.chat_kv_cache.get_stats()["hits"]
+
+    for message in ("halo!", "resep telur dadar dong"):
+        reply = chat_client.post("/ai/chat", json={"message": message, "conversation_id": "kv-reuse"}).json()
+        assert reply["model_used"] == food_ai.MODEL_NAME
+
+    assert food_ai.chat_kv_cache.get_stats()["hits"] == hits + 1
+
+@pytest.mark.parametrize("batching", [True, False])
+def test_chat_returns_the_generated_reply(stub_chat_client, monkeypatch, batching):
+    monkeypatch.setitem(CHAT_BATCHING_CONFIG, "enabled", batching)
+
+    reply = stub_chat_client.post("/ai/chat", json={"message": "what should I cook with chicken"}).json()
+
+    assert stub_chat_client.generated == ["engine" if batching else "executor"]
+    assert reply["response"] == STUB_REPLY
+    assert reply["model_used"] == food_ai.MODEL_NAME
+
+def test_generate_ai_response_keeps_the_reply(stub_chat_client):
+    result = asyncio.run(food_ai.generate_ai_response("what should I cook with chicken", [], []))
+
+    assert result["response"] == STUB_REPLY
+    assert result["model_used"] == food_ai.MODEL_NAME
+
+@pytest.mark.parametrize("batching", [True, False])
+def test_stream_sends_tokens_with_and_without_batching(stub_chat_client, monkeypatch, batching):
+    monkeypatch.setitem(CHAT_BATCHING_CONFIG, "enabled", batching)
+    message = "what should I cook with chicken"
+
+    with stub_chat_client.stream("POST", "/ai/chat/stream", json={"message": message}) as response:
+        events = parse_sse("".join(response.iter_text()))
+
+    pieces = [data["text"] for event, data in events if event == "token"]
+    event, done = events[-1]
+    assert stub_chat_client.generated == ["engine" if batching else "executor"]
+    assert len(pieces) > 1
+    assert "".join(pieces) == STUB_REPLY
+    assert event == "done" and done["response"] == STUB_REPLY
+
+def test_streamer_skips_the_prompt_and_eos():
+    import numpy as np
+
+    seen = []
+    streamer = food_ai.TokenCallbackStreamer(seen.append, eos_token_id=256)
+    streamer.put(np.array([[1, 2, 3]]))  # The prompt
+    for token_id in (72, 105, 256):
+        streamer.put(np.array([token_id]))
+    streamer.end()
+
+    assert seen == [72, 105]
+
+def test_stream_without_batching_uses_the_model(chat_client, monkeypatch):
+    monkeypatch.setitem(CHAT_BATCHING_CONFIG, "enabled", False)
+    message = "halo, masak apa hari ini?"
+
+    with chat_client.stream("POST", "/ai/chat/stream", json={"message": message}) as response:
+        events = parse_sse("".join(response.iter_text()))
+
+    pieces = [data["text"] for event, data in events if event == "token"]
+    event, done = events[-1]
+    assert pieces
+    assert done["model_used"] == food_ai.MODEL_NAME
+    assert done["response"] == food_ai.clean_ai_response("".join(pieces), message)
@@ -0,0 +1,114 @@
+"""
+Classification cache: LRU byte budget, TTL and the disk tier
+"""
+import json
+
+import pytest
+
+from models import classification_cache as classification_cache_module
+from models.classification_cache import ClassificationCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(classification_cache_module, "time", clock)
+    return clock
+
+def payload_size(value) -> int:
+    return len(json.dumps(value, separators=(",", ":")))
+
+def analysis(name: str):
+    return {"primary_food_type": name, "confidence": 0.9}
+
+def test_key_depends_on_image_model_and_version():
+    key = ClassificationCache.make_key(b"image", "model", "v1")
+
+    assert key == ClassificationCache.make_key(b"image", "model", "v1")
+    assert key != ClassificationCache.make_key(b"other", "model", "v1")
+    assert key != ClassificationCache.make_key(b"image", "model", "v2")
+    assert key != ClassificationCache.make_key(b"image", "other", "v1")
+
+def test_hits_return_independent_copies(clock):
+    cache = ClassificationCache(max_bytes=10_000, ttl=60)
+    cache.put("a", analysis("Apel"))
+
+    first = cache.get("a")
+    first["primary_food_type"] = "changed"
+
+    assert cache.get("a") == analysis("Apel")
+    assert cache.get_stats()["hits"] == 2
+
+def test_least_recently_used_entry_is_evicted_over_the_byte_budget(clock):
+    entry_size = payload_size(analysis("Apel"))
+    cache = ClassificationCache(max_bytes=entry_size * 2, ttl=60)
+    cache.put("a", analysis("Apel"))
+    cache.put("b", analysis("Nasi"))
+    cache.get("a")  # a is now more recent than b
+
+    cache.put("c", analysis("Sate"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == analysis("Apel")
+    assert cache.get("c") == analysis("Sate")
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == entry_size * 2
+
+def test_entry_larger_than_the_budget_is_not_kept(clock):
+    cache = ClassificationCache(max_bytes=10, ttl=60)
+
+    cache.put("a", analysis("Apel"))
+
+    assert cache.get("a") is None
+    assert cache.get_stats()["bytes"] == 0
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ClassificationCache(max_bytes=10_000, ttl=60)
+    cache.put("a", analysis("Apel"))
+
+    clock.now += 59
+    assert cache.get("a") is not None
+    clock.now += 2
+    assert cache.get("a") is None
+
+    stats = cache.get_stats()
+    assert stats["expired"] == 1
+    assert stats["entries"] == 0
+
+def test_disk_tier_survives_a_restart(clock, tmp_path):
+    ClassificationCache(max_bytes=10_000, ttl=60, disk_dir=str(tmp_path)).put("ab12", analysis("Apel"))
+
+    restarted = ClassificationCache(max_bytes=10_000, ttl=60, disk_dir=str(tmp_path))
+
+    assert restarted.get("ab12") == analysis("Apel")
+    assert restarted.get_stats()["disk_hits"] == 1
+    # Promoted to memory: the next hit does not touch the disk
+    assert restarted.get("ab12") == analysis("Apel")
+    assert restarted.get_stats()["hits"] == 1
+
+def test_disk_tier_honours_the_ttl(clock, tmp_path):
+    ClassificationCache(max_bytes=10_000, ttl=60, disk_dir=str(tmp_path)).put("ab12", analysis("Apel"))
+    path = tmp_path / "ab" / "ab12.json"
+    assert path.exists()
+
+    clock.now += 61
+    restarted = ClassificationCache(max_bytes=10_000, ttl=60, disk_dir=str(tmp_path))
+
+    assert restarted.get("ab12") is None
+    assert not path.exists()
+    assert restarted.get_stats()["expired"] == 1
+
+def test_corrupt_disk_entry_is_a_miss(clock, tmp_path):
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "ab12.json").write_text("not a timestamp\n{}", encoding="utf-8")
+    cache = ClassificationCache(max_bytes=10_000, ttl=60, disk_dir=str(tmp_path))
+
+    assert cache.get("ab12") is None
+    assert cache.get_stats()["misses"] == 1
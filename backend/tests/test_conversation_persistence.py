@@ -0,0 +1,235 @@
+"""
+Conversation write-behind: batched flushes, cross-worker invalidation and deletes,
+against an in-memory stand-in for the chat_messages table and NOTIFY
+"""
+import asyncio
+import json
+
+import pytest
+
+from database.connection import db_manager
+from models import conversation_store as conversation_store_module
+from models.conversation_store import NOTIFY_CHANNEL, ConversationStore
+
+class FakePostgres:
+    def __init__(self):
+        self.rows = []
+        self.listeners = []
+        self.acquired = 0
+        self.dedicated = []
+        self.fail_inserts = False
+
+    def connection(self):
+        return FakeConnection(self)
+
+class FakeConnection:
+    def __init__(self, db: FakePostgres):
+        self.db = db
+        self.closed = False
+
+    async def fetch(self, query, conversation_id, limit):
+        rows = sorted(
+            (row for row in self.db.rows if row["conversation_id"] == conversation_id),
+            key=lambda row: (row["created_at"], row["message_id"])
+        )
+        return rows[-limit:]
+
+    async def execute(self, query, *args):
+        if "INSERT" in query:
+            if self.db.fail_inserts:
+                raise ConnectionError("connection reset")
+            for conversation_id, role, content, created_at in zip(*args):
+                self.db.rows.append({
+                    "message_id": len(self.db.rows) + 1, "conversation_id": conversation_id,
+                    "role": role, "content": content, "created_at": created_at
+                })
+            return f"INSERT 0 {len(args[0])}"
+        if "pg_notify" in query:
+            loop = asyncio.get_running_loop()
+            for connection, callback in self.db.listeners:
+                loop.call_soon(callback, connection, 1, args[0], args[1])
+            return "SELECT 1"
+        if "DELETE" in query:
+            before = len(self.db.rows)
+            self.db.rows = [row for row in self.db.rows if row["conversation_id"] != args[0]]
+            return f"DELETE {before - len(self.db.rows)}"
+        raise AssertionError(f"unexpected query: {query}")
+
+    async def add_listener(self, channel, callback):
+        assert channel == NOTIFY_CHANNEL
+        self.db.listeners.append((self, callback))
+
+    async def remove_listener(self, channel, callback):
+        self.db.listeners.remove((self, callback))
+
+    async def close(self):
+        self.closed = True
+
+class FakePool:
+    def __init__(self, db: FakePostgres):
+        self.db = db
+
+    def acquire(self):
+        return FakeAcquire(self.db)
+
+class FakeAcquire:
+    def __init__(self, db: FakePostgres):
+        self.db = db
+
+    async def __aenter__(self):
+        self.db.acquired += 1
+        return self.db.connection()
+
+    async def __aexit__(self, *exc_info):
+        self.db.acquired -= 1
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakePostgres()
+
+    async def connect(**kwargs):
+        connection = db.connection()
+        db.dedicated.append(connection)
+        return connection
+
+    monkeypatch.setattr(db_manager, "pool", FakePool(db))
+    monkeypatch.setattr(conversation_store_module.asyncpg, "connect", connect)
+    return db
+
+def make_store() -> ConversationStore:
+    return ConversationStore(max_messages=4, ttl=3600, max_conversations=100, persist=True, flush_interval=0.02)
+
+async def settle():
+    """Let the flush loop run and queued notifications be delivered"""
+    await asyncio.sleep(0.1)
+
+def test_appends_are_written_in_one_batch_later(db):
+    async def run():
+        store = make_store()
+        await store.start()
+        store.append("c1", "user", "halo")
+        store.append("c1", "assistant", "hai")
+        store.append("c2", "user", "resep?")
+        written_on_append = len(db.rows)
+        await settle()
+        stats = store.get_stats()["persistence"]
+        await store.stop()
+        return written_on_append, stats
+
+    written_on_append, stats = asyncio.run(run())
+
+    assert written_on_append == 0
+    assert [row["content"] for row in db.rows] == ["halo", "hai", "resep?"]
+    assert stats["flushes"] == 1
+    assert stats["flushed_messages"] == 3
+    assert stats["pending_writes"] == 0
+    # Stored as UTC-aware datetimes, to compare correctly with CURRENT_TIMESTAMP
+    assert all(row["created_at"].utcoffset().total_seconds() == 0 for row in db.rows)
+
+def test_listener_has_its_own_connection(db):
+    async def run():
+        store = make_store()
+        await store.start()
+        listening = store.get_stats()["persistence"]["listening"]
+        held_from_pool = db.acquired
+        await store.stop()
+        return listening, held_from_pool
+
+    listening, held_from_pool = asyncio.run(run())
+
+    assert listening
+    assert held_from_pool == 0
+    assert len(db.dedicated) == 1 and db.dedicated[0].closed
+    assert db.listeners == []
+
+def test_other_workers_drop_and_reload_changed_conversations(db):
+    async def run():
+        worker_a, worker_b = make_store(), make_store()
+        evicted = []
+        worker_a.on_evict = evicted.append
+        await worker_a.start()
+        await worker_b.start()
+
+        worker_a.append("c1", "user", "halo")
+        await settle()
+        await worker_b.load("c1")
+        worker_b.append("c1", "assistant", "hai dari b")
+        await settle()
+
+        still_cached = "c1" in worker_a._conversations
+        await worker_a.load("c1")
+        contents = [message["content"] for message in worker_a.messages("c1")]
+        invalidations = worker_a.get_stats()["persistence"]["invalidations"]
+        await worker_a.stop()
+        await worker_b.stop()
+        return still_cached, contents, invalidations, evicted
+
+    still_cached, contents, invalidations, evicted = asyncio.run(run())
+
+    assert not still_cached
+    assert contents == ["halo", "hai dari b"]
+    assert invalidations == 1
+    assert evicted == ["c1"]
+
+def test_delete_reaches_table_pending_writes_and_other_workers(db):
+    async def run():
+        worker_a, worker_b = make_store(), make_store()
+        await worker_a.start()
+        await worker_b.start()
+
+        worker_a.append("c1", "user", "halo")
+        await settle()
+        await worker_b.load("c1")
+        worker_b.append("c1", "user", "belum ditulis")
+        deleted = await worker_b.delete("c1")
+        await settle()
+
+        cached = ("c1" in worker_a._conversations, "c1" in worker_b._conversations)
+        await worker_a.stop()
+        await worker_b.stop()
+        return deleted, cached
+
+    deleted, cached = asyncio.run(run())
+
+    assert deleted
+    assert cached == (False, False)
+    assert db.rows == []
+
+def test_failed_flush_keeps_messages_for_the_next_one(db):
+    async def run():
+        store = make_store()
+        await store.start()
+        db.fail_inserts = True
+        store.append("c1", "user", "halo")
+        await settle()
+        failed = store.get_stats()["persistence"]
+        db.fail_inserts = False
+        store.append("c1", "user", "lagi")
+        await settle()
+        await store.stop()
+        return failed
+
+    failed = asyncio.run(run())
+
+    assert failed["flush_failures"] >= 1
+    assert failed["pending_writes"] == 1
+    assert [row["content"] for row in db.rows] == ["halo", "lagi"]
+
+def test_notifications_are_split_under_the_payload_limit(db, monkeypatch):
+    monkeypatch.setattr(conversation_store_module, "MAX_NOTIFY_BYTES", 100)
+    sent = []
+
+    async def run():
+        store = make_store()
+
+        async def send(connection, event, conversation_ids):
+            sent.append(json.dumps(conversation_ids))
+
+        store._send = send
+        await store._publish(db.connection(), "updated", [f"conversation-{i:03d}" for i in range(20)])
+
+    asyncio.run(run())
+
+    assert len(sent) > 1
+    assert sum(len(json.loads(payload)) for payload in sent) == 20
+    assert all(len(payload) <= 100 for payload in sent)
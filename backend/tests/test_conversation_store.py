@@ -0,0 +1,108 @@
+"""
+Conversation store bounds: messages per conversation, TTL and the conversation cap
+"""
+import pytest
+
+from models import conversation_store as conversation_store_module
+from models.conversation_store import ConversationStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(conversation_store_module, "time", clock)
+    return clock
+
+@pytest.fixture
+def evicted():
+    return []
+
+def make_store(evicted, max_messages=3, ttl=60, max_conversations=2) -> ConversationStore:
+    store = ConversationStore(max_messages=max_messages, ttl=ttl, max_conversations=max_conversations)
+    store.on_evict = evicted.append
+    return store
+
+def test_oldest_messages_are_dropped_past_max_messages(clock, evicted):
+    store = make_store(evicted)
+    for i in range(5):
+        count = store.append("c1", "user" if i % 2 == 0 else "assistant", f"m{i}")
+
+    assert count == 3
+    assert [message["content"] for message in store.messages("c1")] == ["m2", "m3", "m4"]
+    assert [message["role"] for message in store.messages("c1")] == ["user", "assistant", "user"]
+    assert store.get_stats()["total_messages"] == 3
+    assert evicted == []
+
+def test_least_recently_active_conversation_is_evicted(clock, evicted):
+    store = make_store(evicted)
+    store.append("c1", "user", "a")
+    clock.now += 1
+    store.append("c2", "user", "b")
+    clock.now += 1
+    store.append("c1", "user", "c")  # c1 is now more recent than c2
+    clock.now += 1
+
+    store.append("c3", "user", "d")
+
+    assert evicted == ["c2"]
+    assert store.messages("c2") == []
+    assert [message["content"] for message in store.messages("c1")] == ["a", "c"]
+    stats = store.get_stats()
+    assert stats["evicted_conversations"] == 1
+    assert stats["total_conversations"] == 2
+    assert stats["total_messages"] == 3
+
+def test_idle_conversations_expire_after_the_ttl(clock, evicted):
+    store = make_store(evicted)
+    store.append("c1", "user", "a")
+    clock.now += 30
+    store.append("c2", "user", "b")
+
+    clock.now += 31
+    stats = store.get_stats()
+
+    assert evicted == ["c1"]
+    assert stats["expired_conversations"] == 1
+    assert stats["total_conversations"] == 1
+    assert store.messages("c2")[0]["content"] == "b"
+
+def test_activity_keeps_a_conversation_alive(clock, evicted):
+    store = make_store(evicted)
+    for _ in range(5):
+        store.append("c1", "user", "still here")
+        clock.now += 50
+
+    assert evicted == []
+    assert len(store.messages("c1")) == 3
+
+def test_counters_match_a_full_recount(clock, evicted):
+    store = make_store(evicted, max_messages=4, max_conversations=5)
+    for i in range(40):
+        store.append(f"c{i % 7}", "user", str(i))
+        clock.now += 3
+
+    stats = store.get_stats()
+    conversations = store._conversations
+
+    assert stats["total_conversations"] == len(conversations) <= 5
+    assert stats["total_messages"] == sum(len(c.messages) for c in conversations.values())
+    assert all(len(c.messages) <= 4 for c in conversations.values())
+
+def test_failing_eviction_callback_does_not_break_appends(clock):
+    store = ConversationStore(max_messages=3, ttl=60, max_conversations=1)
+
+    def broken(conversation_id):
+        raise RuntimeError("callback failed")
+
+    store.on_evict = broken
+    store.append("c1", "user", "a")
+    store.append("c2", "user", "b")
+
+    assert store.messages("c2")[0]["content"] == "b"
+    assert store.messages("c1") == []
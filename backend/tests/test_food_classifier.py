@@ -0,0 +1,80 @@
+"""
+Food classifier: cascade reporting and decode timing, with fake backends (no torch)
+"""
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from config.ai import DECODE_CONFIG
+from models.food_classifier import ClassifierStage, FoodClassifier
+
+class FakeBackend:
+    def __init__(self, name: str, score: float):
+        self.name = name
+        self.score = score
+
+    def __call__(self, images):
+        return [[{"label": "banana", "score": self.score}] for _ in images]
+
+def make_stage(model_name: str, backend: FakeBackend) -> ClassifierStage:
+    return ClassifierStage(model_name, None, backend, {}, "v1", {}, 224)
+
+@pytest.fixture
+def image_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color="yellow").save(buffer, "PNG")
+    return buffer.getvalue()
+
+def make_classifier(fast_score: float) -> FoodClassifier:
+    classifier = FoodClassifier()
+    classifier.stage = make_stage("full-model", FakeBackend("pipeline", 0.9))
+    classifier.fast_stage = make_stage("fast-model", FakeBackend("onnx", fast_score))
+    classifier.cascade_threshold = 0.8
+    classifier.input_size = 224
+    classifier.state = "ready"
+    return classifier
+
+def test_fast_answer_reports_fast_backend(image_bytes):
+    analysis = make_classifier(fast_score=0.95).predict_food_categories(image_bytes)
+
+    assert analysis["processing_metadata"]["cascade"]["stage"] == "fast"
+    assert analysis["processing_metadata"]["inference_backend"] == "onnx"
+
+def test_escalated_answer_reports_full_backend(image_bytes):
+    analysis = make_classifier(fast_score=0.3).predict_food_categories(image_bytes)
+
+    assert analysis["processing_metadata"]["cascade"]["stage"] == "full"
+    assert analysis["processing_metadata"]["inference_backend"] == "pipeline"
+
+def test_multi_item_reports_backends_that_answered(image_bytes):
+    result = make_classifier(fast_score=0.95).predict_multi_item(image_bytes, grid=2)
+
+    assert result["processing_metadata"]["inference_backend"] == "onnx"
+
+def test_full_decode_calibration_stays_off_the_request_thread(monkeypatch):
+    monkeypatch.setitem(DECODE_CONFIG, "fast_decode", True)
+    monkeypatch.setitem(DECODE_CONFIG, "calibrate_every", 1)
+    classifier = FoodClassifier()
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 900), color="orange").save(buffer, "JPEG")
+    full_decode_threads = []
+    original_decode_full = classifier._decode_full
+
+    def recording_decode_full(image_bytes, marks=None):
+        full_decode_threads.append(threading.current_thread().name)
+        return original_decode_full(image_bytes, marks)
+
+    monkeypatch.setattr(classifier, "_decode_full", recording_decode_full)
+
+    _, first = classifier._decode_image(buffer.getvalue())
+    deadline = time.time() + 5
+    while "JPEG" not in classifier._full_decode_ms_per_mp and time.time() < deadline:
+        time.sleep(0.01)
+    _, second = classifier._decode_image(buffer.getvalue())
+
+    assert first["saved_ms_basis"] == "default"
+    assert second["saved_ms_basis"] == "calibrated"
+    assert full_decode_threads and threading.current_thread().name not in full_decode_threads
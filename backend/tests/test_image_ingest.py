@@ -0,0 +1,64 @@
+"""
+Upload body cap: oversized requests are refused before the form is parsed
+"""
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from models.image_ingest import UploadSizeLimitMiddleware
+
+LIMIT = 1024
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    parsed = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        parsed.append(file.filename)
+        return {"size": len(await file.read())}
+
+    @app.post("/open")
+    async def open_upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/upload": LIMIT})
+    client = TestClient(app)
+    client.parsed = parsed
+    return client
+
+def test_small_upload_passes(client):
+    response = client.post("/upload", files={"file": ("a.jpg", b"x" * 100, "image/jpeg")})
+
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+def test_declared_length_over_limit_is_refused_unread(client):
+    response = client.post("/upload", files={"file": ("a.jpg", b"x" * (LIMIT * 4), "image/jpeg")})
+
+    assert response.status_code == 413
+    assert client.parsed == []
+
+def test_chunked_body_over_limit_is_cut_off(client):
+    boundary = "limit-test"
+    payload = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n".encode() + b"x" * (LIMIT * 4) + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+    def body():
+        # A generator has no length, so the request goes out chunked without Content-Length
+        for start in range(0, len(payload), 512):
+            yield payload[start:start + 512]
+
+    response = client.post("/upload", content=body(), headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+
+    assert response.status_code == 413
+    assert "content-length" not in {k.lower() for k in response.request.headers}
+    assert client.parsed == []
+
+def test_other_paths_are_not_limited(client):
+    response = client.post("/open", files={"file": ("a.jpg", b"x" * (LIMIT * 4), "image/jpeg")})
+
+    assert response.status_code == 200
@@ -0,0 +1,64 @@
+"""
+Backend selection: optimized backends are only reported as passing parity on real samples
+"""
+import pytest
+from PIL import Image
+
+from config.ai import BACKEND_CONFIG
+from models import inference_backend
+from models.inference_backend import OnnxRuntimeBackend, create_backend
+
+class FakePipeline:
+    """Stands in for the transformers pipeline: always predicts the same label"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.calls = 0
+
+    def __call__(self, images, batch_size=None):
+        self.calls += 1
+        return [[{"label": self.label, "score": 0.9}] for _ in images]
+
+class FakeOnnx(FakePipeline):
+    name = "onnx"
+
+@pytest.fixture
+def onnx_requested(monkeypatch):
+    candidate = FakeOnnx("rendang")
+    monkeypatch.setitem(BACKEND_CONFIG, "backend", "onnx")
+    monkeypatch.setitem(BACKEND_CONFIG, "num_threads", 0)
+    monkeypatch.setattr(OnnxRuntimeBackend, "from_pipeline", classmethod(lambda cls, *args: candidate))
+    return candidate
+
+@pytest.fixture
+def sample_dir(tmp_path, monkeypatch):
+    for index in range(3):
+        Image.new("RGB", (32, 32), color=(index * 80, 40, 40)).save(tmp_path / f"sample_{index}.jpg")
+    monkeypatch.setitem(BACKEND_CONFIG, "parity_sample_dir", str(tmp_path))
+    return tmp_path
+
+def test_without_samples_parity_is_unverified(onnx_requested, monkeypatch):
+    monkeypatch.setitem(BACKEND_CONFIG, "parity_sample_dir", None)
+
+    backend, report = create_backend(FakePipeline("rendang"), "food-model", "v1")
+
+    assert backend is onnx_requested
+    assert report["parity"] == "unverified"
+    assert report["parity_details"] is None
+    # Still smoke-tested so a broken export is caught at load time
+    assert onnx_requested.calls == 1
+
+def test_real_samples_pass_parity(onnx_requested, sample_dir):
+    backend, report = create_backend(FakePipeline("rendang"), "food-model", "v1")
+
+    assert backend is onnx_requested
+    assert report["parity"] == "passed"
+    assert report["parity_details"]["samples"] == 3
+    assert report["parity_details"]["top1_agreement"] == 1.0
+
+def test_disagreement_falls_back_to_reference(onnx_requested, sample_dir):
+    backend, report = create_backend(FakePipeline("sate"), "food-model", "v1")
+
+    assert isinstance(backend, inference_backend.PipelineBackend)
+    assert report["parity"] == "failed"
+    assert report["active"] == "pipeline"
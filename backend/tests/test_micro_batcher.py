@@ -0,0 +1,151 @@
+"""
+Micro-batcher: requests inside the wait window share one batch call
+"""
+import asyncio
+import threading
+
+import pytest
+
+from models.inference_executor import InferenceExecutor, InferenceQueueFullError
+from models.micro_batcher import MicroBatcher
+
+class RecordingBatchFn:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return [item * 10 for item in items]
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor("test", max_workers=2, max_queue_size=4, timeout=5)
+    yield executor
+    executor.shutdown()
+
+def test_requests_inside_the_window_share_one_batch(executor):
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher("test", batch_fn, executor, max_batch_size=8, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    results = asyncio.run(run())
+
+    assert [result for result, _ in results] == [0, 10, 20, 30, 40]
+    assert all(timing["batch_size"] == 5 for _, timing in results)
+    assert batch_fn.batches == [[0, 1, 2, 3, 4]]
+    assert batcher.get_stats()["largest_batch"] == 5
+
+def test_full_batch_is_sent_without_waiting_out_the_window(executor):
+    batch_fn = RecordingBatchFn()
+    # A long window: only reaching max_batch_size can end a batch this quickly
+    batcher = MicroBatcher("test", batch_fn, executor, max_batch_size=2, max_wait_ms=5000)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), timeout=2)
+
+    results = asyncio.run(run())
+
+    assert [result for result, _ in results] == [0, 10, 20, 30]
+    assert batch_fn.batches == [[0, 1], [2, 3]]
+
+def test_late_arrivals_start_a_new_batch(executor):
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher("test", batch_fn, executor, max_batch_size=8, max_wait_ms=20)
+
+    async def run():
+        first = [asyncio.ensure_future(batcher.submit(i)) for i in range(2)]
+        await asyncio.sleep(0.2)
+        second = [asyncio.ensure_future(batcher.submit(i)) for i in range(2, 4)]
+        return await asyncio.gather(*first, *second)
+
+    asyncio.run(run())
+
+    assert batch_fn.batches == [[0, 1], [2, 3]]
+    assert batcher.get_stats()["batches"] == 2
+
+def test_batch_failure_reaches_every_caller(executor):
+    batcher = MicroBatcher("test", RecordingBatchFn(fail=True), executor, max_batch_size=8, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_cancelled_callers_are_left_out_of_the_batch(executor):
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher("test", batch_fn, executor, max_batch_size=8, max_wait_ms=50)
+
+    async def run():
+        kept = asyncio.ensure_future(batcher.submit(1))
+        gone = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0.01)
+        gone.cancel()
+        return await kept
+
+    result, timing = asyncio.run(run())
+
+    assert result == 10
+    assert batch_fn.batches == [[1]]
+    assert timing["batch_size"] == 1
+
+def test_too_many_waiting_items_are_rejected():
+    executor = InferenceExecutor("test", max_workers=1, max_queue_size=0, timeout=5)
+    batcher = MicroBatcher("test", RecordingBatchFn(), executor, max_batch_size=2, max_wait_ms=1000)
+
+    async def run():
+        batcher._ensure_collector()
+        # Fill the queue before the collector gets a chance to drain it
+        for i in range(batcher.max_pending):
+            batcher._queue.put_nowait((i, asyncio.get_running_loop().create_future()))
+        with pytest.raises(InferenceQueueFullError):
+            await batcher.submit(99)
+        batcher._collector.cancel()
+
+    try:
+        asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+def test_batch_size_one_skips_the_queue(executor):
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher("test", batch_fn, executor, max_batch_size=1, max_wait_ms=1000)
+
+    result, timing = asyncio.run(batcher.submit(7))
+
+    assert result == 70
+    assert timing["batch_size"] == 1
+    assert batcher._queue is None
+
+def test_close_waits_for_running_batches_and_cancels_waiting_items(executor):
+    release = threading.Event()
+
+    def slow_batch_fn(items):
+        release.wait(5)
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher("test", slow_batch_fn, executor, max_batch_size=2, max_wait_ms=5000)
+
+    async def run():
+        running = [asyncio.ensure_future(batcher.submit(i)) for i in range(2)]
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0.05)
+        in_flight = len(batcher._inflight)
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        await batcher.close()
+        results = await asyncio.gather(*running)
+        return in_flight, results, waiting, batcher._inflight
+
+    in_flight, results, waiting, remaining = asyncio.run(run())
+
+    assert in_flight == 1
+    assert [result for result, _ in results] == [0, 10]
+    assert waiting.cancelled()
+    assert remaining == set()
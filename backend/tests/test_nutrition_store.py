@@ -0,0 +1,64 @@
+"""
+Nutrition lookup: deterministic tie-breaks and a bounded fuzzy pass
+"""
+import json
+
+import pytest
+
+from models.nutrition_store import NutritionStore
+
+FACTS = {"kalori": 1, "karbohidrat": 1, "protein": 1, "lemak": 1}
+
+def make_store(tmp_path, foods, fuzzy_max_candidates=2000) -> NutritionStore:
+    dataset = [{"name": name, "aliases": aliases, "nutrition": FACTS} for name, aliases in foods]
+    path = tmp_path / "nutrition.json"
+    path.write_text(json.dumps(dataset), encoding="utf-8")
+    return NutritionStore(str(path), fuzzy_cutoff=0.8, fuzzy_max_candidates=fuzzy_max_candidates)
+
+@pytest.mark.parametrize("foods", [
+    [("apel", ["apple"]), ("pie", [])],
+    [("pie", []), ("apel", ["apple"])]
+])
+def test_token_tie_does_not_depend_on_order(tmp_path, foods):
+    result = make_store(tmp_path, foods).lookup("Apple Pie")
+
+    # Both names cover one word; the longer name wins regardless of dataset order
+    assert result["matched_food"] == "apel"
+    assert result["match_type"] == "token"
+
+def test_more_words_beat_longer_name(tmp_path):
+    store = make_store(tmp_path, [("nasi goreng", []), ("spesialisasi", []), ("nasi", [])])
+
+    assert store.lookup("Nasi Goreng Spesialisasi")["matched_food"] == "nasi goreng"
+
+@pytest.mark.parametrize("foods", [
+    [("daging", []), ("jagung", [])],
+    [("jagung", []), ("daging", [])]
+])
+def test_fuzzy_tie_breaks_by_name(tmp_path, foods):
+    result = make_store(tmp_path, foods).lookup("jaging")
+
+    assert result["matched_food"] == "daging"
+    assert result["match_type"] == "fuzzy"
+
+def test_fuzzy_prefers_higher_ratio(tmp_path):
+    store = make_store(tmp_path, [("kentang", []), ("kentung", []), ("kenta", [])])
+
+    assert store.lookup("kentangg")["matched_food"] == "kentang"
+
+def test_fuzzy_pass_is_bounded(tmp_path):
+    # Names sharing the query's first letter are compared first; the cap leaves out the rest
+    foods = [(f"s{i:04d}xx", []) for i in range(50)] + [("tempe", [])]
+    bounded = make_store(tmp_path, foods, fuzzy_max_candidates=10)
+    unbounded = make_store(tmp_path, foods)
+
+    assert bounded.lookup("sempe")["found"] is False
+    assert unbounded.lookup("sempe")["matched_food"] == "tempe"
+
+def test_fuzzy_skips_names_of_unreachable_length(tmp_path):
+    store = make_store(tmp_path, [("tahu", []), ("tahu goreng tepung renyah", [])])
+
+    result = store.lookup("tahuu")
+
+    assert result["matched_food"] == "tahu"
+    assert store._index.keys_by_length[4] == ["tahu"]
@@ -0,0 +1,90 @@
+"""
+Replica pool: calls that get no reply time out and the hung replica is replaced,
+with threads on the other end of real pipes standing in for replica processes
+"""
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from models.inference_executor import InferenceTimeoutError
+from models.replica_pool import ReplicaPool
+
+class FakeProcess:
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+
+    terminate = kill
+
+    def join(self, timeout=None):
+        pass
+
+    def is_alive(self):
+        return not self.killed
+
+def fake_replica(conn, pid: int, hang: bool):
+    """Answers ("ok", args) to every call, or never answers once hang is set"""
+    conn.send(("ready", pid))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        if not hang:
+            conn.send(("ok", message[1]))
+
+class FakeReplicaPool(ReplicaPool):
+    def __init__(self, hang_first: bool):
+        super().__init__(replicas=1, threads_per_replica=1, startup_timeout=5, call_timeout=0.2)
+        self.hang_first = hang_first
+        self.processes = []
+
+    def _spawn(self, index):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = FakeProcess(pid=1000 + len(self.processes))
+        hang = self.hang_first and not self.processes
+        self.processes.append(process)
+        threading.Thread(target=fake_replica, args=(child_conn, process.pid, hang), daemon=True).start()
+        return process, parent_conn
+
+    def start(self):
+        for index in range(self.size):
+            self._attach(index, *self._spawn(index))
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_answered_calls_return_the_result():
+    pool = FakeReplicaPool(hang_first=False)
+    pool.start()
+
+    assert pool.call("predict", "image") == ("image",)
+    assert pool.get_stats()["workers"][0]["completed"] == 1
+    pool.shutdown()
+
+def test_hung_replica_times_out_and_is_replaced():
+    pool = FakeReplicaPool(hang_first=True)
+    pool.start()
+    hung = pool.processes[0]
+
+    with pytest.raises(InferenceTimeoutError):
+        pool.call("predict", "image")
+
+    assert hung.killed
+    assert wait_for(lambda: pool.is_available())
+    stats = pool.get_stats()
+    assert stats["recycled"] == 1
+    assert stats["workers"][0]["pid"] == pool.processes[1].pid
+    # The replacement serves the slot the hung replica had
+    assert pool.call("predict", "image") == ("image",)
+    pool.shutdown()